@@ -1,12 +1,15 @@
-import sys, os, logging, traceback
+import sys, os, logging, traceback, argparse
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from history import XmlHistory
 from favorite import FavoriteDockWidget, AddToFavoriteDialog, FavoritesEditor
-from session import NetconfSession, CallHomeDialog
+from session import NetconfSession, CallHomeDialog, connect_limiter
+from fleet import FleetDialog
 from device_manage import *
 from ncclient.xml_ import *
+from ncclient.transport import MetricsExporter
+from ncclient import tracing
 from about import About
 from data import *
 from utils import SingletonLogger
@@ -40,6 +43,7 @@ class MainWindow(QMainWindow):
    def __init__(self, appdata: AppData):
       super().__init__()
       self.appdata = appdata
+      connect_limiter.configure(appdata.ui_connect_parallel, appdata.ui_connect_retries)
       self.versionUpdate = VersionUpdate(self)
       self.versionUpdate.autoCheck()
       self.SessionOperCtlGroup = [] # 会话操作控制组
@@ -801,12 +805,13 @@ class MainWindow(QMainWindow):
       log.info("seq overflow. use max")
       return tmpn
 
-   def _createSession(self, cfg: dict):
+   def _createSession(self, cfg: dict, connect=True, share=None):
+      "打开会话标签页，connect为False时不连接，share为已连接的会话时与其共用SSH连接，返回会话"
       type = cfg.get('type', 0)
       if type == SessionOption.SessionType.NETCONF_CALLHOME:
          dlg = CallHomeDialog(cfg, self)
          if dlg.exec() != QDialog.DialogCode.Accepted:
-            return
+            return None
       log.debug("Open session Options: %s", cfg)
       nct = NetconfSession(cfg, self)
       nct.signals.connectionStatusChange.connect(self.updateUiInformation)
@@ -821,13 +826,27 @@ class MainWindow(QMainWindow):
       self._session.setTabToolTip(self._session.currentIndex(), displayName)
       if type == SessionOption.SessionType.NETCONF_CALLHOME:
          nct.setManager(dlg.worker.mgr, dlg.worker.raddr)
-      nct.connect()
+      if connect:
+         nct.connect(share=share)
       self._addRecentlySession(cfg)
+      return nct
 
    def openDevice(self):
       diag = DeviceManage(app_data.sessions, self)
       if diag.exec() == QDialog.DialogCode.Accepted:
-         self._createSession(diag.options)
+         options = diag.selectedOptions
+         if len(options) == 1:
+            self._createSession(options[0])
+         else:
+            sessions = [self._createSession(cfg, connect=False) for cfg in options]
+            self.connectSessions([w for w in sessions if w is not None])
+
+   def connectSessions(self, sessions: list, is_reconnect=False):
+      """同时连接多个会话，同时建立的连接数和连接失败后的重试次数见ui-config的connect_parallel和connect_retries，
+      进度和失败原因记录在各会话的日志中"""
+      connect_limiter.configure(self.appdata.ui_connect_parallel, self.appdata.ui_connect_retries)
+      for w in sessions:
+         w.connect(is_reconnect, connect_limiter.retries, quiet=True)
 
    def openDeviceQuick(self):
       option = self.quickSessionOption.copy()
@@ -878,17 +897,22 @@ class MainWindow(QMainWindow):
 
    def onReconnectDeviceAll(self):
       sessionTab = self._session
+      sessions = []
       for idx in range(sessionTab.count()):
          w = sessionTab.widget(idx)
-         if w and not w.connected:
-            w.connect()
+         # Call Home会话无法重连
+         if w and not w.connected and w.options.get('type', 0) != SessionOption.SessionType.NETCONF_CALLHOME:
+            sessions.append(w)
+      self.connectSessions(sessions, is_reconnect=True)
 
    def onCloneSession(self, index=None):
       if self.sessionOpIndex != None:
          w = self._session.widget(self.sessionOpIndex)
       else:
          w = self._session.currentWidget()
-      self._createSession(w.options)
+      # 在已有的SSH连接上打开新的NETCONF通道，无需重新握手和认证
+      share = w if w.connected and w.options.get('type', 0) != SessionOption.SessionType.NETCONF_CALLHOME else None
+      self._createSession(w.options, share=share)
 
    def _closeSession(self, sw:NetconfSession, no_confirm:bool = False):
       if sw is None:
@@ -980,18 +1004,25 @@ class MainWindow(QMainWindow):
    def onExecuteXmlRequset(self, cxmls: list, to_all: False):
       if not len(cxmls) or self._session.count() == 0:
          return
-      sessions=[]
       if to_all:
+         sessions=[]
          for id in range(self._session.count()):
             sw = self._session.widget(id)
             if sw.connected:
                sessions.append(self._session.widget(id))
+         if not sessions:
+            return
+         # 同时下发到各会话，结果显示在执行窗口中
+         dlg = FleetDialog(sessions, cxmls, self.appdata, self)
+         dlg.show()
       else:
-         sessions.append(self._session.currentWidget())
+         self._executeXmls(self._session.currentWidget(), list(cxmls))
 
-      for cxml in cxmls:
-         for sw in sessions:
-            sw.setCommandXML(cxml, True)
+   def _executeXmls(self, sw, cxmls: list):
+      "在会话sw上依次执行cxmls中的请求，收到上一个请求的应答后再发送下一个"
+      if cxmls:
+         cxml = cxmls.pop(0)
+         sw.setCommandXML(cxml, True, lambda resp: self._executeXmls(sw, cxmls))
 
    def onAddFavorite(self, xml):
       addFavoriteDlg = AddToFavoriteDialog(xml, self)
@@ -1164,7 +1195,15 @@ if __name__ == "__main__":
       QCoreApplication.setAttribute(Qt.AA_DontShowIconsInMenus, True)
    #QGuiApplication.setHighDpiScaleFactorRoundingPolicy(Qt.HighDpiScaleFactorRoundingPolicy.PassThrough)
 
-   app = QApplication(sys.argv)
+   argparser = argparse.ArgumentParser(add_help=False)
+   argparser.add_argument('--metrics-port', type=int, default=None,
+                          help='export the metrics of the sessions at http://<metrics-address>:<port>/metrics')
+   argparser.add_argument('--metrics-address', default='127.0.0.1')
+   argparser.add_argument('--trace', metavar='FILE', default=None,
+                          help='write the timing of each message stage to FILE as Chrome trace events')
+   args, qt_args = argparser.parse_known_args()
+
+   app = QApplication(sys.argv[:1] + qt_args)
    dpi = app.primaryScreen().logicalDotsPerInch()
    log.info("=================================================================================================")
    log.info("Run in:%s, current exe dir:%s, Home:%s"%(sys.platform, app.applicationDirPath(), QDir.homePath()))
@@ -1211,8 +1250,24 @@ if __name__ == "__main__":
       window.restoreDockWidget(widget)
    qsetting.endGroup()
 
+   # 供监控系统抓取各会话的统计数据
+   exporter = None
+   if args.metrics_port is not None:
+      try:
+         exporter = MetricsExporter(args.metrics_address, args.metrics_port).start()
+      except OSError as ex:
+         log.error("Start metrics exporter on %s:%d failed: %s", args.metrics_address, args.metrics_port, str(ex))
+
+   # 记录各阶段耗时，用chrome://tracing或Perfetto查看
+   if args.trace:
+      tracing.set_tracer(tracing.ChromeTracer(args.trace))
+
    window.show()
    ret = app.exec()
+   if exporter:
+      exporter.stop()
+   if args.trace:
+      tracing.set_tracer(None).close()
 
    # 保存布局
    qsetting.beginGroup('layout')
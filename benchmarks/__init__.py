@@ -0,0 +1,17 @@
+"""Micro benchmarks for the NETCONF receive path.
+
+Every module in this package can be run on its own, e.g.::
+
+    python -m benchmarks.framing
+
+and :mod:`benchmarks.suite` runs the whole set of hot paths, writing the
+results as JSON to compare revisions::
+
+    python -m benchmarks --json results.json
+
+No device is needed, the benchmarks feed synthetic data straight into the
+code under test. Where a whole session is wanted, :mod:`benchmarks.server`
+stands in for the device::
+
+    python -m benchmarks.server --ssh 8830
+"""
@@ -0,0 +1,181 @@
+"""Throughput of the NETCONF framing decoders in
+:class:`ncclient.transport.parser.DefaultXMLParser`.
+
+A synthetic rpc-reply is framed either as a base:1.0 stream ended by
+``]]>]]>`` (RFC 4742) or as a base:1.1 chunked stream (RFC 6242) and cut at
+random boundaries, like reads from a real channel would be, then fed to the
+parser one read at a time. Before timing, :func:`check_streamed10` checks
+that a reply streamed into a sink leaves nothing behind for the next one.
+"""
+
+import argparse
+import random
+import time
+from io import BytesIO
+
+from lxml import etree
+
+from ncclient.transport.metrics import SessionMetrics
+from ncclient.transport.parser import DefaultXMLParser
+from ncclient.transport.session import NetconfBase
+from ncclient.transport.stream import TreeSink
+
+REPLY_HEAD = '<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="101"><data>'
+REPLY_TAIL = '</data></rpc-reply>'
+ROW = '<interface><name>GigabitEthernet0/0/%d</name><mtu>1500</mtu></interface>'
+
+
+class BenchSession(object):
+    """Just enough of :class:`~ncclient.transport.Session` for the parser."""
+
+    id = None
+
+    def __init__(self, base):
+        self._base = base
+        self._buffer = BytesIO()
+        self.parser = None
+        self.messages = 0
+        self.received = 0
+        self._reply_sinks = {}
+        self._spill_threshold = None
+        self._metrics = SessionMetrics(self)
+
+    def _dispatch_message(self, raw):
+        self.messages += 1
+        self.received += len(raw)
+
+
+class StreamSession(BenchSession):
+    """A :class:`BenchSession` that also takes replies streamed into a sink
+    or spilled to a file, and records the message-id of everything dispatched."""
+
+    def __init__(self, base, spill_threshold=None):
+        super(StreamSession, self).__init__(base)
+        self._spill_threshold = spill_threshold
+        self.dispatched = []
+
+    def _pop_reply_sink(self, msg_id):
+        return self._reply_sinks.pop(msg_id, None)
+
+    def _dispatch_message(self, raw):
+        super(StreamSession, self)._dispatch_message(raw)
+        self.dispatched.append(('message', raw))
+
+    def _dispatch_stream(self, root, sink):
+        self.dispatched.append(('stream', root[1].get('message-id')))
+
+    def _dispatch_spilled(self, message):
+        try:
+            msg_id = message.parse_root()[1].get('message-id')
+        except etree.XMLSyntaxError:
+            msg_id = None
+        self.dispatched.append(('spilled', msg_id))
+
+
+def check_streamed10():
+    """A base:1.0 reply streamed into a sink, whose head arrives in two reads
+    and is spilled before the sink claims it, must leave nothing behind for
+    the next message."""
+    first = make_reply(200)
+    second = first.replace(b'message-id="101"', b'message-id="102"')
+    session = StreamSession(NetconfBase.BASE_10, spill_threshold=20)
+    session._reply_sinks['101'] = TreeSink()
+    parser = session.parser = DefaultXMLParser(session)
+    for data in (first[:40], frame10(first[40:]), frame10(second)):
+        parser.parse(data)
+    assert session.dispatched == [('stream', '101'), ('spilled', '102')], session.dispatched
+
+
+def make_reply(size):
+    "Build an rpc-reply of roughly *size* bytes."
+    rows = []
+    total = len(REPLY_HEAD) + len(REPLY_TAIL)
+    idx = 0
+    while total < size:
+        row = ROW % idx
+        rows.append(row)
+        total += len(row)
+        idx += 1
+    return (REPLY_HEAD + ''.join(rows) + REPLY_TAIL).encode('UTF-8')
+
+
+def frame10(message):
+    "Frame *message* as a base:1.0 stream."
+    return message + b']]>]]>'
+
+
+def frame11(message, chunk_size):
+    "Frame *message* as a base:1.1 stream of chunks of at most *chunk_size* bytes."
+    out = []
+    for pos in range(0, len(message), chunk_size):
+        chunk = message[pos:pos + chunk_size]
+        out.append(b'\n#%d\n' % len(chunk))
+        out.append(chunk)
+    out.append(b'\n##\n')
+    return b''.join(out)
+
+
+def split_reads(stream, max_read, seed=0):
+    "Cut *stream* at random boundaries into reads of 1..*max_read* bytes."
+    rng = random.Random(seed)
+    reads = []
+    pos = 0
+    while pos < len(stream):
+        step = rng.randint(1, max_read)
+        reads.append(stream[pos:pos + step])
+        pos += step
+    return reads
+
+
+def _bench(base, stream, message, max_read, repeat):
+    reads = split_reads(stream, max_read)
+    best = None
+    for _ in range(repeat):
+        session = BenchSession(base)
+        parser = session.parser = DefaultXMLParser(session)
+        start = time.perf_counter()
+        for data in reads:
+            parser.parse(data)
+        elapsed = time.perf_counter() - start
+        assert session.messages == 1 and session.received == len(message)
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        'size': len(message),
+        'reads': len(reads),
+        'seconds': best,
+        'mb_per_s': len(message) / best / 1e6,
+    }
+
+
+def bench_parse10(size, max_read, repeat=3):
+    "Return the best throughput in MB/s of decoding one *size* bytes base:1.0 reply."
+    message = make_reply(size)
+    return _bench(NetconfBase.BASE_10, frame10(message), message, max_read, repeat)
+
+
+def bench_parse11(size, chunk_size, max_read, repeat=3):
+    "Return the best throughput in MB/s of decoding one *size* bytes base:1.1 reply."
+    message = make_reply(size)
+    r = _bench(NetconfBase.BASE_11, frame11(message, chunk_size), message, max_read, repeat)
+    r['chunk_size'] = chunk_size
+    return r
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--sizes', type=int, nargs='+', default=[1 << 10, 1 << 20, 16 << 20],
+                    help='reply sizes in bytes')
+    ap.add_argument('--chunk', type=int, default=4096, help='chunk size of the framed stream')
+    ap.add_argument('--max-read', type=int, default=16384, help='largest single read in bytes')
+    args = ap.parse_args()
+    check_streamed10()
+    print('%5s %12s %8s %10s %10s' % ('base', 'size', 'reads', 'seconds', 'MB/s'))
+    for size in args.sizes:
+        for base, r in (('1.0', bench_parse10(size, args.max_read)),
+                        ('1.1', bench_parse11(size, args.chunk, args.max_read))):
+            print('%5s %12d %8d %10.4f %10.1f' % (base, r['size'], r['reads'],
+                                                  r['seconds'], r['mb_per_s']))
+
+
+if __name__ == '__main__':
+    main()
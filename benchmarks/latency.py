@@ -0,0 +1,90 @@
+"""Request-to-wire latency of :class:`ncclient.transport.Session`.
+
+A session is run over a local socket pair, without a device on the other
+end. Each request is queued with :meth:`~ncclient.transport.Session.send`
+after an idle pause, and the time until its last byte can be read from the
+peer socket is recorded.
+"""
+
+import argparse
+import random
+import socket
+import threading
+import time
+
+from ncclient.devices.default import DefaultDeviceHandler
+from ncclient.transport.tls import TLSSession
+
+REQUEST = ('<rpc xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="%d">'
+           '<get-config><source><running/></source></get-config></rpc>')
+
+
+def open_session():
+    "Return a started base:1.0 session and the socket at the other end."
+    near, far = socket.socketpair()
+    session = TLSSession(DefaultDeviceHandler())
+    session._socket = near
+    session._connected = True
+    session.start()
+    return session, far
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def bench_send_latency(count, max_idle, seed=0):
+    "Return p50/p99/max of the request-to-wire time in milliseconds."
+    session, far = open_session()
+    arrived = threading.Event()
+    stamps = []
+
+    def reader():
+        buf = b''
+        while True:
+            data = far.recv(65536)
+            if not data:
+                return
+            buf += data
+            while b']]>]]>' in buf:
+                _, _, buf = buf.partition(b']]>]]>')
+                stamps.append(time.perf_counter())
+                arrived.set()
+
+    threading.Thread(target=reader, daemon=True).start()
+    rng = random.Random(seed)
+    latencies = []
+    try:
+        for idx in range(count):
+            time.sleep(rng.uniform(0, max_idle))
+            arrived.clear()
+            start = time.perf_counter()
+            session.send(REQUEST % idx)
+            if not arrived.wait(5):
+                raise RuntimeError('request %d did not reach the peer' % idx)
+            latencies.append((stamps[-1] - start) * 1000)
+    finally:
+        session.close()
+        far.close()
+    return {
+        'count': count,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': max(latencies),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--count', type=int, default=200, help='number of requests')
+    ap.add_argument('--max-idle', type=float, default=0.02,
+                    help='longest pause before a request in seconds')
+    args = ap.parse_args()
+    r = bench_send_latency(args.count, args.max_idle)
+    print('%8s %10s %10s %10s' % ('requests', 'p50 ms', 'p99 ms', 'max ms'))
+    print('%8d %10.3f %10.3f %10.3f' % (r['count'], r['p50_ms'], r['p99_ms'], r['max_ms']))
+
+
+if __name__ == '__main__':
+    main()
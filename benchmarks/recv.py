@@ -0,0 +1,131 @@
+"""Cost of reading replies from a socket into the framing parser.
+
+A framed base:1.1 reply is written to one end of a local socket pair by a
+thread, and read at the other end either with ``recv()``, which creates a
+new bytes object for every read, or with ``recv_into()`` a
+:class:`ncclient.transport.session.ReceiveBuffer` that is reused, whose
+memoryview is handed to the parser as is. Both readers feed a
+:class:`~ncclient.transport.parser.DefaultXMLParser`.
+
+Besides the throughput, the bytes allocated by the reads themselves are
+counted, and the peak of traced memory is measured in a second, slower pass
+with :mod:`tracemalloc`.
+"""
+
+import argparse
+import socket
+import threading
+import time
+import tracemalloc
+
+from benchmarks.framing import BenchSession, make_reply, frame11
+from ncclient.transport.parser import DefaultXMLParser
+from ncclient.transport.session import NetconfBase, ReceiveBuffer
+
+READ_SIZE = 4 * 1024 * 1024
+"What the transports ask for per read, ``BUF_SIZE`` of the SSH transport."
+
+
+def _writer(sock, stream, count):
+    for _ in range(count):
+        sock.sendall(stream)
+    sock.shutdown(socket.SHUT_WR)
+
+
+def _read_loop(sock, parser, read):
+    reads = allocated = 0
+    while True:
+        data, new = read(sock)
+        allocated += new
+        if not data:
+            break
+        reads += 1
+        parser.parse(data)
+    return reads, allocated
+
+
+def read_recv(sock):
+    data = sock.recv(READ_SIZE)
+    return data, len(data)
+
+
+def make_read_recv_into():
+    buf = ReceiveBuffer()
+    def read(sock):
+        size = len(buf)
+        data = buf.read(sock.recv_into)
+        # a new buffer is only allocated when the previous read filled it
+        return data, len(buf) if len(buf) != size else 0
+    read.initial = len(buf)
+    return read
+
+
+def _run(message, count, method, trace=False):
+    stream = frame11(message, 64 * 1024)
+    near, far = socket.socketpair()
+    near.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    session = BenchSession(NetconfBase.BASE_11)
+    parser = session.parser = DefaultXMLParser(session)
+    read = read_recv if method == 'recv' else make_read_recv_into()
+    writer = threading.Thread(target=_writer, args=(far, stream, count), daemon=True)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    writer.start()
+    reads, allocated = _read_loop(near, parser, read)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    writer.join()
+    near.close()
+    far.close()
+    assert session.messages == count and session.received == count * len(message)
+    return {
+        'method': method,
+        'size': len(message),
+        'count': count,
+        'reads': reads,
+        'seconds': elapsed,
+        'mb_per_s': count * len(message) / elapsed / 1e6,
+        'alloc_bytes': allocated + getattr(read, 'initial', 0),
+        'peak_bytes': peak,
+    }
+
+
+def bench_recv(size, method, total=64 * 1024 * 1024, repeat=3):
+    """Return the best run of reading replies of *size* bytes with *method*
+    (``'recv'`` or ``'recv_into'``), sending about *total* bytes but at least
+    one reply, plus the traced peak memory of one more run."""
+    message = make_reply(size)
+    count = max(1, total // len(message))
+    best = None
+    for _ in range(repeat):
+        r = _run(message, count, method)
+        if best is None or r['seconds'] < best['seconds']:
+            best = r
+    best['peak_bytes'] = _run(message, count, method, trace=True)['peak_bytes']
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--sizes', type=int, nargs='+', default=[1 << 10, 1 << 20, 100 << 20],
+                    help='reply sizes in bytes')
+    ap.add_argument('--total', type=int, default=64 << 20,
+                    help='bytes to send per run, in as many replies as it takes')
+    ap.add_argument('--repeat', type=int, default=3, help='runs per measurement, the best counts')
+    args = ap.parse_args()
+    print('%10s %12s %6s %8s %9s %9s %12s %12s' % (
+        'method', 'size', 'count', 'reads', 'seconds', 'MB/s', 'read alloc', 'peak'))
+    for size in args.sizes:
+        for method in ('recv', 'recv_into'):
+            r = bench_recv(size, method, args.total, args.repeat)
+            print('%10s %12d %6d %8d %9.4f %9.1f %12d %12d' % (
+                r['method'], r['size'], r['count'], r['reads'], r['seconds'],
+                r['mb_per_s'], r['alloc_bytes'], r['peak_bytes']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,949 @@
+"""Local NETCONF server that stands in for a device.
+
+Serves NETCONF over SSH (RFC 6242, with paramiko), TLS (RFC 7589) or plain
+TCP, so that :class:`ncclient.transport.SSHSession`,
+:class:`~ncclient.transport.TLSSession` and the GUI can be exercised without
+a device::
+
+    python -m benchmarks.server --ssh 8830 --user admin --password admin
+    python -m benchmarks.server --tls 6513 --reply-size 10000000 --chunk-size 65536
+
+or from a benchmark or a test::
+
+    with SSHServer(port=0, reply_size=1 << 20) as server:
+        m = manager.connect(host='127.0.0.1', port=server.port, username='u',
+                            password='p', hostkey_verify=False)
+
+Both base:1.0 and base:1.1 framing are supported. *get*, *get-config*,
+*edit-config*, *copy-config*, *delete-config*, *lock*, *unlock*,
+*validate*, *commit*, *discard-changes*, *cancel-commit*, *get-schema*,
+*close-session*, *kill-session* and *create-subscription* are answered
+from an in-memory running and candidate datastore, shared by all the
+connections to a server. Subtree filters are applied, with the usual
+containment, selection and content match nodes, but without attribute
+matching.
+
+What a benchmark needs can be injected: a delay before each reply (per
+operation too), the size of base:1.1 chunks, padding that brings *get* and
+*get-config* replies up to a given size, and notification streams with a
+rate, a count and a size of their own.
+"""
+
+import argparse
+import copy
+import itertools
+import logging
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import time
+from xml.sax.saxutils import escape, quoteattr
+
+import paramiko
+from lxml import etree
+
+logger = logging.getLogger('benchmarks.server')
+
+BASE_NS = 'urn:ietf:params:xml:ns:netconf:base:1.0'
+NOTIFICATION_NS = 'urn:ietf:params:xml:ns:netconf:notification:1.0'
+MONITORING_NS = 'urn:ietf:params:xml:ns:yang:ietf-netconf-monitoring'
+SIM_NS = 'urn:example:netconf-sim'
+
+BASE_10 = 'urn:ietf:params:netconf:base:1.0'
+BASE_11 = 'urn:ietf:params:netconf:base:1.1'
+
+CAPABILITIES = [
+    BASE_10,
+    'urn:ietf:params:netconf:capability:writable-running:1.0',
+    'urn:ietf:params:netconf:capability:candidate:1.0',
+    'urn:ietf:params:netconf:capability:confirmed-commit:1.1',
+    'urn:ietf:params:netconf:capability:validate:1.1',
+    'urn:ietf:params:netconf:capability:notification:1.0',
+    'urn:ietf:params:netconf:capability:interleave:1.0',
+    MONITORING_NS + '?module=ietf-netconf-monitoring',
+    SIM_NS + '?module=netconf-sim&revision=2024-01-01',
+]
+
+MSG_DELIM = b']]>]]>'
+END_DELIM = b'\n##\n'
+
+DATASTORE = '''\
+<config xmlns="%s">
+  <system xmlns="%s">
+    <hostname>netconf-sim</hostname>
+    <contact>noc@example.com</contact>
+  </system>
+  <interfaces xmlns="%s">
+    <interface><name>eth0</name><mtu>1500</mtu><enabled>true</enabled></interface>
+    <interface><name>eth1</name><mtu>9000</mtu><enabled>false</enabled></interface>
+  </interfaces>
+</config>''' % (BASE_NS, SIM_NS, SIM_NS)
+"Initial content of the datastores, unless the server is given one."
+
+SCHEMA = '''\
+module netconf-sim {
+  namespace "%s";
+  prefix sim;
+  revision 2024-01-01;
+  container system { leaf hostname { type string; } leaf contact { type string; } }
+  container interfaces {
+    list interface {
+      key name;
+      leaf name { type string; } leaf mtu { type uint32; } leaf enabled { type boolean; }
+    }
+  }
+}
+''' % SIM_NS
+
+PADDING_ROW = '<row><index>%d</index><name>GigabitEthernet0/0/%d</name><mtu>1500</mtu></row>'
+
+
+def _q(tag, ns=BASE_NS):
+    return '{%s}%s' % (ns, tag)
+
+
+def _localname(ele):
+    return etree.QName(ele).localname
+
+
+class RPCError(Exception):
+
+    "Sent back as an *rpc-error*."
+
+    def __init__(self, tag, message=None, type='application', info=None):
+        Exception.__init__(self, message or tag)
+        self.tag = tag
+        self.message = message
+        self.type = type
+        self.info = info or {}
+
+    def to_xml(self):
+        ele = etree.Element(_q('rpc-error'))
+        etree.SubElement(ele, _q('error-type')).text = self.type
+        etree.SubElement(ele, _q('error-tag')).text = self.tag
+        etree.SubElement(ele, _q('error-severity')).text = 'error'
+        if self.message:
+            etree.SubElement(ele, _q('error-message')).text = self.message
+        if self.info:
+            info = etree.SubElement(ele, _q('error-info'))
+            for k, v in self.info.items():
+                etree.SubElement(info, _q(k)).text = str(v)
+        return etree.tostring(ele, encoding='unicode')
+
+
+def subtree_filter(nodes, filter_nodes):
+    """Returns copies of the elements *nodes* selected by the subtree filter
+    whose top level elements are *filter_nodes* (RFC 6241, 6.2)."""
+    selected = []
+    for node in nodes:
+        for f in filter_nodes:
+            if f.tag == node.tag:
+                result = _select(node, f)
+                if result is not None:
+                    selected.append(result)
+                break
+    return selected
+
+
+def _select(node, f):
+    "A copy of *node* as far as it is selected by the filter node *f*, `None` if it is not."
+    children = [c for c in f if isinstance(c.tag, str)]
+    if not children:
+        text = (f.text or '').strip()
+        if text and (node.text or '').strip() != text:
+            # content match node that does not match
+            return None
+        return copy.deepcopy(node)
+    matches = [c for c in children if len(c) == 0 and (c.text or '').strip()]
+    for m in matches:
+        if not any(n.tag == m.tag and (n.text or '').strip() == m.text.strip() for n in node):
+            return None
+    others = [c for c in children if c not in matches]
+    if not others:
+        # only content match nodes, the whole node is selected
+        return copy.deepcopy(node)
+    result = etree.Element(node.tag, node.attrib, nsmap=node.nsmap)
+    selected = False
+    for child in node:
+        if any(m.tag == child.tag for m in matches):
+            result.append(copy.deepcopy(child))
+            continue
+        for o in others:
+            if o.tag == child.tag:
+                sub = _select(child, o)
+                if sub is not None:
+                    result.append(sub)
+                    selected = True
+                break
+    return result if selected else None
+
+
+KEYS = ('name', 'id', 'index', 'key')
+"Leaves that identify a list entry, there being no schema to tell lists from containers."
+
+
+def _key(ele):
+    "The tag and text of the leaf of a list entry that identifies it, `None` for a container."
+    for child in ele:
+        if isinstance(child.tag, str) and len(child) == 0 and _localname(child) in KEYS:
+            return child.tag, (child.text or '').strip()
+    return None
+
+
+def _find_match(parent, ele):
+    key = _key(ele) if len(ele) else None
+    for child in parent:
+        if child.tag != ele.tag:
+            continue
+        if key is None or _key(child) == key:
+            return child
+    return None
+
+
+def merge(target, config, default_operation='merge'):
+    """Apply the children of the *config* element of an *edit-config* to the
+    *target* datastore element, honouring the ``operation`` attributes."""
+    for ele in config:
+        if not isinstance(ele.tag, str):
+            continue
+        operation = ele.attrib.pop(_q('operation'), default_operation)
+        match = _find_match(target, ele)
+        if operation in ('delete', 'remove'):
+            if match is not None:
+                target.remove(match)
+            elif operation == 'delete':
+                raise RPCError('data-missing', 'No %s to delete' % _localname(ele))
+        elif operation == 'create' and match is not None:
+            raise RPCError('data-exists', '%s already exists' % _localname(ele))
+        elif operation in ('replace', 'create') or match is None:
+            new = copy.deepcopy(ele)
+            for e in new.iter():
+                e.attrib.pop(_q('operation'), None)
+            if match is not None:
+                target.replace(match, new)
+            elif operation != 'none':
+                target.append(new)
+        elif len(ele) == 0:
+            match.text = ele.text
+        else:
+            merge(match, ele, operation)
+
+
+class Device(object):
+
+    """What the connections to a server share: the datastores, their locks
+    and the behaviour to simulate.
+
+    *datastore*: XML of a ``<config>`` element whose children make up the
+    initial running and candidate datastores
+
+    *base11*: whether base:1.1 is advertised
+
+    *delay*: seconds to wait before each reply, *delays* overrides it by
+    operation name
+
+    *chunk_size*: largest chunk sent with base:1.1 framing
+
+    *reply_size*: pad the data of *get* and *get-config* replies with rows
+    until they are about this many bytes
+
+    *streams*: dict of the notification streams by name, each a dict with the
+    *rate* (notifications per second), *count* (in all, `None` for no limit)
+    and *size* (bytes of padding) of its notifications
+
+    *schemas*: dict of the text of the schemas served by *get-schema*, by
+    identifier
+    """
+
+    def __init__(self, datastore=DATASTORE, base11=True, delay=0, delays=None, chunk_size=65536,
+                 reply_size=None, streams=None, schemas=None):
+        config = etree.fromstring(datastore, etree.XMLParser(remove_blank_text=True))
+        self.running = config
+        self.candidate = copy.deepcopy(config)
+        self.base11 = base11
+        self.delay = delay
+        self.delays = delays or {}
+        self.chunk_size = chunk_size
+        self.reply_size = reply_size
+        self.streams = streams if streams is not None else {'NETCONF': {'rate': 10, 'count': None, 'size': 0}}
+        self.schemas = schemas if schemas is not None else {'netconf-sim': SCHEMA}
+        self.lock = threading.RLock() # guards the datastores and the locks
+        self.locks = {} # datastore -> session-id
+        self.connections = {} # session-id -> Connection
+        self._ids = itertools.count(1)
+
+    def capabilities(self):
+        return CAPABILITIES + ([BASE_11] if self.base11 else [])
+
+    def add(self, connection):
+        with self.lock:
+            connection.session_id = next(self._ids)
+            self.connections[connection.session_id] = connection
+
+    def remove(self, connection):
+        with self.lock:
+            self.connections.pop(connection.session_id, None)
+            for name, owner in list(self.locks.items()):
+                if owner == connection.session_id:
+                    del self.locks[name]
+
+    def datastore(self, name):
+        if name == 'running':
+            return self.running
+        if name == 'candidate':
+            return self.candidate
+        raise RPCError('invalid-value', 'Unknown datastore %s' % name)
+
+    def check_lock(self, name, session_id):
+        owner = self.locks.get(name)
+        if owner is not None and owner != session_id:
+            raise RPCError('in-use', 'The %s datastore is locked' % name,
+                           info={'session-id': owner})
+
+    def padding(self):
+        "Rows that bring a *get* reply up to :attr:`reply_size` bytes, as a string."
+        if not self.reply_size:
+            return ''
+        rows = []
+        total = 0
+        for idx in itertools.count():
+            if total >= self.reply_size:
+                break
+            row = PADDING_ROW % (idx, idx)
+            rows.append(row)
+            total += len(row)
+        return '<padding xmlns="%s">%s</padding>' % (SIM_NS, ''.join(rows))
+
+    def monitoring(self):
+        "The ietf-netconf-monitoring state."
+        state = etree.Element(_q('netconf-state', MONITORING_NS), nsmap={None: MONITORING_NS})
+        sessions = etree.SubElement(state, _q('sessions', MONITORING_NS))
+        for c in list(self.connections.values()):
+            s = etree.SubElement(sessions, _q('session', MONITORING_NS))
+            for tag, value in (('session-id', c.session_id), ('transport', c.transport),
+                               ('username', c.username), ('source-host', c.peer),
+                               ('login-time', c.login_time), ('in-rpcs', c.in_rpcs),
+                               ('in-bad-rpcs', c.in_bad_rpcs), ('out-rpc-errors', c.out_rpc_errors),
+                               ('out-notifications', c.out_notifications)):
+                etree.SubElement(s, _q(tag, MONITORING_NS)).text = str(value)
+        schemas = etree.SubElement(state, _q('schemas', MONITORING_NS))
+        for identifier in self.schemas:
+            s = etree.SubElement(schemas, _q('schema', MONITORING_NS))
+            for tag, value in (('identifier', identifier), ('version', ''), ('format', 'yang'),
+                               ('namespace', SIM_NS), ('location', 'NETCONF')):
+                etree.SubElement(s, _q(tag, MONITORING_NS)).text = value
+        return state
+
+
+class Connection(object):
+
+    """A NETCONF session with a client, over *channel*: anything with the
+    ``recv``, ``sendall`` and ``close`` of a socket, e.g. a paramiko
+    ``Channel``."""
+
+    def __init__(self, device, channel, transport='netconf-ssh', username='', peer=''):
+        self.device = device
+        self.channel = channel
+        self.transport = transport
+        self.username = username
+        self.peer = peer
+        self.login_time = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        self.base11 = False
+        self.in_rpcs = self.in_bad_rpcs = self.out_rpc_errors = self.out_notifications = 0
+        self._buffer = bytearray()
+        self._send_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._subscribed = False
+        device.add(self)
+
+    # framing
+
+    def _read(self):
+        data = self.channel.recv(65536)
+        if not data:
+            raise EOFError()
+        self._buffer += data
+
+    def _read_message(self):
+        buf = self._buffer
+        if not self.base11:
+            while True:
+                end = buf.find(MSG_DELIM)
+                if end >= 0:
+                    message = bytes(buf[:end])
+                    del buf[:end + len(MSG_DELIM)]
+                    return message
+                self._read()
+        parts = []
+        while True:
+            while len(buf) < 4 or buf.find(b'\n', 2) < 0:
+                self._read()
+            if buf.startswith(END_DELIM):
+                del buf[:len(END_DELIM)]
+                return b''.join(parts)
+            if not buf.startswith(b'\n#'):
+                raise ValueError('bad chunk header %r' % bytes(buf[:16]))
+            eol = buf.find(b'\n', 2)
+            size = int(buf[2:eol])
+            del buf[:eol + 1]
+            while len(buf) < size:
+                self._read()
+            parts.append(bytes(buf[:size]))
+            del buf[:size]
+
+    def send(self, message):
+        data = message.encode('UTF-8') if isinstance(message, str) else message
+        if self.base11:
+            size = self.device.chunk_size
+            framed = []
+            for pos in range(0, len(data), size):
+                chunk = data[pos:pos + size]
+                framed.append(b'\n#%d\n' % len(chunk))
+                framed.append(chunk)
+            framed.append(END_DELIM)
+            data = b''.join(framed)
+        else:
+            data += MSG_DELIM
+        with self._send_lock:
+            self.channel.sendall(data)
+
+    # session
+
+    def serve(self):
+        "Exchange hellos and answer requests until the session ends."
+        try:
+            self.send('<?xml version="1.0" encoding="UTF-8"?><hello xmlns="%s"><capabilities>%s</capabilities>'
+                      '<session-id>%d</session-id></hello>' % (
+                          BASE_NS, ''.join('<capability>%s</capability>' % escape(c) for c in self.device.capabilities()),
+                          self.session_id))
+            hello = etree.fromstring(self._read_message())
+            caps = [c.text.strip() for c in hello.iter(_q('capability'))]
+            self.base11 = self.device.base11 and BASE_11 in caps
+            logger.info('session %d: hello from %s, base:%s', self.session_id, self.peer,
+                        '1.1' if self.base11 else '1.0')
+            while not self._closed.is_set():
+                self._handle(self._read_message())
+        except (EOFError, OSError, socket.error):
+            pass
+        except Exception:
+            logger.exception('session %d failed', self.session_id)
+        finally:
+            self.close()
+
+    def close(self):
+        self._closed.set()
+        self.device.remove(self)
+        try:
+            self.channel.close()
+        except Exception:
+            pass
+
+    def _handle(self, message):
+        try:
+            rpc = etree.fromstring(message)
+        except etree.XMLSyntaxError as e:
+            self.in_bad_rpcs += 1
+            self.out_rpc_errors += 1
+            self.send('<rpc-reply xmlns="%s">%s</rpc-reply>' % (
+                BASE_NS, RPCError('malformed-message', str(e), type='rpc').to_xml()))
+            return
+        self.in_rpcs += 1
+        # the attributes of the rpc are returned with the reply, message-id first of all
+        attrs = ''.join(' %s=%s' % (k, quoteattr(v)) for k, v in rpc.attrib.items() if not k.startswith('{'))
+        op = next((c for c in rpc if isinstance(c.tag, str)), None)
+        name = _localname(op) if op is not None else None
+        delay = self.device.delays.get(name, self.device.delay)
+        if delay:
+            time.sleep(delay)
+        try:
+            handler = getattr(self, 'op_' + name.replace('-', '_'), None) if name else None
+            if handler is None:
+                raise RPCError('operation-not-supported', 'Unsupported operation %s' % name, type='protocol')
+            body = handler(op)
+        except RPCError as e:
+            self.out_rpc_errors += 1
+            body = e.to_xml()
+        self.send('<?xml version="1.0" encoding="UTF-8"?><rpc-reply xmlns="%s"%s>%s</rpc-reply>' % (
+            BASE_NS, attrs, body))
+
+    # operations, each returns the content of the rpc-reply
+
+    def _source(self, op, tag='source'):
+        source = op.find(_q(tag))
+        if source is None or not len(source):
+            raise RPCError('missing-element', 'Missing %s' % tag, type='protocol')
+        return _localname(source[0]), source[0]
+
+    def _data(self, nodes, op):
+        f = op.find(_q('filter'))
+        with self.device.lock:
+            if f is not None and f.get('type', 'subtree') == 'subtree':
+                selected = subtree_filter(nodes, list(f))
+                padding = ''
+            else:
+                selected = [copy.deepcopy(n) for n in nodes]
+                padding = self.device.padding()
+        return '<data>%s%s</data>' % (
+            ''.join(etree.tostring(n, encoding='unicode') for n in selected), padding)
+
+    def op_get(self, op):
+        with self.device.lock:
+            nodes = list(self.device.running) + [self.device.monitoring()]
+        return self._data(nodes, op)
+
+    def op_get_config(self, op):
+        name, _ = self._source(op)
+        return self._data(list(self.device.datastore(name)), op)
+
+    def op_edit_config(self, op):
+        name, _ = self._source(op, 'target')
+        config = op.find(_q('config'))
+        if config is None:
+            raise RPCError('missing-element', 'Missing config', type='protocol')
+        default = op.findtext(_q('default-operation'), 'merge')
+        with self.device.lock:
+            self.device.check_lock(name, self.session_id)
+            target = self.device.datastore(name)
+            scratch = copy.deepcopy(target)
+            merge(scratch, copy.deepcopy(config), default)
+            target[:] = list(scratch)
+        return '<ok/>'
+
+    def op_copy_config(self, op):
+        target, _ = self._source(op, 'target')
+        source, ele = self._source(op)
+        with self.device.lock:
+            self.device.check_lock(target, self.session_id)
+            content = list(ele) if source == 'config' else list(self.device.datastore(source))
+            self.device.datastore(target)[:] = [copy.deepcopy(e) for e in content]
+        return '<ok/>'
+
+    def op_delete_config(self, op):
+        target, _ = self._source(op, 'target')
+        if target == 'running':
+            raise RPCError('operation-not-supported', 'Cannot delete running', type='protocol')
+        with self.device.lock:
+            self.device.check_lock(target, self.session_id)
+            self.device.datastore(target)[:] = []
+        return '<ok/>'
+
+    def op_lock(self, op):
+        name, _ = self._source(op, 'target')
+        with self.device.lock:
+            self.device.datastore(name)
+            owner = self.device.locks.get(name)
+            if owner is not None:
+                raise RPCError('lock-denied', 'Lock failed, lock is already held',
+                               type='protocol', info={'session-id': owner})
+            self.device.locks[name] = self.session_id
+        return '<ok/>'
+
+    def op_unlock(self, op):
+        name, _ = self._source(op, 'target')
+        with self.device.lock:
+            if self.device.locks.get(name) != self.session_id:
+                raise RPCError('operation-failed', 'The %s datastore is not locked by this session' % name,
+                               type='protocol')
+            del self.device.locks[name]
+        return '<ok/>'
+
+    def op_validate(self, op):
+        self._source(op)
+        return '<ok/>'
+
+    def op_commit(self, op):
+        with self.device.lock:
+            self.device.check_lock('running', self.session_id)
+            self.device.running[:] = [copy.deepcopy(e) for e in self.device.candidate]
+        return '<ok/>'
+
+    def op_discard_changes(self, op):
+        with self.device.lock:
+            self.device.candidate[:] = [copy.deepcopy(e) for e in self.device.running]
+        return '<ok/>'
+
+    def op_cancel_commit(self, op):
+        return '<ok/>'
+
+    def op_get_schema(self, op):
+        identifier = op.findtext(_q('identifier', MONITORING_NS))
+        text = self.device.schemas.get(identifier)
+        if text is None:
+            raise RPCError('invalid-value', 'Unknown schema %s' % identifier)
+        ele = etree.Element(_q('data', MONITORING_NS), nsmap={None: MONITORING_NS})
+        ele.text = text
+        return etree.tostring(ele, encoding='unicode')
+
+    def op_close_session(self, op):
+        self._closed.set()
+        return '<ok/>'
+
+    def op_kill_session(self, op):
+        session_id = op.findtext(_q('session-id'))
+        with self.device.lock:
+            victim = self.device.connections.get(int(session_id or 0))
+        if victim is None:
+            raise RPCError('invalid-value', 'No session %s' % session_id, type='protocol')
+        if victim is self:
+            raise RPCError('invalid-value', 'Cannot kill the own session', type='protocol')
+        victim.close()
+        return '<ok/>'
+
+    def op_create_subscription(self, op):
+        stream = op.findtext(_q('stream', NOTIFICATION_NS)) or 'NETCONF'
+        config = self.device.streams.get(stream)
+        if config is None:
+            raise RPCError('invalid-value', 'Unknown stream %s' % stream)
+        if self._subscribed:
+            raise RPCError('operation-failed', 'Already subscribed', type='protocol')
+        self._subscribed = True
+        threading.Thread(target=self._notify, args=(stream, config), daemon=True,
+                         name='notify-%d' % self.session_id).start()
+        return '<ok/>'
+
+    def _notify(self, stream, config):
+        rate = config.get('rate') or 10
+        count = config.get('count')
+        padding = 'x' * (config.get('size') or 0)
+        start = time.monotonic()
+        for seq in itertools.count():
+            if count is not None and seq >= count:
+                return
+            # paced by the clock rather than by sleeps, so that bursts catch up
+            due = start + seq / float(rate)
+            pause = due - time.monotonic()
+            if pause > 0 and self._closed.wait(pause):
+                return
+            if self._closed.is_set():
+                return
+            now = time.time()
+            event_time = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now)) + '.%06dZ' % (now % 1 * 1e6)
+            try:
+                self.send('<notification xmlns="%s"><eventTime>%s</eventTime>'
+                          '<event xmlns="%s"><stream>%s</stream><seq>%d</seq><payload>%s</payload></event>'
+                          '</notification>' % (NOTIFICATION_NS, event_time, SIM_NS, stream, seq, padding))
+            except (OSError, socket.error, EOFError):
+                return
+            self.out_notifications += 1
+
+
+class Server(object):
+
+    """Accepts connections on *host*:*port* (0 picks a free port, see
+    :attr:`port`) in a thread of its own and serves each of them in another.
+    The other keyword arguments configure the :class:`Device` simulated,
+    unless one is given as *device*."""
+
+    transport = None
+
+    def __init__(self, host='127.0.0.1', port=0, device=None, **kwds):
+        self.device = device if device is not None else Device(**kwds)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(16)
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def address(self):
+        return self._sock.getsockname()[:2]
+
+    @property
+    def port(self):
+        return self.address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept, daemon=True, name='netconf-sim')
+        self._thread.start()
+        logger.info('%s server listening on %s:%d', self.transport, *self.address)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, socket.error):
+            pass
+        self._sock.close()
+        for c in list(self.device.connections.values()):
+            c.close()
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                sock, peer = self._sock.accept()
+            except (OSError, socket.error):
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(sock, peer), daemon=True,
+                             name='netconf-sim-%s:%d' % peer[:2]).start()
+
+    def _serve(self, sock, peer):
+        try:
+            self.serve(sock, peer[0])
+        except Exception as e:
+            logger.info('connection from %s failed: %r', peer[0], e)
+            sock.close()
+
+    def serve(self, sock, peer):
+        "Serve a connection accepted on *sock*."
+        Connection(self.device, sock, self.transport, peer=peer).serve()
+
+
+class TCPServer(Server):
+
+    "NETCONF straight over TCP, without encryption nor authentication."
+
+    transport = 'netconf-tcp'
+
+
+class TLSServer(Server):
+
+    """NETCONF over TLS. *certfile* and *keyfile* are the certificate and key
+    of the server, clients must present a certificate signed by *ca_certs*
+    if it is given. See :func:`make_certificates` for a set to test with."""
+
+    transport = 'netconf-tls'
+
+    def __init__(self, host='127.0.0.1', port=0, certfile=None, keyfile=None, ca_certs=None, **kwds):
+        Server.__init__(self, host, port, **kwds)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        if ca_certs:
+            context.verify_mode = ssl.CERT_REQUIRED
+            context.load_verify_locations(ca_certs)
+        self._context = context
+
+    def serve(self, sock, peer):
+        tls = self._context.wrap_socket(sock, server_side=True)
+        subject = dict(x[0] for x in (tls.getpeercert() or {}).get('subject', ()))
+        Connection(self.device, tls, self.transport, username=subject.get('commonName', ''),
+                   peer=peer).serve()
+
+
+class SSHServer(Server):
+
+    """NETCONF over SSH, on the ``netconf`` subsystem. Password
+    authentication with *username* and *password*, any credentials are
+    accepted if they are `None`. *host_key* is the path of the private RSA
+    key of the server, one is generated if it is `None`. Every channel a
+    client opens on its connection is a NETCONF session of its own."""
+
+    transport = 'netconf-ssh'
+
+    def __init__(self, host='127.0.0.1', port=0, username=None, password=None, host_key=None, **kwds):
+        Server.__init__(self, host, port, **kwds)
+        self.username = username
+        self.password = password
+        if host_key:
+            self.host_key = paramiko.RSAKey(filename=host_key)
+        else:
+            self.host_key = paramiko.RSAKey.generate(2048)
+
+    def serve(self, sock, peer):
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self.host_key)
+        interface = _SSHInterface(self.username, self.password)
+        transport.start_server(server=interface)
+        timeout = 30
+        try:
+            while transport.is_active():
+                channel = transport.accept(timeout)
+                if channel is None:
+                    if timeout == 30:
+                        return
+                    continue
+                timeout = 1
+                threading.Thread(target=self._serve_channel, args=(interface, channel, peer), daemon=True,
+                                 name='netconf-sim-%s-%d' % (peer, channel.get_id())).start()
+        finally:
+            transport.close()
+
+    def _serve_channel(self, interface, channel, peer):
+        if not interface.wait_subsystem(channel, 30):
+            channel.close()
+            return
+        Connection(self.device, channel, self.transport, username=interface.user, peer=peer).serve()
+
+
+class _SSHInterface(paramiko.ServerInterface):
+
+    def __init__(self, username, password):
+        self._username = username
+        self._password = password
+        self.user = ''
+        self._subsystems = {}
+        self._lock = threading.Condition()
+
+    def wait_subsystem(self, channel, timeout):
+        "Whether the netconf subsystem was requested on *channel* within *timeout* seconds."
+        with self._lock:
+            return self._lock.wait_for(lambda: channel.get_id() in self._subsystems, timeout)
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if self._username is None or (username, password) == (self._username, self._password):
+            self.user = username
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_subsystem_request(self, channel, name):
+        if name == 'netconf':
+            with self._lock:
+                self._subsystems[channel.get_id()] = name
+                self._lock.notify_all()
+            return True
+        return False
+
+
+def make_certificates(directory=None, host='localhost'):
+    """Create a CA, a server certificate for *host* (and 127.0.0.1) and a client
+    certificate signed by it in *directory* (a new temporary one by default),
+    with :mod:`cryptography`. Returns a dict of the paths: ``ca``,
+    ``server_cert``, ``server_key``, ``client_cert`` and ``client_key``."""
+    import datetime
+    import ipaddress
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    directory = directory or tempfile.mkdtemp(prefix='netconf-sim-')
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    def issue(name, issuer=None, issuer_key=None, ca=False, san=None):
+        key = ec.generate_private_key(ec.SECP256R1())
+        subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+        builder = (x509.CertificateBuilder()
+                   .subject_name(subject)
+                   .issuer_name(issuer or subject)
+                   .public_key(key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(days=1))
+                   .not_valid_after(now + datetime.timedelta(days=365))
+                   .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True))
+        if san:
+            builder = builder.add_extension(x509.SubjectAlternativeName(san), critical=False)
+        cert = builder.sign(issuer_key or key, hashes.SHA256())
+        return cert, key
+
+    def write(filename, data):
+        path = os.path.join(directory, filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def key_pem(key):
+        return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                 serialization.NoEncryption())
+
+    ca, ca_key = issue('netconf-sim CA', ca=True)
+    server, server_key = issue(host, ca.subject, ca_key, san=[
+        x509.DNSName(host), x509.IPAddress(ipaddress.ip_address('127.0.0.1'))])
+    client, client_key = issue('netconf-sim client', ca.subject, ca_key)
+    pem = serialization.Encoding.PEM
+    return {
+        'ca': write('ca.pem', ca.public_bytes(pem)),
+        'server_cert': write('server.pem', server.public_bytes(pem)),
+        'server_key': write('server.key', key_pem(server_key)),
+        'client_cert': write('client.pem', client.public_bytes(pem)),
+        'client_key': write('client.key', key_pem(client_key)),
+    }
+
+
+def _stream(text):
+    "NAME[:RATE[:COUNT[:SIZE]]]"
+    parts = text.split(':')
+    values = [float(parts[1]) if len(parts) > 1 else 10,
+              int(parts[2]) if len(parts) > 2 and parts[2] else None,
+              int(parts[3]) if len(parts) > 3 else 0]
+    return parts[0], dict(zip(('rate', 'count', 'size'), values))
+
+
+def _op_delay(text):
+    name, _, seconds = text.partition('=')
+    return name, float(seconds)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    ap.add_argument('--ssh', type=int, metavar='PORT', help='serve NETCONF over SSH on PORT')
+    ap.add_argument('--tls', type=int, metavar='PORT', help='serve NETCONF over TLS on PORT')
+    ap.add_argument('--tcp', type=int, metavar='PORT', help='serve NETCONF over plain TCP on PORT')
+    ap.add_argument('--user', help='SSH user name, any is accepted if not given')
+    ap.add_argument('--password', help='SSH password')
+    ap.add_argument('--host-key', help='private RSA key of the SSH server, generated if not given')
+    ap.add_argument('--certfile', help='certificate of the TLS server, a test set is made if not given')
+    ap.add_argument('--keyfile', help='key of the TLS server')
+    ap.add_argument('--ca-certs', help='CA that client certificates must be signed by')
+    ap.add_argument('--datastore', help='file with the <config> element to start from')
+    ap.add_argument('--base10', action='store_true', help='do not advertise base:1.1')
+    ap.add_argument('--delay', type=float, default=0, help='seconds to wait before each reply')
+    ap.add_argument('--delay-op', type=_op_delay, action='append', default=[], metavar='OP=SECONDS',
+                    help='seconds to wait before replying to OP, e.g. commit=2')
+    ap.add_argument('--chunk-size', type=int, default=65536, help='largest base:1.1 chunk sent')
+    ap.add_argument('--reply-size', type=int, help='pad get and get-config replies to about this many bytes')
+    ap.add_argument('--stream', type=_stream, action='append', default=[], metavar='NAME[:RATE[:COUNT[:SIZE]]]',
+                    help='notification stream, e.g. NETCONF:1000::200 for 1000/s of 200 bytes (default NETCONF:10)')
+    ap.add_argument('-v', '--verbose', action='store_true')
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(name)s %(message)s')
+
+    kwds = dict(base11=not args.base10, delay=args.delay, delays=dict(args.delay_op),
+                chunk_size=args.chunk_size, reply_size=args.reply_size,
+                streams=dict(args.stream) if args.stream else None)
+    if args.datastore:
+        with open(args.datastore) as f:
+            kwds['datastore'] = f.read()
+    device = Device(**kwds)
+    servers = []
+    if args.ssh is not None:
+        servers.append(SSHServer(args.host, args.ssh, username=args.user, password=args.password,
+                                 host_key=args.host_key, device=device))
+    if args.tls is not None:
+        certfile, keyfile, ca_certs = args.certfile, args.keyfile, args.ca_certs
+        if certfile is None:
+            certs = make_certificates()
+            certfile, keyfile, ca_certs = certs['server_cert'], certs['server_key'], certs['ca']
+            print('TLS test certificates: CA %s, client %s and %s' % (
+                certs['ca'], certs['client_cert'], certs['client_key']))
+        servers.append(TLSServer(args.host, args.tls, certfile=certfile, keyfile=keyfile,
+                                 ca_certs=ca_certs, device=device))
+    if args.tcp is not None:
+        servers.append(TCPServer(args.host, args.tcp, device=device))
+    if not servers:
+        ap.error('no transport, give at least one of --ssh, --tls and --tcp')
+    for s in servers:
+        s.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for s in servers:
+            s.stop()
+
+
+if __name__ == '__main__':
+    main()
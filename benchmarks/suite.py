@@ -0,0 +1,449 @@
+"""Throughput and allocations of the hot paths of the receive side and the GUI.
+
+Each case times one path on synthetic replies of each size given, from
+1 KB up to hundreds of MB, and keeps the best of a few runs:
+
+=========================  ==================================================
+case                       what is timed
+=========================  ==================================================
+``parser10``               :class:`~ncclient.transport.parser.DefaultXMLParser`
+                           delimiting a base:1.0 stream, fed in reads
+``parser11``               the same, decoding a base:1.1 chunked stream
+``junos_sax``              :class:`~ncclient.transport.third_party.junos.parser.JunosXMLParser`
+                           filtering a base:1.0 stream through its SAX handler
+``reply_parse``            :meth:`~ncclient.operations.rpc.RPCReply.parse` of a
+                           received message, including its non UTF-8 hook
+``pretty_xml``             :func:`utils.pretty_xml` of a received message
+``highlight``              :meth:`xmleditor.XmlHighlighter.highlightBlock` over the
+                           pretty printed reply, one call per line
+``session_history``        appending rows one at a time to
+                           :class:`session_history.SessionHistoryModel`
+``session_history_batch``  the same, in batches of ``--batch`` rows
+``notifications``          appending rows one at a time to
+                           :class:`session.NotificationModel`
+``notifications_batch``    the same, in batches of ``--batch`` rows
+``history``                :meth:`history.HistoryModel.addHistory`
+=========================  ==================================================
+
+The models are measured behind a :class:`QSortFilterProxyModel`, as the GUI
+shows them, by the number of rows instead of the size of a reply. Qt runs
+with the ``offscreen`` platform unless ``QT_QPA_PLATFORM`` says otherwise,
+so no display is needed. The slowest cases, ``junos_sax`` and
+``highlight``, stop at 16 MB and 1 MB unless run with ``--no-limit``.
+
+Allocations are measured in one more run of each case with
+:mod:`tracemalloc`, as the peak of memory allocated through Python on top
+of what the inputs take. What libxml2 allocates for lxml is not seen.
+
+The results can be written as JSON with ``--json`` and the files of two
+revisions compared::
+
+    python -m benchmarks --json before.json
+    git checkout ...
+    python -m benchmarks --json after.json
+    python -m benchmarks --compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from benchmarks.framing import BenchSession, make_reply, frame10, frame11
+from ncclient.operations.rpc import RPCReply, RPCReplyListener
+from ncclient.transport.parser import DefaultXMLParser
+from ncclient.transport.session import NetconfBase
+from ncclient.transport.third_party.junos.parser import JunosXMLParser
+from ncclient.xml_ import ParsedMessage
+
+SIZES = [1 << 10, 64 << 10, 1 << 20, 16 << 20, 200 << 20]
+"Reply sizes measured by default, in bytes."
+
+READ_SIZE = 32 * 1024
+"Bytes per read fed to the parsers, what an SSH channel typically hands over at once."
+
+CHUNK_SIZE = 4096
+"Chunk size of the base:1.1 streams."
+
+ROWS = 10000
+"Rows appended to the models by default."
+
+ROW_REPLY_SIZE = 1 << 10
+"Size of the message held by each row of the models."
+
+JUNOS_FILTER = '<data><interface><name/></interface></data>'
+"Keeps the names of the interfaces of :func:`benchmarks.framing.make_reply`."
+
+NON_UTF8_EVERY = 100
+"One row in this many of the replies parsed by ``reply_parse`` holds a replaced character."
+
+_cache = {}
+
+
+def _cached(key, make):
+    "The input *key* (a name and a size), made once. Only the inputs of one size are kept at a time."
+    if key not in _cache:
+        size = key[1]
+        for k in [k for k in _cache if k[1] != size]:
+            del _cache[k]
+        _cache[key] = make()
+    return _cache[key]
+
+
+def _reply(size):
+    return _cached(('reply', size), lambda: make_reply(size))
+
+
+def _text(size):
+    "The reply as a received message, with a replaced character here and there."
+    def make():
+        text = _reply(size).decode('UTF-8')
+        rows = text.split('</mtu>')
+        for i in range(0, len(rows) - 1, NON_UTF8_EVERY):
+            rows[i] = rows[i][:-1] + '�'
+        return '</mtu>'.join(rows)
+    return _cached(('text', size), make)
+
+
+def _reads(stream, read_size):
+    view = memoryview(stream)
+    return [view[pos:pos + read_size] for pos in range(0, len(stream), read_size)]
+
+
+_app = None
+
+
+def _qt():
+    "Start Qt, on the offscreen platform unless told otherwise."
+    global _app
+    if _app is None:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        _app = QApplication.instance() or QApplication(sys.argv[:1])
+    return _app
+
+
+# Every case returns, for the size or the number of rows it is given, a
+# function doing the work once that is timed, set up afresh for each run,
+# and the number of bytes or rows it goes through.
+
+def case_parser10(size, args):
+    message = _reply(size)
+    reads = _reads(_cached(('frame10', size), lambda: frame10(message)), args.read_size)
+    session = BenchSession(NetconfBase.BASE_10)
+    parser = session.parser = DefaultXMLParser(session)
+    def run():
+        for data in reads:
+            parser.parse(data)
+        assert session.messages == 1 and session.received == len(message)
+    return run, len(message)
+
+
+def case_parser11(size, args):
+    message = _reply(size)
+    reads = _reads(_cached(('frame11', size), lambda: frame11(message, args.chunk)),
+                   args.read_size)
+    session = BenchSession(NetconfBase.BASE_11)
+    parser = session.parser = DefaultXMLParser(session)
+    def run():
+        for data in reads:
+            parser.parse(data)
+        assert session.messages == 1 and session.received == len(message)
+    return run, len(message)
+
+
+class _JunosSession(BenchSession):
+    """A :class:`BenchSession` waiting for the reply to an RPC that asked
+    for its reply to be filtered."""
+
+    def __init__(self):
+        BenchSession.__init__(self, NetconfBase.BASE_10)
+        listener = object.__new__(RPCReplyListener)
+        listener._id2rpc = {'101': SimpleNamespace(_filter_xml=JUNOS_FILTER)}
+        self._listeners = {listener}
+
+
+def case_junos_sax(size, args):
+    message = _reply(size)
+    stream = _cached(('frame10', size), lambda: frame10(message))
+    # the SAX parser is handed bytes by the transports
+    reads = [bytes(r) for r in _reads(stream, args.read_size)]
+    session = _JunosSession()
+    parser = session.parser = JunosXMLParser(session)
+    def run():
+        for data in reads:
+            session.parser.parse(data)
+        assert session.messages == 1
+    return run, len(message)
+
+
+def case_reply_parse(size, args):
+    message = ParsedMessage(_text(size))
+    message.data # encoded when received
+    reply = RPCReply(message)
+    def run():
+        reply.parse()
+        assert reply._non_utf8_tags
+    return run, message.size
+
+
+def case_pretty_xml(size, args):
+    import utils
+    message = ParsedMessage(_text(size))
+    message.data # encoded when received
+    def run():
+        utils.pretty_xml(message)
+    return run, message.size
+
+
+def case_highlight(size, args):
+    _qt()
+    import utils
+    from PyQt5.QtGui import QTextDocument
+    from xmleditor import XmlHighlighter
+    text = _cached(('pretty', size), lambda: utils.pretty_xml(_text(size)))
+    document = _cached(('document', size), lambda: QTextDocument(text))
+    highlighter = XmlHighlighter(None)
+    highlighter.setDocument(document)
+    def run():
+        highlighter.rehighlight()
+    return run, len(text.encode('UTF-8'))
+
+
+def _proxied(model):
+    from PyQt5.QtCore import QSortFilterProxyModel
+    proxy = QSortFilterProxyModel(model)
+    proxy.setSourceModel(model)
+    proxy.setFilterKeyColumn(3)
+    return model
+
+
+def _rows(count):
+    origin = ParsedMessage(_reply(ROW_REPLY_SIZE).decode('UTF-8'))
+    return [['2024-01-01 00:00:00.%06d' % i, 0, 'rpc-reply message-id="%d"' % i, origin]
+            for i in range(count)]
+
+
+def case_session_history(count, args):
+    _qt()
+    from session_history import SessionHistoryModel
+    model = _proxied(SessionHistoryModel())
+    rows = _rows(count)
+    def run():
+        for row in rows:
+            model.appendRow(*row)
+    return run, count
+
+
+def case_session_history_batch(count, args):
+    _qt()
+    from session_history import SessionHistoryModel
+    model = _proxied(SessionHistoryModel())
+    rows = _rows(count)
+    batch = args.batch
+    def run():
+        for i in range(0, count, batch):
+            model.appendRows(rows[i:i + batch])
+    return run, count
+
+
+def case_notifications(count, args):
+    _qt()
+    from session import NotificationModel
+    model = _proxied(NotificationModel())
+    rows = _rows(count)
+    def run():
+        for row in rows:
+            model.appendRow(*row)
+    return run, count
+
+
+def case_notifications_batch(count, args):
+    _qt()
+    from session import NotificationModel
+    model = _proxied(NotificationModel())
+    rows = _rows(count)
+    batch = args.batch
+    def run():
+        for i in range(0, count, batch):
+            model.appendRows(rows[i:i + batch])
+    return run, count
+
+
+def case_history(count, args):
+    _qt()
+    from history import HistoryModel
+    model = _proxied(HistoryModel([]))
+    # the requests sent, each one different
+    body = _reply(ROW_REPLY_SIZE).decode('UTF-8')
+    requests = ['<!-- %d -->%s' % (i, body) for i in range(count)]
+    def run():
+        for request in requests:
+            model.addHistory(request)
+    return run, count
+
+
+# name: (set up, kind, largest size measured unless --no-limit)
+CASES = {
+    'parser10': (case_parser10, 'bytes', None),
+    'parser11': (case_parser11, 'bytes', None),
+    'junos_sax': (case_junos_sax, 'bytes', 16 << 20),
+    'reply_parse': (case_reply_parse, 'bytes', None),
+    'pretty_xml': (case_pretty_xml, 'bytes', None),
+    'highlight': (case_highlight, 'bytes', 1 << 20),
+    'session_history': (case_session_history, 'rows', None),
+    'session_history_batch': (case_session_history_batch, 'rows', None),
+    'notifications': (case_notifications, 'rows', None),
+    'notifications_batch': (case_notifications_batch, 'rows', None),
+    'history': (case_history, 'rows', None),
+}
+
+
+def measure(name, param, args):
+    """Returns the result of case *name* for *param* (a size in bytes or a
+    number of rows): the best time of *args.repeat* runs, the throughput
+    and, with *args.alloc*, the traced peak of one more run."""
+    setup, kind, _ = CASES[name]
+    best = None
+    for _ in range(args.repeat):
+        run, amount = setup(param, args)
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        del run
+    if kind == 'bytes':
+        result = {'case': name, 'size': param, 'bytes': amount, 'seconds': best,
+                  'mb_per_s': amount / best / 1e6}
+    else:
+        result = {'case': name, 'rows': param, 'seconds': best, 'rows_per_s': amount / best}
+    if args.alloc:
+        run, amount = setup(param, args)
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        run()
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        del run
+    return result
+
+
+def revision():
+    "The git revision of the tree, with a ``+`` if it has changes, `None` outside git."
+    top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        rev = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=top,
+                                      stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                        cwd=top, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return rev + '+' if dirty else rev
+
+
+def _key(result):
+    return (result['case'], result.get('size', result.get('rows')))
+
+
+def _format_size(n):
+    for unit, shift in (('G', 30), ('M', 20), ('K', 10)):
+        if n >= 1 << shift and n % (1 << shift) == 0:
+            return '%d%s' % (n >> shift, unit)
+    return str(n)
+
+
+def compare(before, after, out=sys.stdout):
+    "Print the change from the results in file *before* to those in *after*."
+    with open(before) as f:
+        old = json.load(f)
+    with open(after) as f:
+        new = json.load(f)
+    old_results = dict((_key(r), r) for r in old['results'])
+    print('%s -> %s' % (old.get('revision'), new.get('revision')), file=out)
+    print('%-22s %10s %11s %11s %8s %12s %12s' % (
+        'case', 'size/rows', 'seconds', 'was', 'speedup', 'peak', 'was'), file=out)
+    for r in new['results']:
+        o = old_results.get(_key(r))
+        if o is None:
+            continue
+        print('%-22s %10s %11.6f %11.6f %7.2fx %12s %12s' % (
+            r['case'], _format_size(_key(r)[1]), r['seconds'], o['seconds'],
+            o['seconds'] / r['seconds'], r.get('peak_bytes', ''), o.get('peak_bytes', '')),
+            file=out)
+
+
+def _size(text):
+    "A size in bytes, with an optional K, M or G suffix."
+    text = text.strip().upper()
+    for unit, shift in (('K', 10), ('M', 20), ('G', 30)):
+        if text.endswith(unit):
+            return int(float(text[:-1]) * (1 << shift))
+    return int(text)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('cases', nargs='*', metavar='CASE',
+                    help='cases to run, all by default: %s' % ', '.join(CASES))
+    ap.add_argument('--sizes', type=_size, nargs='+', default=SIZES,
+                    help='reply sizes, e.g. 1K 1M 200M')
+    ap.add_argument('--no-limit', action='store_true',
+                    help='measure junos_sax above 16M and highlight above 1M too')
+    ap.add_argument('--rows', type=int, nargs='+', default=[ROWS],
+                    help='rows appended to the models')
+    ap.add_argument('--batch', type=int, default=100, help='rows per batch appended')
+    ap.add_argument('--read-size', type=_size, default=READ_SIZE, help='bytes per read fed to the parsers')
+    ap.add_argument('--chunk', type=_size, default=CHUNK_SIZE, help='chunk size of base:1.1 streams')
+    ap.add_argument('--repeat', type=int, default=3, help='runs per measurement, the best counts')
+    ap.add_argument('--no-alloc', dest='alloc', action='store_false',
+                    help='skip the run measuring allocations')
+    ap.add_argument('--json', metavar='FILE', help='write the results to FILE')
+    ap.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                    help='compare the results of two runs instead of running')
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    unknown = [c for c in args.cases if c not in CASES]
+    if unknown:
+        ap.error('unknown case %s' % ', '.join(unknown))
+
+    results = []
+    print('%-22s %10s %11s %12s %12s' % ('case', 'size/rows', 'seconds', 'rate', 'peak'))
+    for name in args.cases or CASES:
+        _, kind, limit = CASES[name]
+        if kind == 'bytes':
+            params = [s for s in args.sizes if args.no_limit or limit is None or s <= limit]
+        else:
+            params = args.rows
+        for param in params:
+            r = measure(name, param, args)
+            results.append(r)
+            rate = '%9.1f MB/s' % r['mb_per_s'] if kind == 'bytes' else '%7.0f rows/s' % r['rows_per_s']
+            print('%-22s %10s %11.6f %12s %12s' % (name, _format_size(param), r['seconds'],
+                                                   rate, r.get('peak_bytes', '')))
+            sys.stdout.flush()
+        # the inputs of a few hundred MB add up
+        _cache.clear()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'revision': revision(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'read_size': args.read_size,
+                'chunk': args.chunk,
+                'results': results,
+            }, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -72,8 +72,18 @@ class AppData(object):
     def __set_ui_session(self, state: bool):
         self._ui_config['session'] = state
 
+    def __set_ui_fleet_parallel(self, count: int):
+        self._ui_config['fleet_parallel'] = count
+
+    def __set_ui_connect_parallel(self, count: int):
+        self._ui_config['connect_parallel'] = count
+
+    def __set_ui_connect_retries(self, count: int):
+        self._ui_config['connect_retries'] = count
+
     def __set_ui_config(self, uiconfig: dict):
-         for key in ['status_bar', 'history', 'tool_bar', 'language', 'session']:
+         for key in ['status_bar', 'history', 'tool_bar', 'language', 'session', 'fleet_parallel',
+                     'connect_parallel', 'connect_retries']:
             if not uiconfig.get(key, None) == None:
                 self._ui_config[key] = uiconfig.get(key)
 
@@ -94,6 +104,17 @@ class AppData(object):
     ui_session = property(fget=lambda self: self._ui_config.get('session', False),
                           fset=__set_ui_session)
 
+    # 向多个会话同时下发请求时，同时进行的会话数
+    ui_fleet_parallel = property(fget=lambda self: self._ui_config.get('fleet_parallel', 16),
+                                 fset=__set_ui_fleet_parallel)
+
+    # 同时连接多个会话时，同时建立的连接数及连接失败后的重试次数
+    ui_connect_parallel = property(fget=lambda self: self._ui_config.get('connect_parallel', 8),
+                                   fset=__set_ui_connect_parallel)
+
+    ui_connect_retries = property(fget=lambda self: self._ui_config.get('connect_retries', 3),
+                                  fset=__set_ui_connect_retries)
+
     commands = property(fget=lambda self: self._data.get('favorite', {'data':['name', 'xml', 'type']}),
                         fset = __set_command)
     @property
@@ -367,7 +367,8 @@ class DeviceManage(QDialog):
         session_model = SessionOptionModel(self._sessions, self)
         view.setModel(session_model)
         view.setSelectionModel(QItemSelectionModel(session_model, self))
-        view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        # 可以选中多个会话同时连接，右侧显示和编辑的是当前会话
+        view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         view.selectionModel().currentChanged.connect(self._onCurrentChanged)
         view.doubleClicked.connect(self._doConnect)
 
@@ -523,6 +524,15 @@ class DeviceManage(QDialog):
     def options(self):
         return self.sessionOption.data
 
+    @property
+    def selectedOptions(self) -> list:
+        "选中的所有会话，按列表中的顺序，当前会话使用编辑后的配置"
+        current = self._session_view.currentIndex().row()
+        rows = {index.row() for index in self._session_view.selectionModel().selectedRows()}
+        rows.add(current)
+        return [self.options if row == current else self.model.data(self.model.index(row, 0), Qt.ItemDataRole.UserRole)
+                for row in sorted(rows)]
+
     def _doConnect(self):
         index = self._session_view.currentIndex()
         log.debug('index: %d, %d', index.row(), index.column())
@@ -647,10 +647,8 @@ class FavoriteDockWidget(QWidget):
                 continue
             cxmls.append(self._treeview.getXml(index))
         if to_all:
-            ret = QMessageBox.question(self, "Execute All Sessions", "Do you want to execute seleted item to all connected session?",
-                                       QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
-            if ret == QMessageBox.Yes:
-                self.signals.executeAllRequest.emit(cxmls)
+            # 在执行窗口中选择会话后再开始
+            self.signals.executeAllRequest.emit(cxmls)
         else:
             self.signals.executeRequest.emit(cxmls)
 
@@ -777,7 +775,10 @@ class FavoritesEditor(QDialog):
     def _onExecuteXmlRequest(self):
         sw = self._cb_session.currentData()
         if sw and sw.connected:
-            resp = sw.setCommandXML(self._editor.toPlainText(), True)
+            sw.setCommandXML(self._editor.toPlainText(), True, self._onExecuteXmlDone)
+
+    def _onExecuteXmlDone(self, resp):
+        if resp:
             self._response.setXml(resp.xml)
 
     def _onFromatXml(self):
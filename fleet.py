@@ -0,0 +1,394 @@
+import time
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from PyQt5.QtWidgets import *
+from xmleditor import XmlEdit
+from utils import pretty_xml, millsecondToStr
+import logging
+
+log = logging.getLogger('netconftool.fleet')
+
+class FleetStatus(object):
+    Waiting = 'Waiting'
+    Running = 'Running'
+    Done = 'Done'
+    Error = 'RPC error'
+    Failed = 'Failed'
+    Skipped = 'Skipped'
+
+_statusColor = {
+    FleetStatus.Running: Qt.GlobalColor.blue,
+    FleetStatus.Done: Qt.GlobalColor.darkGreen,
+    FleetStatus.Error: Qt.GlobalColor.darkRed,
+    FleetStatus.Failed: Qt.GlobalColor.red,
+    FleetStatus.Skipped: Qt.GlobalColor.gray,
+}
+
+class FleetDevice(object):
+    "一个会话的下发进度及结果"
+    def __init__(self, session, count: int) -> None:
+        self.session = session
+        self.name = session.displayName
+        self.checked = True
+        self.status = FleetStatus.Waiting
+        self.count = count       # 需要下发的请求数
+        self.next = 0            # 下一个要发送的请求的序号
+        self.errors = 0          # 应答中带rpc-error的请求数
+        self.failed = False      # 有请求没有收到应答，剩下的请求不再发送
+        self.latency = None      # 最近一个请求的耗时(ms)
+        self.replies = []        # [(请求序号, 应答xml或失败原因)]
+
+    @property
+    def brief(self):
+        if not self.replies:
+            return ""
+        reply = ' '.join(str(self.replies[-1][1]).split())
+        if reply.startswith('<?xml'):
+            reply = reply.split('?>', 1)[-1].strip()
+        return reply[:97] + '...' if len(reply) > 100 else reply
+
+class FleetModel(QAbstractItemModel):
+    def __init__(self, parent: QObject = None) -> None:
+        super().__init__(parent)
+        self._devices = []
+        self._editable = True
+        self.horizontalHeader = ['Session', 'Status', 'Progress', 'Latency', 'Reply']
+
+    def rowCount(self, parent: QModelIndex = ...) -> int:
+        return len(self._devices)
+
+    def columnCount(self, parent: QModelIndex = ...) -> int:
+        return len(self.horizontalHeader)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = ...):
+        if role == Qt.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.horizontalHeader[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index: QModelIndex, role: int = ...):
+        if not index.isValid():
+            return QVariant()
+        dev = self._devices[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole or role == Qt.ToolTipRole:
+            if column == 0:
+                return dev.name
+            if column == 1:
+                return dev.status
+            if column == 2:
+                return "%d/%d" % (len(dev.replies), dev.count)
+            if column == 3:
+                return millsecondToStr(dev.latency) if dev.latency is not None else '-'
+            if column == 4:
+                return dev.brief
+        if role == Qt.UserRole:
+            # 排序使用原始数值
+            if column == 2:
+                return len(dev.replies)
+            if column == 3:
+                return dev.latency if dev.latency is not None else -1
+            return self.data(index, Qt.DisplayRole)
+        if role == Qt.CheckStateRole and column == 0:
+            return Qt.Checked if dev.checked else Qt.Unchecked
+        if role == Qt.ForegroundRole and column == 1 and dev.status in _statusColor:
+            return QBrush(QColor(_statusColor[dev.status]))
+        return QVariant()
+
+    def setData(self, index: QModelIndex, value, role: int = ...) -> bool:
+        if role == Qt.CheckStateRole and index.column() == 0 and self._editable:
+            self._devices[index.row()].checked = value == Qt.Checked
+            self.dataChanged.emit(index, index)
+            return True
+        return False
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        flags = super().flags(index)
+        if index.column() == 0 and self._editable:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def index(self, row: int, column: int, parent: QModelIndex = ...) -> QModelIndex:
+        if (row < 0 or row >= len(self._devices)) or (column < 0 or column >= len(self.horizontalHeader)):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, child: QModelIndex) -> QModelIndex:
+        return QModelIndex()
+
+    def setDevices(self, devices: list):
+        self.beginResetModel()
+        self._devices = devices
+        self._editable = True
+        self.endResetModel()
+
+    def setEditable(self, editable: bool):
+        "开始下发后不能再勾选会话"
+        self._editable = editable
+
+    def device(self, row: int) -> FleetDevice:
+        return self._devices[row]
+
+    def devices(self) -> list:
+        return self._devices
+
+    def deviceChanged(self, row: int):
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.horizontalHeader) - 1))
+
+class FleetExecutor(QObject):
+    """向多个会话下发一组请求：
+    同时最多parallel个会话在下发，每个会话收到上一个请求的应答后再发送下一个，保持请求顺序"""
+    deviceChanged = pyqtSignal(int)
+    finished = pyqtSignal()
+
+    def __init__(self, model: FleetModel, cxmls: list, parent: QObject = None) -> None:
+        super().__init__(parent)
+        self._model = model
+        self._cxmls = cxmls
+        self._parallel = 1
+        self._queue = []
+        self._running = 0
+        self._stopped = False
+        # 对话框关闭后为True，见detach
+        self._detached = False
+
+    def start(self, parallel: int):
+        self._parallel = max(1, parallel)
+        self._stopped = False
+        self._queue = []
+        for row, dev in enumerate(self._model.devices()):
+            if dev.checked:
+                self._queue.append(row)
+            else:
+                dev.status = FleetStatus.Skipped
+                self.deviceChanged.emit(row)
+        self._fill()
+
+    def stop(self):
+        "不再发送新的请求，正在等待的应答仍会记录"
+        self._stopped = True
+        for row in self._queue:
+            self._model.device(row).status = FleetStatus.Skipped
+            self.deviceChanged.emit(row)
+        self._queue = []
+        if self._running == 0:
+            self.finished.emit()
+
+    def detach(self):
+        """对话框关闭时调用：不再发送新的请求，之后到达的应答直接丢弃，
+        不再访问模型和信号，它们会随对话框一起被删除"""
+        self._detached = True
+        self._stopped = True
+        self._queue = []
+
+    @property
+    def running(self) -> bool:
+        return self._running > 0 or len(self._queue) > 0
+
+    def _fill(self):
+        if self._detached:
+            return
+        while self._queue and self._running < self._parallel:
+            row = self._queue.pop(0)
+            self._running += 1
+            self._model.device(row).status = FleetStatus.Running
+            self.deviceChanged.emit(row)
+            self._sendNext(row)
+        if self._running == 0 and not self._queue:
+            self.finished.emit()
+
+    def _sendNext(self, row: int):
+        dev = self._model.device(row)
+        if self._stopped or dev.failed or dev.next >= dev.count:
+            if dev.status == FleetStatus.Running:
+                if dev.errors:
+                    dev.status = FleetStatus.Error
+                elif dev.next >= dev.count:
+                    dev.status = FleetStatus.Done
+                else:
+                    dev.status = FleetStatus.Skipped
+            self.deviceChanged.emit(row)
+            self._running -= 1
+            # 会话不可用时应答回调是同步调用的，下一个会话放到事件循环中启动，避免递归过深
+            QTimer.singleShot(0, self._fill)
+            return
+
+        cxml = self._cxmls[dev.next]
+        seq = dev.next
+        dev.next += 1
+        self.deviceChanged.emit(row)
+        start = time.monotonic()
+        try:
+            if not dev.session.connected:
+                return self._onReply(row, seq, start, None, "Session is not connected.")
+            if not dev.session.sessionOperable:
+                # 会话正在执行其他请求，请求不会发出，会话日志中也没有记录
+                return self._onReply(row, seq, start, None, "Session is busy.")
+            dev.session.setCommandXML(cxml, True,
+                                      lambda resp: self._onReply(row, seq, start, resp,
+                                                                 "Request failed, see the log of the session."))
+        except RuntimeError:
+            # 会话已被关闭
+            self._onReply(row, seq, start, None, "Session was closed.")
+
+    def _onReply(self, row: int, seq: int, start: float, resp, reason: str):
+        if self._detached:
+            return
+        dev = self._model.device(row)
+        dev.latency = int((time.monotonic() - start) * 1000)
+        if resp is None:
+            # 详细原因记录在会话的日志中
+            dev.failed = True
+            dev.status = FleetStatus.Failed
+            dev.replies.append((seq, reason))
+            return self._sendNext(row)
+        if resp.error:
+            dev.errors += 1
+        dev.replies.append((seq, resp.xml))
+        self._sendNext(row)
+
+class FleetDialog(QDialog):
+    "将选中的请求同时下发到多个会话，并显示各会话的结果"
+    def __init__(self, sessions: list, cxmls: list, appdata=None, parent=None,
+                 flags=Qt.Window | Qt.WindowCloseButtonHint) -> None:
+        super().__init__(parent, flags)
+        self.setWindowTitle("Execute to Sessions")
+        self.setWindowIcon(QIcon(':/res/sent.png'))
+        self.setAttribute(Qt.WA_DeleteOnClose, True)
+        self._appdata = appdata
+        self._cxmls = cxmls
+        self._model = FleetModel(self)
+        self._model.setDevices([FleetDevice(sw, len(cxmls)) for sw in sessions])
+        self._executor = FleetExecutor(self._model, cxmls, self)
+        self._executor.deviceChanged.connect(self._onDeviceChanged)
+        self._executor.finished.connect(self._onFinished)
+        self._initUI()
+        self._updateSummary()
+
+    def _initUI(self):
+        view = QTableView(self)
+        view.setStyleSheet("QTableView::item{padding-left:10px;padding-right:10px;}")
+        view.horizontalHeader().setDefaultAlignment(Qt.AlignmentFlag.AlignCenter)
+        view.setAlternatingRowColors(True)
+        view.horizontalHeader().setStretchLastSection(True)
+        view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        view.setSortingEnabled(True)
+
+        proxy_model = QSortFilterProxyModel(self)
+        proxy_model.setSourceModel(self._model)
+        proxy_model.setSortRole(Qt.UserRole)
+        view.setModel(proxy_model)
+        view.sortByColumn(-1, Qt.AscendingOrder)
+        view.selectionModel().currentChanged.connect(self._onCurrentChanged)
+        view.resizeColumnsToContents()
+
+        preview = XmlEdit(self)
+        preview.setReadOnly(True)
+
+        splitter = QSplitter(Qt.Orientation.Vertical, self)
+        splitter.addWidget(view)
+        splitter.addWidget(preview)
+        splitter.setStretchFactor(0, 2)
+        splitter.setStretchFactor(1, 1)
+
+        parallel = QSpinBox(self)
+        parallel.setRange(1, 256)
+        parallel.setValue(self._appdata.ui_fleet_parallel if self._appdata else 16)
+        parallel.setToolTip("Maximum number of sessions executing at the same time")
+
+        summary = QLabel(self)
+        bt_start = QPushButton("Start", self)
+        bt_start.setDefault(True)
+        bt_start.clicked.connect(self._onStart)
+        bt_stop = QPushButton("Stop", self)
+        bt_stop.setEnabled(False)
+        bt_stop.clicked.connect(self._onStop)
+        bt_close = QPushButton("Close", self)
+        bt_close.clicked.connect(self.close)
+
+        top_layout = QHBoxLayout()
+        top_layout.addWidget(QLabel("%d request(s) to %d session(s), in parallel:" %
+                                    (len(self._cxmls), self._model.rowCount()), self))
+        top_layout.addWidget(parallel)
+        top_layout.addStretch(1)
+
+        bottom_layout = QHBoxLayout()
+        bottom_layout.addWidget(summary, 1)
+        bottom_layout.addWidget(bt_start)
+        bottom_layout.addWidget(bt_stop)
+        bottom_layout.addWidget(bt_close)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(top_layout)
+        layout.addWidget(splitter, 1)
+        layout.addLayout(bottom_layout)
+        self.resize(900, 600)
+
+        self.view = view
+        self._proxy_model = proxy_model
+        self._preview = preview
+        self._parallel = parallel
+        self._summary = summary
+        self._bt_start = bt_start
+        self._bt_stop = bt_stop
+
+    def _onStart(self):
+        self._bt_start.setEnabled(False)
+        self._bt_stop.setEnabled(True)
+        self._parallel.setEnabled(False)
+        self._model.setEditable(False)
+        if self._appdata:
+            self._appdata.ui_fleet_parallel = self._parallel.value()
+        log.info("execute %d request(s) to %d session(s), %d in parallel", len(self._cxmls),
+                 self._model.rowCount(), self._parallel.value())
+        self._executor.start(self._parallel.value())
+
+    def _onStop(self):
+        self._bt_stop.setEnabled(False)
+        self._executor.stop()
+
+    def _onFinished(self):
+        self._bt_stop.setEnabled(False)
+        self._updateSummary()
+
+    def _onDeviceChanged(self, row: int):
+        self._model.deviceChanged(row)
+        self._updateSummary()
+        current = self._proxy_model.mapToSource(self.view.currentIndex())
+        if current.isValid() and current.row() == row:
+            self._updatePreview(row)
+
+    def _updateSummary(self):
+        counts = {}
+        for dev in self._model.devices():
+            counts[dev.status] = counts.get(dev.status, 0) + 1
+        self._summary.setText(', '.join(f'{status}: {counts[status]}' for status in
+                                        [FleetStatus.Waiting, FleetStatus.Running, FleetStatus.Done,
+                                         FleetStatus.Error, FleetStatus.Failed, FleetStatus.Skipped]
+                                        if counts.get(status)))
+
+    def _onCurrentChanged(self, index: QModelIndex):
+        index = self._proxy_model.mapToSource(index)
+        if index.isValid():
+            self._updatePreview(index.row())
+
+    def _updatePreview(self, row: int):
+        dev = self._model.device(row)
+        text = []
+        for seq, reply in dev.replies:
+            text.append(f'<!-- [{seq + 1}/{dev.count}] {dev.name} -->')
+            text.append(pretty_xml(reply))
+        self._preview.setXml('\n'.join(text), False)
+
+    def closeEvent(self, ev: QCloseEvent):
+        if self._executor.running:
+            ans = QMessageBox.question(self, "Execute to Sessions",
+                                       "Requests are still being executed, stop and close?",
+                                       QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if ans != QMessageBox.Yes:
+                ev.ignore()
+                return
+        # 对话框关闭后会被删除，正在等待的应答到达时不再处理
+        self._executor.detach()
+        super().closeEvent(ev)
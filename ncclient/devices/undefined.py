@@ -0,0 +1,44 @@
+"""
+Handler for devices without a specific handler, as used by NetconfTool.
+
+Note that for proper import, the classname has to be:
+
+    "<Devicename>DeviceHandler"
+
+...where <Devicename> is something like "Default", "Undefined", etc.
+
+All device-specific handlers derive from the DefaultDeviceHandler, which implements the
+generic information needed for interaction with a Netconf server.
+
+"""
+
+from .default import DefaultDeviceHandler
+from ncclient.xml_ import BASE_NS_1_0
+
+
+class UndefinedDeviceHandler(DefaultDeviceHandler):
+    """
+    Undefined handler for device specific information.
+
+    Requests are sent with the base namespace as the default namespace, so
+    elements of a request without a namespace of their own are in it.
+
+    In the device_params dictionary, which is passed to __init__, you can specify
+    the parameter "ssh_subsystem_name". That allows you to configure the preferred
+    SSH subsystem name that should be tried on your Undefined switch. If connecting with
+    that name fails, or you didn't specify that name, the other known subsystem names
+    will be tried. However, if you specify it then this name will be tried first.
+
+    """
+    _EXEMPT_ERRORS = []
+
+    def __init__(self, device_params):
+        super(UndefinedDeviceHandler, self).__init__(device_params)
+
+    def get_xml_base_namespace_dict(self):
+        return {None: BASE_NS_1_0}
+
+    def get_xml_extra_prefix_kwargs(self):
+        d = {}
+        d.update(self.get_xml_base_namespace_dict())
+        return {"nsmap": d}
@@ -23,6 +23,8 @@ from ncclient import transport
 import socket
 import logging
 import functools
+import contextlib
+from concurrent.futures import Future
 
 from ncclient.xml_ import *
 
@@ -123,6 +125,17 @@ def connect_ssh(*args, **kwds):
     A custom device handler can be provided with
     `device_params={'handler':<handler class>}` in connection parameters.
 
+    To run the session in a shared thread instead of a thread of its own, pass a
+    :class:`~ncclient.transport.SessionReactor` as `reactor`.
+
+    To open the session on a new channel of the SSH connection of another session instead
+    of connecting again, pass its :class:`Manager` (or :class:`~ncclient.transport.SSHSession`)
+    as `share_transport`; only `timeout` and `environment` of the other arguments are used,
+    see :meth:`~ncclient.transport.SSHSession.connect_channel`::
+
+        m1 = manager.connect_ssh("host", username="admin", password="admin")
+        m2 = manager.connect_ssh(share_transport=m1)
+
     """
     # Extract device/manager/netconf parameter dictionaries, if they were passed into this function.
     # Remove them from kwds (which should keep only session.connect() parameters).
@@ -130,13 +143,23 @@ def connect_ssh(*args, **kwds):
     manager_params = _extract_manager_params(kwds)
     nc_params = _extract_nc_params(kwds)
 
+    reactor = kwds.pop("reactor", None)
+    share = kwds.pop("share_transport", None)
+    if isinstance(share, Manager):
+        share = share._session
+
     device_handler = make_device_handler(device_params)
     device_handler.add_additional_ssh_connect_params(kwds)
     device_handler.add_additional_netconf_params(nc_params)
     session = transport.SSHSession(device_handler)
+    session.reactor = reactor
 
     try:
-       session.connect(*args, **kwds)
+        if share is not None:
+            session.connect_channel(share, timeout=kwds.get("timeout"),
+                                    environment=kwds.get("environment"))
+        else:
+            session.connect(*args, **kwds)
     except Exception as ex:
         if session.transport:
             session.close()
@@ -150,9 +173,12 @@ def connect_tls(*args, **kwargs):
     manager_params = _extract_manager_params(kwargs)
     nc_params = _extract_nc_params(kwargs)
 
+    reactor = kwargs.pop("reactor", None)
+
     device_handler = make_device_handler(device_params)
     device_handler.add_additional_netconf_params(nc_params)
     session = transport.TLSSession(device_handler)
+    session.reactor = reactor
 
     session.connect(*args, **kwargs)
 
@@ -199,6 +225,51 @@ def call_home(*args, **kwds):
     kwds['sock'] = sock
     return connect_ssh(*args, **kwds)
 
+async def connect_ssh_async(*args, **kwds):
+    """Initialize an :class:`AsyncManager` over SSH, from a coroutine.
+    For documentation of arguments see :meth:`ncclient.transport.AsyncSSHSession.connect`,
+    `device_params`, `manager_params` and `nc_params` are handled as by :func:`connect_ssh`.
+
+    The session runs as a task of the running event loop, no thread is started for it."""
+    device_params = _extract_device_params(kwds)
+    manager_params = _extract_manager_params(kwds)
+    nc_params = _extract_nc_params(kwds)
+
+    device_handler = make_device_handler(device_params)
+    device_handler.add_additional_ssh_connect_params(kwds)
+    device_handler.add_additional_netconf_params(nc_params)
+    session = transport.AsyncSSHSession(device_handler)
+
+    try:
+        await session.connect(*args, **kwds)
+    except Exception:
+        session.close()
+        raise
+    return AsyncManager(session, device_handler, **manager_params)
+
+
+async def connect_tls_async(*args, **kwds):
+    """Initialize an :class:`AsyncManager` over TLS, from a coroutine."""
+    device_params = _extract_device_params(kwds)
+    manager_params = _extract_manager_params(kwds)
+    nc_params = _extract_nc_params(kwds)
+
+    device_handler = make_device_handler(device_params)
+    device_handler.add_additional_netconf_params(nc_params)
+    session = transport.AsyncTLSSession(device_handler)
+
+    await session.connect(*args, **kwds)
+
+    return AsyncManager(session, device_handler, **manager_params)
+
+
+def _resolve_future(future, rpc):
+    if rpc.error is not None:
+        future.set_exception(rpc.error)
+    else:
+        future.set_result(rpc.reply)
+
+
 class Manager(object):
 
     """
@@ -231,6 +302,7 @@ class Manager(object):
         self._timeout = timeout
         self._raise_mode = operations.RaiseMode.ALL
         self._huge_tree = self.HUGE_TREE_DEFAULT
+        self._reply_sink = None
         self._device_handler = device_handler
         self._vendor_operations = {}
         if device_handler:
@@ -253,13 +325,73 @@ class Manager(object):
         assert(mode in (operations.RaiseMode.NONE, operations.RaiseMode.ERRORS, operations.RaiseMode.ALL))
         self._raise_mode = mode
 
-    def execute(self, cls, *args, **kwds):
+    def _make_rpc(self, cls, async_mode=None):
         return cls(self._session,
                    device_handler=self._device_handler,
-                   async_mode=self._async_mode,
+                   async_mode=self._async_mode if async_mode is None else async_mode,
                    timeout=self._timeout,
                    raise_mode=self._raise_mode,
-                   huge_tree=self._huge_tree).request(*args, **kwds)
+                   huge_tree=self._huge_tree,
+                   reply_sink=self._reply_sink)
+
+    def execute(self, cls, *args, **kwds):
+        return self._make_rpc(cls).request(*args, **kwds)
+
+    def _operation(self, name):
+        if name in self._vendor_operations:
+            return self._vendor_operations[name]
+        elif name in OPERATIONS:
+            return OPERATIONS[name]
+        raise ValueError("Unknown operation: %s" % name)
+
+    def pipeline(self, requests):
+        """Send several requests back to back without waiting for the replies in between, as
+        allowed by :rfc:`6241` section 4.1, and return a list of
+        :class:`concurrent.futures.Future` in message-id order.
+
+        Each of the *requests* is either an operation tuple `(name, args, kwargs)`, where `args`
+        and `kwargs` may be left out and *name* is a method name like `"edit_config"`, or an
+        element / XML string for the generic `rpc` operation::
+
+            futures = m.pipeline([
+                ("edit_config", (), {"target": "candidate", "config": cfg1}),
+                ("edit_config", (), {"target": "candidate", "config": cfg2}),
+                ("commit",),
+            ])
+            replies = [f.result(timeout=60) for f in futures]
+
+        All requests are framed into a single write. A future resolves to the
+        :class:`~ncclient.operations.RPCReply` of its request, or raises the error that prevented
+        the reply from being received. `rpc-error` replies are not raised, check
+        :attr:`~ncclient.operations.RPCReply.ok`.
+        """
+        batch = []
+        rpcs = []
+        try:
+            for item in requests:
+                if isinstance(item, tuple):
+                    name, args, kwds = item + ((), {})[len(item) - 1:]
+                    cls = self._operation(name)
+                else:
+                    cls, args, kwds = OPERATIONS["rpc"], (to_ele(item),), {}
+                rpc = self._make_rpc(cls, async_mode=True)
+                rpcs.append(rpc)
+                rpc._batch = batch
+                rpc.request(*args, **kwds)
+        except Exception:
+            # nothing of the batch is sent, forget the requests built so far
+            for rpc in rpcs:
+                rpc._listener.unregister(rpc.id)
+                self._session._pop_reply_sink(rpc.id)
+            raise
+        futures = []
+        for rpc in rpcs:
+            future = Future()
+            future.set_running_or_notify_cancel()
+            rpc.add_done_callback(functools.partial(_resolve_future, future))
+            futures.append(future)
+        self._session.send_many(batch)
+        return futures
 
     def locked(self, target):
         """Returns a context manager for a lock on a datastore, where
@@ -348,8 +480,12 @@ class Manager(object):
         """get timestamp of rpc send(type=0) or reply(type=1)"""
         return self._session.get_timestamp(msgid, type)
 
-    def get_tooktime(self, msgid: str):
-        "get tooktime in ms"
+    def get_tooktime(self, msgid):
+        """get tooktime in ms of the rpc with *msgid*, or of the :class:`~ncclient.operations.RPC`
+        itself, 0 if unknown"""
+        if isinstance(msgid, operations.RPC):
+            took = msgid.took
+            return int(took * 1000) if took is not None else 0
         timestamp_send = self._session.get_timestamp(msgid, 0)
         timestamp_recv = self._session.get_timestamp(msgid, 1)
         if timestamp_send and timestamp_recv:
@@ -357,6 +493,18 @@ class Manager(object):
         else:
             return 0
 
+    def metrics(self):
+        """Counters of the session as a dict: round-trip time percentiles and outcomes of the RPCs
+        by operation name under `rpcs`, bytes, frames and messages in and out, time spent parsing,
+        queue depths. See :meth:`~ncclient.transport.metrics.SessionMetrics.snapshot`"""
+        return self._session.metrics.snapshot()
+
+    @property
+    def metrics_labels(self):
+        """Labels (dict) added to those of the host and session-id to tell the session apart in the
+        exported metrics, see :class:`~ncclient.transport.openmetrics.MetricsExporter`"""
+        return self._session.metrics.labels
+
     @property
     def connected(self):
         """Whether currently connected to the NETCONF server."""
@@ -386,3 +534,150 @@ class Manager(object):
     @huge_tree.setter
     def huge_tree(self, x):
         self._huge_tree = x
+
+    @property
+    def spill_threshold(self):
+        """Size in bytes past which incoming replies are spilled from memory to a temporary file
+        (default=None, never). See :attr:`~ncclient.transport.Session.spill_threshold`"""
+        return self._session.spill_threshold
+
+    @spill_threshold.setter
+    def spill_threshold(self, x):
+        self._session.spill_threshold = x
+
+    @property
+    def notification_capacity(self):
+        """Most received notifications queued at once for :meth:`take_notification`
+        (default=None, no limit). See :class:`~ncclient.transport.NotificationQueue`"""
+        return self._session.notification_queue.capacity
+
+    @notification_capacity.setter
+    def notification_capacity(self, x):
+        self._session.notification_queue.configure(x)
+
+    @property
+    def notification_policy(self):
+        """What happens to notifications that arrive while the queue is full, one of the
+        constants of :class:`~ncclient.transport.NotificationPolicy`
+        (default=:attr:`~ncclient.transport.NotificationPolicy.DROP_OLDEST`)."""
+        return self._session.notification_queue.policy
+
+    @notification_policy.setter
+    def notification_policy(self, x):
+        queue = self._session.notification_queue
+        queue.configure(queue.capacity, x)
+
+    @property
+    def notification_stats(self):
+        """Counters of the notification queue: its `capacity`, `policy` and current `size`,
+        the `high_water` mark and the number of notifications `received` and `dropped`."""
+        return self._session.notification_queue.stats()
+
+    @property
+    def reply_sink(self):
+        """Where replies are streamed to while they arrive instead of being assembled as a string
+        (default=None). See :attr:`~ncclient.operations.RPC.reply_sink`"""
+        return self._reply_sink
+
+    @reply_sink.setter
+    def reply_sink(self, x):
+        self._reply_sink = x
+
+
+def _wake(waiter, rpc):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class AsyncManager(Manager):
+
+    """
+    :class:`Manager` for an :class:`~ncclient.transport.AsyncSession`, to be used from coroutines
+    running in the event loop of the session. Operations are awaited::
+
+        async with await manager.connect_ssh_async("host", username="admin") as m:
+            reply = await m.get_config(source="running")
+            await m.edit_config(target="running", config=config)
+
+    Received notifications can be iterated over::
+
+        await m.create_subscription()
+        async for notification in m.notifications():
+            print(notification.notification_xml)
+
+    :attr:`timeout` applies to every operation, :attr:`async_mode` has no effect.
+    """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close_session()
+        return False
+
+    def __enter__(self):
+        raise TypeError("use 'async with' with %s" % self.__class__.__name__)
+
+    async def _wait(self, rpc, req):
+        import asyncio
+        # the reply is delivered by the reader task of the session, in this thread
+        waiter = asyncio.get_running_loop().create_future()
+        rpc.add_done_callback(functools.partial(_wake, waiter))
+        await self._session.drain()
+        try:
+            await asyncio.wait_for(waiter, self._timeout)
+        except asyncio.TimeoutError:
+            raise operations.TimeoutExpiredError('ncclient timed out while waiting for an rpc reply.')
+        return rpc._finish(req)
+
+    async def execute(self, cls, *args, **kwds):
+        rpc = self._make_rpc(cls, async_mode=True)
+        _, req = rpc.request(*args, **kwds)
+        return await self._wait(rpc, req)
+
+    async def pipeline(self, requests):
+        """Like :meth:`Manager.pipeline`, but returns :class:`asyncio.Future` objects."""
+        import asyncio
+        futures = Manager.pipeline(self, requests)
+        await self._session.drain()
+        return [asyncio.wrap_future(f) for f in futures]
+
+    async def close_session(self):
+        "Request graceful termination of the NETCONF session, and close the connection."
+        rpc = self._make_rpc(operations.CloseSession, async_mode=True)
+        try:
+            # CloseSession.request() would close the connection before the reply arrives
+            _, req = rpc._request(new_ele("close-session"))
+            return await self._wait(rpc, req)
+        finally:
+            self._session.close()
+            await self._session.wait_closed()
+
+    @contextlib.asynccontextmanager
+    async def locked(self, target):
+        """Returns an asynchronous context manager for a lock on a datastore, where
+        *target* is the name of the configuration datastore to lock, e.g.::
+
+            async with m.locked("running"):
+                # do your stuff
+        """
+        await self.lock(target)
+        try:
+            yield
+        finally:
+            await self.unlock(target)
+
+    async def take_notification(self, block=True, timeout=None):
+        """Attempt to retrieve one notification from the queue of received notifications, see
+        :meth:`Manager.take_notification`. Returns `None` once the session is closed."""
+        if not block:
+            return self._session.take_notification(False, None)
+        return await self._session.next_notification(timeout)
+
+    async def notifications(self):
+        "Asynchronous iterator over the notifications received, which ends when the session is closed."
+        while True:
+            notification = await self._session.next_notification()
+            if notification is None:
+                return
+            yield notification
@@ -12,12 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
 from threading import Event, Lock
 from uuid import uuid4
 
+from ncclient import tracing
 from ncclient.xml_ import *
 from ncclient.logging_ import SessionLoggerAdapter
 from ncclient.transport import SessionListener
+from ncclient.transport.stream import ReplySink, make_sink
 from ncclient.operations import util
 from ncclient.operations.errors import OperationError, TimeoutExpiredError, MissingCapabilityError
 
@@ -132,7 +135,9 @@ class RPCReply(object):
 
     """Represents an *rpc-reply*. Only concerns itself with whether the operation was successful.
 
-    *raw*: the raw unparsed reply
+    *raw*: the raw unparsed reply, as a rule the :class:`~ncclient.xml_.ParsedMessage` the session
+    received, whose parsed tree the reply shares, or the :class:`~ncclient.transport.stream.ReplySink` it was
+    streamed into (see :attr:`RPC.reply_sink`), in which case :attr:`xml` is `None`
 
     *huge_tree*: parse XML with very deep trees and very long text content
 
@@ -144,7 +149,14 @@ class RPCReply(object):
     ERROR_CLS = RPCError
     "Subclasses can specify a different error class, but it should be a subclass of `RPCError`."
 
+    # set by RPC.deliver_reply to count the parse in the metrics of the session
+    _metrics = None
+    _operation = None
+
     def __init__(self, raw, huge_tree=False, parsing_error_transform=None):
+        self._stream = None
+        if isinstance(raw, ReplySink):
+            self._stream, raw = raw, None
         self._raw = raw
         self._parsing_error_transform = parsing_error_transform
         self._parsed = False
@@ -154,12 +166,21 @@ class RPCReply(object):
         self._huge_tree = huge_tree
 
     def __repr__(self):
+        if self._raw is None:
+            return '<%s streamed to %r>' % (self.__class__.__name__, self._stream)
         return self._raw
 
     def parse(self):
         "Parses the *rpc-reply*."
         if self._parsed: return
-        root = self._root = to_ele(self._raw, huge_tree=self._huge_tree) # The <rpc-reply> element
+        start = time.perf_counter()
+        if isinstance(self._raw, ParsedMessage):
+            # shared with whoever else looks at the message, see ParsedMessage
+            root = self._root = self._raw.element(self._huge_tree) # The <rpc-reply> element
+        elif self._stream is None:
+            root = self._root = to_ele(self._raw, huge_tree=self._huge_tree)
+        else:
+            root = self._root = self._stream.parse(self._huge_tree)
         # Per RFC 4741 an <ok/> tag is sent when there are no errors or warnings
         ok = root.find(qualify("ok"))
         if ok is None:
@@ -182,6 +203,10 @@ class RPCReply(object):
             self._parsing_hook(root)
 
         self._parsed = True
+        if self._metrics is not None:
+            self._metrics.parsed(time.perf_counter() - start)
+            if self._errors:
+                self._metrics.rpc_error(self._operation)
 
     def _parsing_hook(self, root):
         "No-op by default. Gets passed the *root* element for the reply."
@@ -195,7 +220,11 @@ class RPCReply(object):
                     msg.append(f"<{root_localname}><{localname}>{child.text}</{localname}></{root_localname}>")
                 traverse(child, msg)
 
-        if "�" in self._raw:
+        if self._stream is not None:
+            replaced = self._stream.replaced
+        else:
+            replaced = "�" in self._raw
+        if replaced:
             tags=[]
             traverse(root, tags)
             self._non_utf8_tags = tags
@@ -205,9 +234,22 @@ class RPCReply(object):
 
     @property
     def xml(self):
-        "*rpc-reply* element as returned."
+        "*rpc-reply* element as returned, `None` if the reply was streamed."
         return self._raw
 
+    @property
+    def root(self):
+        "*rpc-reply* element, parsed on first access."
+        self.parse()
+        return self._root
+
+    @property
+    def path(self):
+        "Path of the file the reply was streamed to, or `None`."
+        if self._stream is None:
+            return None
+        return self._stream.path
+
     @property
     def ok(self):
         "Boolean value indicating if there were no errors."
@@ -235,7 +277,11 @@ class RPCReply(object):
 
 class RPCReplyListener(SessionListener): # internal use
 
+    """Delivers each *rpc-reply* to the :class:`RPC` registered for its message-id.
+    The session routes replies to it directly, see :meth:`route`."""
+
     creation_lock = Lock()
+    receives_replies = False
 
     # one instance per session -- maybe there is a better way??
     def __new__(cls, session, device_handler):
@@ -247,43 +293,48 @@ class RPCReplyListener(SessionListener): # internal use
                 instance._id2rpc = {}
                 instance._device_handler = device_handler
                 #instance._pipelined = session.can_pipeline
-                session.add_listener(instance)
                 instance.logger = SessionLoggerAdapter(logger,
                                                        {'session': session})
+                session.add_listener(instance)
+                session._set_reply_router(instance)
             return instance
 
     def register(self, id, rpc):
         with self._lock:
             self._id2rpc[id] = rpc
 
-    def callback(self, root, raw):
+    def unregister(self, id):
+        "Forget the :class:`RPC` registered for *id*, for a request that is not going to be sent."
+        with self._lock:
+            self._id2rpc.pop(id, None)
+
+    def route(self, root, raw):
+        """Deliver the message to the corresponding RPC if it is an *rpc-reply*.
+        Returns `True` if it was delivered, `False` if it is not a reply."""
         tag, attrs = root
         if self._device_handler.perform_qualify_check():
             if tag != qualify("rpc-reply"):
-                return
-        if "message-id" not in attrs:
+                return False
+        id = attrs.get("message-id")  # get the msgid
+        if id is None:
             # required attribute so raise OperationError
             raise OperationError("Could not find 'message-id' attribute in <rpc-reply>")
-        else:
-            id = attrs["message-id"]  # get the msgid
-            with self._lock:
-                try:
-                    rpc = self._id2rpc[id]  # the corresponding rpc
-                    self.logger.debug("Delivering to %r", rpc)
-                    rpc.deliver_reply(raw)
-                except KeyError:
-                    raise OperationError("Unknown 'message-id': %s" % id)
-                # no catching other exceptions, fail loudly if must
-                else:
-                    # if no error delivering, can del the reference to the RPC
-                    del self._id2rpc[id]
+        # a single dict operation, atomic without taking the lock
+        rpc = self._id2rpc.pop(id, None)  # the corresponding rpc
+        if rpc is None:
+            raise OperationError("Unknown 'message-id': %s" % id)
+        self.logger.debug("Delivering to %r", rpc)
+        rpc.deliver_reply(raw) # no catching exceptions, fail loudly if must
+        return True
+
+    def callback(self, root, raw):
+        self.route(root, raw)
 
     def errback(self, err):
-        try:
-            for rpc in six.itervalues(self._id2rpc):
-                rpc.deliver_error(err)
-        finally:
-            self._id2rpc.clear()
+        with self._lock:
+            id2rpc, self._id2rpc = self._id2rpc, {}
+        for rpc in list(six.itervalues(id2rpc)):
+            rpc.deliver_error(err)
 
 
 class RaiseMode(object):
@@ -316,7 +367,7 @@ class RPC(object):
     "By default :class:`RPCReply`. Subclasses can specify a :class:`RPCReply` subclass."
 
 
-    def __init__(self, session, device_handler, async_mode=False, timeout=30, raise_mode=RaiseMode.NONE, huge_tree=False):
+    def __init__(self, session, device_handler, async_mode=False, timeout=30, raise_mode=RaiseMode.NONE, huge_tree=False, reply_sink=None):
         """
         *session* is the :class:`~ncclient.transport.Session` instance
 
@@ -329,6 +380,8 @@ class RPC(object):
         *raise_mode* specifies the exception raising mode, see :attr:`raise_mode`
 
         *huge_tree* parse xml with huge_tree support (e.g. for large text config retrieval), see :attr:`huge_tree`
+
+        *reply_sink* streams the reply while it arrives instead of assembling it as a string, see :attr:`reply_sink`
         """
         self._session = session
         try:
@@ -340,6 +393,7 @@ class RPC(object):
         self._timeout = timeout
         self._raise_mode = raise_mode
         self._huge_tree = huge_tree
+        self._reply_sink = reply_sink
         # self._id = uuid4().urn # Keeps things simple instead of having a class attr with running ID that has to be locked
         self._id = session.msg_id
         self._listener = RPCReplyListener(session, device_handler)
@@ -347,6 +401,12 @@ class RPC(object):
         self._reply = None
         self._error = None
         self._event = Event()
+        self._done_lock = Lock()
+        self._done_callbacks = []
+        self._batch = None # see Manager.pipeline
+        self._sent_time = None
+        self._received_time = None
+        self._operation = None # local name of the operation, see _request
         self._device_handler = device_handler
         self.logger = SessionLoggerAdapter(logger, {'session': session})
 
@@ -369,6 +429,19 @@ class RPC(object):
         """
         self.logger.info('Requesting %r', self.__class__.__name__)
         req = self._wrap(op)
+        self._operation = etree.QName(op).localname
+        if self._reply_sink is not None:
+            self._session.add_reply_sink(self._id, make_sink(self._reply_sink, self._id, self._huge_tree))
+        # stamped before it is queued, the reply may be delivered before send() returns
+        self._sent_time = time.time()
+        self._session._log_timestamp(self._id, 0, self._sent_time)
+        if tracing.tracer is not None:
+            tracing.tracer.instant('request', tracing.now(), session=self._session.id,
+                                   message_id=self._id, operation=self._operation, size=len(req))
+        if self._batch is not None:
+            # sent together with the rest of the batch by the caller
+            self._batch.append(req)
+            return self, req
         self._session.send(req)
         if self._async:
             self.logger.debug('Async request, returning %r', self)
@@ -377,27 +450,34 @@ class RPC(object):
             self.logger.debug('Sync request, will wait for timeout=%r', self._timeout)
             self._event.wait(self._timeout)
             if self._event.is_set():
-                if self._error:
-                    # Error that prevented reply delivery
-                    raise self._error
-                self._reply.parse()
-                if self._reply.error is not None and not self._device_handler.is_rpc_error_exempt(self._reply.error.message):
-                    # <rpc-error>'s [ RPCError ]
-
-                    if self._raise_mode == RaiseMode.ALL or (self._raise_mode == RaiseMode.ERRORS and self._reply.error.severity == "error"):
-                        errlist = []
-                        errors = self._reply.errors
-                        if len(errors) > 1:
-                            raise RPCError(to_ele(self._reply._raw), errs=errors)
-                        else:
-                            raise self._reply.error
-                if self._device_handler.transform_reply():
-                    return NCElement(self._reply, self._device_handler.transform_reply(), huge_tree=self._huge_tree), req
-                else:
-                    return self._reply, req
+                return self._finish(req)
             else:
+                self._session.metrics.rpc_timed_out(self._operation)
                 raise TimeoutExpiredError('ncclient timed out while waiting for an rpc reply.')
 
+    def _finish(self, req):
+        """Process the reply once :attr:`event` is set, as a synchronous :meth:`_request` does:
+        parses it and raises according to :attr:`raise_mode`, and returns the tuple of the reply
+        and *req*, the request sent."""
+        if self._error:
+            # Error that prevented reply delivery
+            raise self._error
+        self._reply.parse()
+        if self._reply.error is not None and not self._device_handler.is_rpc_error_exempt(self._reply.error.message):
+            # <rpc-error>'s [ RPCError ]
+
+            if self._raise_mode == RaiseMode.ALL or (self._raise_mode == RaiseMode.ERRORS and self._reply.error.severity == "error"):
+                errlist = []
+                errors = self._reply.errors
+                if len(errors) > 1:
+                    raise RPCError(self._reply._root, errs=errors)
+                else:
+                    raise self._reply.error
+        if self._device_handler.transform_reply():
+            return NCElement(self._reply, self._device_handler.transform_reply(), huge_tree=self._huge_tree), req
+        else:
+            return self._reply, req
+
     def request(self):
         """Subclasses must implement this method. Typically only the request needs to be built as an
         :class:`~xml.etree.ElementTree.Element` and everything else can be handed off to
@@ -413,7 +493,15 @@ class RPC(object):
 
     def deliver_reply(self, raw):
         # internal use
+        self._received_time = time.time()
+        tracer = tracing.tracer
+        if tracer is not None:
+            start = tracing.now()
+        metrics = self._session.metrics
+        if self._sent_time is not None:
+            metrics.rpc_done(self._operation, self._received_time - self._sent_time)
         self._reply = self.REPLY_CLS(raw, huge_tree=self._huge_tree)
+        self._reply._metrics, self._reply._operation = metrics, self._operation
 
         # Set the reply_parsing_error transform outside the constructor, to keep compatibility for
         # third party reply classes outside of ncclient
@@ -421,12 +509,38 @@ class RPC(object):
             self._device_handler.reply_parsing_error_transform(self.REPLY_CLS)
         )
 
-        self._event.set()
+        self._set_done()
+        if tracer is not None:
+            tracer.span('deliver_reply', start, tracing.now(), session=self._session.id,
+                        message_id=self._id, operation=self._operation,
+                        size=getattr(raw, 'size', None))
 
     def deliver_error(self, err):
         # internal use
         self._error = err
-        self._event.set()
+        if self._operation is not None:
+            self._session.metrics.rpc_failed(self._operation)
+        self._set_done()
+
+    def _set_done(self):
+        with self._done_lock:
+            self._event.set()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                self.logger.warning('error in done callback %r: %r', fn, e)
+
+    def add_done_callback(self, fn):
+        """Call *fn* with this RPC as its only argument once the reply has been received or an
+        error prevented it (see :attr:`event`). *fn* is called from the session thread, or at once
+        if that has already happened."""
+        with self._done_lock:
+            if not self._event.is_set():
+                self._done_callbacks.append(fn)
+                return
+        fn(self)
 
     @property
     def reply(self):
@@ -448,6 +562,23 @@ class RPC(object):
         "The *message-id* for this RPC."
         return self._id
 
+    @property
+    def sent_time(self):
+        "When the request was handed to the session to be sent, in seconds since the epoch, or `None`."
+        return self._sent_time
+
+    @property
+    def received_time(self):
+        "When the reply was received, in seconds since the epoch, or `None`."
+        return self._received_time
+
+    @property
+    def took(self):
+        "Seconds from sending the request to receiving the reply, `None` until both happened."
+        if self._sent_time is None or self._received_time is None:
+            return None
+        return self._received_time - self._sent_time
+
     @property
     def session(self):
         "The `~ncclient.transport.Session` object associated with this RPC."
@@ -493,6 +624,18 @@ class RPC(object):
     def huge_tree(self, x):
         self._huge_tree = x
 
+    @property
+    def reply_sink(self):
+        """Where the reply is streamed to while it arrives, `None` (the default) to assemble it as a
+        string. See :func:`~ncclient.transport.stream.make_sink` for the accepted values; `True`
+        builds the element tree incrementally, a path or file object receives the reply as is.
+        A streamed reply has no :attr:`RPCReply.xml`."""
+        return self._reply_sink
+
+    @reply_sink.setter
+    def reply_sink(self, x):
+        self._reply_sink = x
+
 class GenericRPC(RPC):
     """Generic rpc commands wrapper"""
     REPLY_CLS = RPCReply
@@ -0,0 +1,125 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timing of the stages a message goes through.
+
+The active :class:`Tracer` (none by default) is called at these stages,
+with times from :func:`now` in seconds and the arguments listed:
+
+=================  =======  ====================================================
+stage              kind     arguments
+=================  =======  ====================================================
+``request``        instant  session, message_id, operation, size
+``transport_read`` span     session, size (threaded sessions only)
+``frame_complete`` instant  session, size
+``parse_root``     span     size
+``parse_tree``     span     size
+``dispatch``       span     session, message_id, tag, size
+``deliver_reply``  span     session, message_id, operation, size
+``wait_reply``     span     message_id, replied (the GUI waiting for a reply)
+=================  =======  ====================================================
+
+*session* is the session-id, *size* a number of bytes. Spans of one message
+can be matched up by their *message_id*, those of the stages before the
+message is parsed by their time and thread. For example::
+
+    >>> from ncclient import tracing
+    >>> tracing.set_tracer(tracing.ChromeTracer('netconf.trace.json'))
+    ...
+    >>> tracing.set_tracer(None).close()
+
+and load the file in ``chrome://tracing`` or https://ui.perfetto.dev.
+
+The stages check :data:`tracer` and do nothing else while it is `None`.
+"""
+
+import json
+import os
+import threading
+import time
+
+now = time.perf_counter
+"Clock of the times passed to a :class:`Tracer`."
+
+tracer = None
+"The active :class:`Tracer`, `None` when tracing is off. See :func:`set_tracer`."
+
+
+def set_tracer(t):
+    "Make *t* (a :class:`Tracer`, or `None` to stop tracing) the active tracer, returns the previous one."
+    global tracer
+    previous, tracer = tracer, t
+    return previous
+
+
+class Tracer(object):
+
+    "Base class for tracers, which ignores everything it is told."
+
+    def span(self, stage, start, end, **args):
+        "*stage* took from *start* to *end*."
+        pass
+
+    def instant(self, stage, t, **args):
+        "*stage* happened at *t*."
+        pass
+
+    def close(self):
+        pass
+
+
+class ChromeTracer(Tracer):
+
+    """Writes the stages to *path* as JSON trace events (the "JSON Array
+    Format" of the Chrome trace event format), as they happen. The file is
+    complete once the tracer is closed, the trace viewers read it before
+    that too."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'w')
+        self._file.write('[')
+        self._sep = '\n'
+        self._pid = os.getpid()
+        self._threads = set()
+
+    def _write(self, event):
+        tid = threading.get_ident()
+        event['pid'] = self._pid
+        event['tid'] = tid
+        with self._lock:
+            if self._file is None:
+                return
+            if tid not in self._threads:
+                self._threads.add(tid)
+                self._file.write(self._sep + json.dumps({
+                    'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid,
+                    'args': {'name': threading.current_thread().name}}))
+                self._sep = ',\n'
+            self._file.write(self._sep + json.dumps(event, default=str))
+            self._sep = ',\n'
+
+    def span(self, stage, start, end, **args):
+        self._write({'name': stage, 'cat': 'ncclient', 'ph': 'X',
+                     'ts': start * 1e6, 'dur': (end - start) * 1e6, 'args': args})
+
+    def instant(self, stage, t, **args):
+        self._write({'name': stage, 'cat': 'ncclient', 'ph': 'i', 's': 't',
+                     'ts': t * 1e6, 'args': args})
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write('\n]\n')
+            self._file.close()
+            self._file = None
@@ -17,6 +17,10 @@
 from ncclient.transport.session import Session, SessionListener, NetconfBase
 from ncclient.transport.ssh import SSHSession
 from ncclient.transport.tls import TLSSession
+from ncclient.transport.reactor import SessionReactor, ReactorPool
+from ncclient.transport.stream import ReplySink, TreeSink, FileSink
+from ncclient.transport.notify import NotificationPolicy, NotificationQueue
+from ncclient.transport.metrics import SessionMetrics
 from ncclient.transport.errors import *
 
 __all__ = [
@@ -24,6 +28,18 @@ __all__ = [
     'SessionListener',
     'SSHSession',
     'TLSSession',
+    'AsyncSession',
+    'AsyncSSHSession',
+    'AsyncTLSSession',
+    'SessionReactor',
+    'ReactorPool',
+    'ReplySink',
+    'TreeSink',
+    'FileSink',
+    'NotificationPolicy',
+    'NotificationQueue',
+    'SessionMetrics',
+    'MetricsExporter',
     'TransportError',
     'AuthenticationError',
     'SessionCloseError',
@@ -32,3 +48,20 @@ __all__ = [
     'SSHUnknownHostError'
 
 ]
+
+# imported on first use: asyncio and http.server cost more to import than
+# the rest of the transport layer, and most programs use neither
+_LAZY = {
+    'AsyncSession': 'ncclient.transport.asyncio_',
+    'AsyncSSHSession': 'ncclient.transport.asyncio_',
+    'AsyncTLSSession': 'ncclient.transport.asyncio_',
+    'MetricsExporter': 'ncclient.transport.openmetrics',
+}
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
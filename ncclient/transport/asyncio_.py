@@ -0,0 +1,461 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""NETCONF sessions driven by an :mod:`asyncio` event loop.
+
+The threaded sessions in :mod:`ncclient.transport.session` each run a thread
+with its own selector loop. The sessions here read from asyncio streams in a
+task of the running loop instead, so any number of them can share one thread.
+Framing, reply streaming and the routing of replies to their
+:class:`~ncclient.operations.RPC` are the same as for the threaded sessions.
+
+All methods must be called from the thread running the event loop.
+"""
+
+import asyncio
+import base64
+import getpass
+import struct
+import threading
+from io import BytesIO
+from ssl import SSLContext, SSLError, CERT_REQUIRED
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+from ncclient.capabilities import Capabilities
+from ncclient.logging_ import SessionLoggerAdapter
+from ncclient.xml_ import *
+from ncclient.transport.errors import AuthenticationError, SessionError, SessionCloseError, \
+    SSHError, SSHUnknownHostError, TLSError, TransportError
+from ncclient.transport.notify import Notification, NotificationPolicy, _check_config
+from ncclient.transport.parser import DefaultXMLParser
+from ncclient.transport.session import Session, SessionListener, HelloHandler
+from ncclient.transport.ssh import PORT_NETCONF_DEFAULT, BUF_SIZE, default_unknown_host_cb
+from ncclient.transport.tls import DEFAULT_TLS_NETCONF_PORT, DEFAULT_TLS_TIMEOUT
+
+import logging
+logger = logging.getLogger("ncclient.transport.asyncio_")
+
+
+class AsyncSession(Session):
+
+    """Base class for sessions that run as a task of the asyncio event loop.
+
+    Subclasses open the connection in :meth:`connect` and hand its stream reader
+    and writer to :meth:`_start`. Although derived from :class:`Session` for
+    the shared message handling, no thread is ever started.
+    """
+
+    def __init__(self, device_handler):
+        capabilities = Capabilities(device_handler.get_capabilities())
+        Session.__init__(self, capabilities)
+        self._host = None
+        self._reader = None
+        self._writer = None
+        self._task = None
+        self._buffer = BytesIO()
+        self._device_handler = device_handler
+        self._closing = threading.Event()
+        self._notification_q = AsyncNotificationQueue()
+        self.parser = DefaultXMLParser(self)
+        self.logger = SessionLoggerAdapter(logger, {'session': self})
+
+    def _dispatch_message(self, raw):
+        self.logger.info("Received message from host")
+        self.logger.debug("Received:\n%s", raw)
+        return super(AsyncSession, self)._dispatch_message(raw)
+
+    async def connect(self, *args, **kwds): # subclass implements
+        raise NotImplementedError
+
+    async def _start(self, reader, writer, timeout=60):
+        """Start reading from *reader* and exchange hello messages over
+        *reader* and *writer*, asyncio-style streams of bytes."""
+        self._reader = reader
+        self._writer = writer
+        self._connected = True
+        self._closing.clear()
+        try:
+            await self._post_connect(timeout)
+        except BaseException:
+            self.close()
+            raise
+        # for further upcoming RPC responses, vendor can chose their
+        # choice of parser. Say DOM or SAX
+        self.parser = self._device_handler.get_xml_parser(self)
+
+    async def _post_connect(self, timeout=60):
+        "Greeting stuff"
+        hello = asyncio.get_running_loop().create_future()
+        # callbacks
+        def ok_cb(id, capabilities):
+            if not hello.done():
+                hello.set_result((id, capabilities))
+        def err_cb(err):
+            if not hello.done():
+                hello.set_exception(err)
+        self.add_listener(AsyncNotificationHandler(self._notification_q))
+        listener = HelloHandler(ok_cb, err_cb)
+        self.add_listener(listener)
+        self.send(HelloHandler.build(self._client_capabilities, self._device_handler))
+        self.logger.debug('starting reader task')
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            self._id, self._server_capabilities = await asyncio.wait_for(hello, timeout)
+        except asyncio.TimeoutError:
+            raise SessionError("Capability exchange timed out")
+        finally:
+            self.remove_listener(listener)
+        self._select_base()
+
+    async def _run(self):
+        try:
+            while True:
+                data = await self._reader.read(BUF_SIZE)
+                if data:
+                    self._parse_received(data)
+                elif self._closing.is_set():
+                    # End of session, expected
+                    break
+                else:
+                    # End of session, unexpected
+                    raise SessionCloseError(self._buffer.getvalue())
+        except Exception as e:
+            self.logger.debug("Broke out of reader task, error=%r", e)
+            self._dispatch_error(e)
+            self.close()
+
+    def run(self):
+        raise SessionError("%s runs in the asyncio event loop" % self.__class__.__name__)
+
+    def send(self, message):
+        """Send the supplied *message* (xml string) to NETCONF server.
+
+        The message is handed to the transport at once, await :meth:`drain`
+        to wait until it can take more."""
+        if not self.connected:
+            raise TransportError('Not connected to NETCONF server')
+        self._writer.write(self._frame(message))
+
+    def send_many(self, messages):
+        """Send all the supplied *messages* (xml strings) to NETCONF server
+        back to back, framed into a single write."""
+        if not self.connected:
+            raise TransportError('Not connected to NETCONF server')
+        self.logger.debug('sending %d messages', len(messages))
+        self._writer.write(b"".join(self._frame(message) for message in messages))
+
+    async def drain(self):
+        "Wait until the transport has sent enough of the written data to take more."
+        await self._writer.drain()
+
+    def close(self):
+        self._closing.set()
+        self._connected = False
+        if self._writer is not None:
+            self._writer.close()
+        # wake up whoever is waiting for a notification
+        self._notification_q.put_nowait(None)
+
+    async def wait_closed(self):
+        "Wait until the connection has been closed and the reader task has ended."
+        if self._task is not None and self._task is not asyncio.current_task():
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def take_notification(self, block=False, timeout=None):
+        """Returns a received notification, or `None` if there is none. Never
+        blocks, see :meth:`next_notification`."""
+        try:
+            return self._notification_q.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+    async def next_notification(self, timeout=None):
+        """Wait up to *timeout* seconds (forever if `None`) for the next
+        notification. Returns `None` on timeout or once the session is closed."""
+        if not self._connected and self._notification_q.empty():
+            return None
+        try:
+            return await asyncio.wait_for(self._notification_q.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    @property
+    def host(self):
+        """Host this session is connected to, or None if not connected."""
+        return self._host
+
+
+class AsyncSSHSession(AsyncSession):
+
+    """Implements a :rfc:`6242` NETCONF session over SSH on top of
+    `asyncssh <https://asyncssh.readthedocs.io/>`_, which has to be installed
+    separately."""
+
+    def __init__(self, device_handler):
+        AsyncSession.__init__(self, device_handler)
+        self._conn = None
+        self._channel_id = None
+        self._channel_name = None
+
+    async def connect(
+            self,
+            host                = None,
+            port                = PORT_NETCONF_DEFAULT,
+            timeout             = None,
+            unknown_host_cb     = default_unknown_host_cb,
+            username            = None,
+            password            = None,
+            key_filename        = None,
+            allow_agent         = True,
+            hostkey_verify      = True,
+            hostkey_b64         = None,
+            look_for_keys       = True,
+            sock                = None,
+            keepalive           = None,
+            environment         = None):
+
+        """Connect via SSH and initialize the NETCONF session. The arguments are
+        those of :meth:`ncclient.transport.SSHSession.connect`, except that the
+        host key is checked against :file:`~/.ssh/known_hosts` (or
+        *hostkey_b64*) by asyncssh, and *unknown_host_cb* is only accepted
+        for compatibility with the device handlers that set it.
+
+        *timeout* applies to establishing the connection and to the exchange
+        of hello messages.
+        """
+        if asyncssh is None:
+            raise SSHError("AsyncSSHSession requires the asyncssh package")
+        if not (host or sock):
+            raise SSHError("Missing host or socket")
+
+        self._host = host
+        if username is None:
+            username = getpass.getuser()
+        if key_filename is None:
+            key_filenames = []
+        elif isinstance(key_filename, (str, bytes)):
+            key_filenames = [key_filename]
+        else:
+            key_filenames = list(key_filename)
+
+        options = dict(username=username, password=password, passphrase=password)
+        if key_filenames:
+            options['client_keys'] = key_filenames
+        elif not look_for_keys:
+            options['client_keys'] = ()
+        if not allow_agent:
+            options['agent_path'] = None
+        if not hostkey_verify:
+            options['known_hosts'] = None
+        elif hostkey_b64:
+            options['known_hosts'] = asyncssh.import_known_hosts(
+                '* %s %s\n' % (_key_type(hostkey_b64), hostkey_b64))
+        if keepalive:
+            options['keepalive_interval'] = keepalive
+        if sock is not None:
+            options['sock'] = sock
+
+        try:
+            self._conn = await asyncio.wait_for(
+                asyncssh.connect(host, port, **options), timeout)
+        except asyncio.TimeoutError:
+            raise SSHError("Could not open connection to %s:%s: timed out" % (host, port))
+        except asyncssh.HostKeyNotVerifiable as e:
+            raise SSHUnknownHostError(host, e.reason)
+        except asyncssh.PermissionDenied as e:
+            raise AuthenticationError(repr(e))
+        except (asyncssh.Error, OSError) as e:
+            raise SSHError("Could not open connection to %s:%s: %s" % (host, port, e))
+
+        subsystem_names = self._device_handler.get_ssh_subsystem_names()
+        for subname in subsystem_names:
+            try:
+                writer, reader, _ = await self._conn.open_session(
+                    subsystem=subname, env=environment or (), encoding=None)
+            except asyncssh.ChannelOpenError as e:
+                self.logger.info("%s (subsystem request rejected)", e)
+                handle_exception = self._device_handler.handle_connection_exceptions(self)
+                # Ignore the exception, since we continue to try the different
+                # subsystem names until we find one that can connect.
+                if not handle_exception:
+                    continue
+                raise SSHError("Could not open subsystem %s: %s" % (subname, e))
+            self._channel_name = "%s-subsystem" % subname
+            await self._start(reader, writer, timeout or 60)
+            return
+        self._conn.close()
+        raise SSHError("Could not open connection, possibly due to unacceptable"
+                       " SSH subsystem name.")
+
+    def close(self):
+        AsyncSession.close(self)
+        if self._conn is not None:
+            self._conn.close()
+
+    async def wait_closed(self):
+        await AsyncSession.wait_closed(self)
+        if self._conn is not None:
+            await self._conn.wait_closed()
+
+    @property
+    def transport(self):
+        "Underlying `asyncssh.SSHClientConnection`, or None if not connected."
+        return self._conn
+
+
+class AsyncTLSSession(AsyncSession):
+
+    "Implements a :rfc:`7589` NETCONF session over TLS on asyncio streams."
+
+    async def connect(self, host=None, port=DEFAULT_TLS_NETCONF_PORT,
+                      keyfile=None, certfile=None, ca_certs=None,
+                      protocol=None, check_hostname=True, server_hostname=None,
+                      timeout=DEFAULT_TLS_TIMEOUT):
+        """Establish NETCONF session via TLS. The arguments are those of
+        :meth:`ncclient.transport.TLSSession.connect`.
+
+        :raise TLSError if the connection can not be established.
+        """
+        if host is None:
+            raise TLSError('Missing host')
+        if certfile is None:
+            raise TLSError('Missing client certificate file')
+        if protocol is None:
+            raise TLSError('Missing TLS protocol')
+
+        ssl_context = SSLContext(protocol)
+        ssl_context.verify_mode = CERT_REQUIRED
+        ssl_context.check_hostname = check_hostname
+        try:
+            ssl_context.load_cert_chain(certfile=certfile, keyfile=keyfile)
+        except SSLError:
+            raise TLSError('Bad client private key / certificate pair')
+        except IOError:
+            raise TLSError('Private key / certificate pair not found')
+
+        if ca_certs:
+            try:
+                ssl_context.load_verify_locations(cafile=ca_certs)
+            except SSLError:
+                raise TLSError('Bad Certification Authority file')
+            except IOError:
+                raise TLSError('CA certificate file not found')
+
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(
+                host, port, ssl=ssl_context, server_hostname=server_hostname or host), timeout)
+        except SSLError:
+            raise TLSError("Unsuccessful TLS handshake with %s:%s" % (host, port))
+        except Exception:
+            raise TLSError("Could not connect to %s:%s" % (host, port))
+
+        self._host = host
+        await self._start(reader, writer, timeout)
+
+
+class AsyncNotificationQueue(asyncio.Queue):
+
+    """The :class:`asyncio.Queue` counterpart of
+    :class:`~ncclient.transport.notify.NotificationQueue`, with the same
+    capacity, policies and counters, except for
+    :attr:`~ncclient.transport.notify.NotificationPolicy.BLOCK`: the reader
+    task cannot wait for room while dispatching a message."""
+
+    POLICIES = (NotificationPolicy.DROP_OLDEST, NotificationPolicy.DROP_NEWEST)
+
+    def __init__(self, capacity=None, policy=NotificationPolicy.DROP_OLDEST):
+        # unbounded as far as asyncio.Queue knows, the capacity is applied by put_nowait
+        asyncio.Queue.__init__(self)
+        self._received = 0
+        self._dropped = 0
+        self._high_water = 0
+        self._capacity = None
+        self._policy = None
+        self.configure(capacity, policy)
+
+    def configure(self, capacity=None, policy=None):
+        "See :meth:`NotificationQueue.configure <ncclient.transport.notify.NotificationQueue.configure>`."
+        _check_config(capacity, policy, self.POLICIES)
+        self._capacity = capacity
+        if policy is not None:
+            self._policy = policy
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def policy(self):
+        return self._policy
+
+    def put_nowait(self, item):
+        """Queue *item*, or drop it or the oldest one if the queue is full.
+        The `None` put by :meth:`AsyncSession.close` to wake up readers is
+        always queued.
+
+        :return: `False` if *item* was dropped
+        """
+        if item is None:
+            asyncio.Queue.put_nowait(self, item)
+            return True
+        self._received += 1
+        while self._capacity is not None and self.qsize() >= self._capacity:
+            self._dropped += 1
+            if self._policy == NotificationPolicy.DROP_NEWEST:
+                return False
+            self.get_nowait()
+        asyncio.Queue.put_nowait(self, item)
+        self._high_water = max(self._high_water, self.qsize())
+        return True
+
+    def stats(self):
+        "See :meth:`NotificationQueue.stats <ncclient.transport.notify.NotificationQueue.stats>`."
+        return {
+            'capacity': self._capacity,
+            'policy': self._policy,
+            'size': self.qsize(),
+            'high_water': self._high_water,
+            'received': self._received,
+            'dropped': self._dropped,
+        }
+
+
+class AsyncNotificationHandler(SessionListener):
+
+    "Puts the notifications received into an :class:`AsyncNotificationQueue`."
+
+    receives_replies = False
+
+    def __init__(self, notification_q):
+        self._notification_q = notification_q
+
+    def callback(self, root, raw):
+        tag, _ = root
+        if tag == qualify('notification', NETCONF_NOTIFICATION_NS):
+            self._notification_q.put_nowait(Notification(raw))
+
+    def errback(self, _):
+        pass
+
+
+def _key_type(key_b64):
+    "Returns the key type named at the start of a public key blob in base64."
+    data = base64.b64decode(key_b64)
+    length, = struct.unpack('>I', data[:4])
+    return data[4:4 + length].decode('ascii')
@@ -0,0 +1,253 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Counters kept by every session.
+
+Each :class:`~ncclient.transport.Session` has a :class:`SessionMetrics` as
+its :attr:`~ncclient.transport.Session.metrics`, which the transport, the
+framing parser and the :class:`~ncclient.operations.RPC` update as messages
+go by. :meth:`SessionMetrics.snapshot` (or
+:meth:`~ncclient.manager.Manager.metrics`) returns them as a dict::
+
+    >>> m.metrics()['rpcs']['get-config']
+    {'count': 12, 'errors': 0, 'failures': 0, 'timeouts': 0,
+     'sum': 0.093, 'p50': 0.0065, 'p90': 0.0109, 'p99': 0.0149, 'max': 0.0149,
+     'buckets': [...]}
+
+Round-trip times are in seconds, from handing the request to the session
+until the reply is received.
+"""
+
+import math
+import time
+import weakref
+from threading import Lock
+
+_tracked = weakref.WeakSet() # of SessionMetrics, see tracked()
+
+
+def track(metrics):
+    "Add *metrics* to those returned by :func:`tracked` for as long as it exists."
+    _tracked.add(metrics)
+
+
+def tracked():
+    "Returns the :class:`SessionMetrics` of all the sessions that still exist."
+    return list(_tracked)
+
+
+class LatencyHistogram(object):
+
+    """Durations counted in logarithmic buckets, each :attr:`GROWTH` times
+    as wide as the one before, from :attr:`MIN` seconds up. Percentiles are
+    estimated from the bucket bounds, to within a fifth of their value.
+
+    Not thread safe, :class:`SessionMetrics` holds a lock while adding.
+    """
+
+    MIN = 1e-5
+    "Upper bound of the first bucket, in seconds."
+
+    GROWTH = 2 ** 0.25
+    "Ratio between the bounds of successive buckets."
+
+    BUCKETS = 128
+    "Number of buckets, the last one takes whatever is longer than the others."
+
+    def __init__(self):
+        self._counts = [0] * self.BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def bound(cls, i):
+        "Upper bound of bucket *i* in seconds, `inf` for the last one."
+        if i >= cls.BUCKETS - 1:
+            return float('inf')
+        return cls.MIN * cls.GROWTH ** i
+
+    def add(self, seconds):
+        if seconds <= self.MIN:
+            i = 0
+        else:
+            i = min(int(math.log(seconds / self.MIN, self.GROWTH)) + 1, self.BUCKETS - 1)
+        self._counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        "Estimated duration that a fraction *p* (0 to 1) of those added did not exceed, `None` if empty."
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(p * self.count)))
+        seen = 0
+        for i, n in enumerate(self._counts):
+            seen += n
+            if seen >= rank:
+                return min(self.bound(i), self.max)
+        return self.max
+
+    def buckets(self):
+        "List of (upper bound, cumulative count) of the buckets up to the last one used."
+        result = []
+        seen = 0
+        for i, n in enumerate(self._counts):
+            if seen == self.count:
+                break
+            seen += n
+            result.append((self.bound(i), seen))
+        return result
+
+
+class _RPCStats(object):
+
+    def __init__(self):
+        self.rtt = LatencyHistogram()
+        self.errors = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    def snapshot(self):
+        rtt = self.rtt
+        return {
+            'count': rtt.count,
+            'errors': self.errors,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'sum': rtt.sum,
+            'p50': rtt.percentile(0.5),
+            'p90': rtt.percentile(0.9),
+            'p99': rtt.percentile(0.99),
+            'max': rtt.max,
+            'buckets': rtt.buckets(),
+        }
+
+
+class SessionMetrics(object):
+
+    """Counters of a session: per operation round-trip times and outcomes,
+    bytes, frames and messages in each direction, time spent parsing, and
+    the depth of the send queue.
+
+    Replies are counted as *errors* when they are parsed, which happens as
+    soon as they arrive for synchronous requests but only when looked at
+    for asynchronous ones."""
+
+    def __init__(self, session):
+        self._session = session
+        self._lock = Lock()
+        self.labels = {}
+        "Labels that tell the session apart when exported, besides its host and session-id."
+        self._rpcs = {} # operation name -> _RPCStats
+        self.since = time.time()
+        # updated by the thread running the main loop of the session only
+        self.bytes_in = 0
+        self.frames_in = 0
+        self.messages_in = 0
+        # updated by whichever thread sends or parses, under the lock
+        self.bytes_out = 0
+        self.messages_out = 0
+        self.parse_seconds = 0.0
+        self.parses = 0
+        self.send_queue_max = 0
+
+    def _stats(self, operation):
+        # with self._lock held
+        stats = self._rpcs.get(operation)
+        if stats is None:
+            stats = self._rpcs[operation] = _RPCStats()
+        return stats
+
+    def received(self, nbytes):
+        "*nbytes* were read from the transport."
+        self.bytes_in += nbytes
+
+    def frame_received(self):
+        "A chunk (base:1.1) or a message (base:1.0) was delimited."
+        self.frames_in += 1
+
+    def message_received(self):
+        self.messages_in += 1
+
+    def sent(self, nbytes):
+        "A message was framed into *nbytes* to be sent."
+        with self._lock:
+            self.bytes_out += nbytes
+            self.messages_out += 1
+
+    def queued(self, depth):
+        "*depth* writes are waiting in the send queue."
+        with self._lock:
+            if depth > self.send_queue_max:
+                self.send_queue_max = depth
+
+    def parsed(self, seconds):
+        "*seconds* were spent parsing a message."
+        with self._lock:
+            self.parse_seconds += seconds
+            self.parses += 1
+
+    def rpc_done(self, operation, seconds):
+        "A reply to *operation* arrived *seconds* after the request was sent."
+        with self._lock:
+            self._stats(operation).rtt.add(seconds)
+
+    def rpc_error(self, operation):
+        "The reply to *operation* was parsed and holds an *rpc-error*."
+        with self._lock:
+            self._stats(operation).errors += 1
+
+    def rpc_failed(self, operation):
+        "An error prevented the reply to *operation* from being received."
+        with self._lock:
+            self._stats(operation).failures += 1
+
+    def rpc_timed_out(self, operation):
+        "No reply to *operation* was received in time by a synchronous request."
+        with self._lock:
+            self._stats(operation).timeouts += 1
+
+    def snapshot(self):
+        """Returns all the counters as a dict: *rpcs*, a dict of the counters
+        of each operation by name, and those of the session as a whole,
+        including the current depth of the send queue, the number of RPCs
+        waiting for a reply and the counters of the notification queue."""
+        session = self._session
+        with self._lock:
+            rpcs = dict((name, stats.snapshot()) for name, stats in self._rpcs.items())
+            bytes_out, messages_out = self.bytes_out, self.messages_out
+            parse_seconds, parses = self.parse_seconds, self.parses
+            send_queue_max = self.send_queue_max
+        router = session._reply_router
+        return {
+            'host': getattr(session, 'host', None),
+            'session_id': session.id,
+            'labels': dict(self.labels),
+            'since': self.since,
+            'connected': session.connected,
+            'rpcs': rpcs,
+            'bytes_in': self.bytes_in,
+            'bytes_out': bytes_out,
+            'frames_in': self.frames_in,
+            'frames_out': messages_out, # one chunk per message
+            'messages_in': self.messages_in,
+            'messages_out': messages_out,
+            'parse_seconds': parse_seconds,
+            'parses': parses,
+            'send_queue': session._q.qsize(),
+            'send_queue_max': send_queue_max,
+            'pending_rpcs': len(router._id2rpc) if router is not None else 0,
+            'notifications': session.notification_queue.stats(),
+        }
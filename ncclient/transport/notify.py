@@ -12,36 +12,131 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ncclient.xml_ import to_ele
+import time
+from collections import deque
+from threading import Condition
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+from ncclient.xml_ import to_ele, ParsedMessage
 from lxml import etree
 
+
+def _root_ele(raw):
+    "The root element of *raw*, shared with others if it is a ParsedMessage."
+    if isinstance(raw, ParsedMessage):
+        return raw.root
+    return to_ele(raw)
+
+
+SCAN_CHUNK = 128
+"Bytes fed at a time to the parser by :func:`scan_notification`."
+
+
+def scan_notification(raw):
+    """Returns the text of the *eventTime* and the local name of the event of
+    the *notification* in *raw*, parsing no further into the document than
+    that. Either is `None` if not found."""
+    data = raw.data if isinstance(raw, ParsedMessage) else raw.encode('UTF-8')
+    parser = etree.XMLPullParser(events=('start',))
+    root = event_time = None
+    # fed in small pieces, since every element parsed costs an event
+    for pos in range(0, len(data), SCAN_CHUNK):
+        parser.feed(data[pos:pos + SCAN_CHUNK])
+        for _, elm in parser.read_events():
+            if root is None:
+                root = elm
+            elif elm.getparent() is root:
+                if event_time is None and etree.QName(elm).localname == 'eventTime':
+                    event_time = elm
+                else:
+                    # the text of eventTime is complete once the next element starts
+                    return (event_time.text if event_time is not None else None,
+                            etree.QName(elm).localname)
+    return (event_time.text if event_time is not None else None), None
+
+
+def _children(root):
+    event_time = name = None
+    for elm in etree.ElementChildIterator(root):
+        localname = etree.QName(elm).localname
+        if localname == 'eventTime':
+            event_time = elm.text
+        else:
+            name = localname
+    return event_time, name
+
+
 class Notification(object):
+
+    """A *notification* as taken from the session. Only what is asked for is
+    parsed: :attr:`event_time` and :attr:`name` from the start of the
+    message, :attr:`notification_ele` from all of it."""
+
     def __init__(self, raw):
         self._raw = raw
-        self._root_ele = to_ele(raw)
+        self._root_ele = None
+        self._scanned = None
+        self._received = time.time()
+
+    def _scan(self):
+        if self._scanned is None:
+            if self._root_ele is not None:
+                self._scanned = _children(self._root_ele)
+            else:
+                self._scanned = scan_notification(self._raw)
+        return self._scanned
 
     @property
     def notification_ele(self):
+        if self._root_ele is None:
+            self._root_ele = _root_ele(self._raw)
         return self._root_ele
 
     @property
     def notification_xml(self):
         return self._raw
 
+    @property
+    def event_time(self):
+        return self._scan()[0]
+
+    @property
+    def name(self):
+        "Local name of the event."
+        return self._scan()[1]
+
+    @property
+    def received_time(self):
+        "When the notification was received, in seconds since the epoch."
+        return self._received
+
+
 class NotificationM(object):
+
+    """A lightweight record of a notification for display: its event time,
+    name and xml, the latter as a plain string. It is meant to be built off
+    the GUI thread, from a :class:`Notification` or the raw xml, and keeps
+    no element tree."""
+
+    __slots__ = ('_raw', '_eventTime', '_ntfname', '_received')
+
     def __init__(self, raw):
-        self._raw = raw
-        self._root_ele = to_ele(raw)
-        for elm in etree.ElementChildIterator(self._root_ele):
-            localname = etree.QName(elm).localname
-            if localname == 'eventTime':
-                self._eventTime = elm.text
-            else:
-                self._ntfname = localname
+        if isinstance(raw, Notification):
+            self._eventTime, self._ntfname = raw.event_time, raw.name
+            self._received = raw.received_time
+            raw = raw.notification_xml
+        else:
+            self._eventTime, self._ntfname = scan_notification(raw)
+            self._received = time.time()
+        self._raw = str(raw)
 
     @property
     def notification_ele(self):
-        return self._root_ele
+        "Parsed anew on every access."
+        return to_ele(self._raw)
 
     @property
     def notification_xml(self):
@@ -54,3 +149,147 @@ class NotificationM(object):
     @property
     def notifcaiton_name(self):
         return self._ntfname
+
+    @property
+    def received_time(self):
+        "When the notification was received, in seconds since the epoch."
+        return self._received
+
+
+class NotificationPolicy(object):
+    """
+    Define what a full :class:`NotificationQueue` does with a notification
+    that arrives.
+    """
+    DROP_OLDEST = 'drop-oldest'
+    "Drop the oldest notification queued to make room (the default)."
+
+    DROP_NEWEST = 'drop-newest'
+    "Drop the notification that arrives."
+
+    BLOCK = 'block'
+    """Wait until the reader takes a notification. The session reads nothing
+    from the transport meanwhile, replies included, so the device is slowed
+    down by the transport's flow control. With a
+    :class:`~ncclient.transport.SessionReactor` every session it serves waits."""
+
+    ALL = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+def _check_config(capacity, policy, policies=NotificationPolicy.ALL):
+    if capacity is not None and capacity < 1:
+        raise ValueError("capacity must be at least 1, or None: %r" % (capacity,))
+    if policy is not None and policy not in policies:
+        raise ValueError("unsupported notification policy: %r" % (policy,))
+
+
+class NotificationQueue(object):
+
+    """The queue the session puts received notifications into, to be taken
+    with :meth:`~ncclient.transport.Session.take_notification`.
+
+    It holds up to *capacity* notifications, any number if `None` (the
+    default); what happens to those that do not fit is up to *policy*, one
+    of the :class:`NotificationPolicy` constants. How many have been
+    received and dropped, and the most ever queued at once, are counted,
+    see :meth:`stats`.
+    """
+
+    WAIT = 0.1
+    "How often a put blocked by :attr:`NotificationPolicy.BLOCK` checks whether the session is closing."
+
+    def __init__(self, capacity=None, policy=NotificationPolicy.DROP_OLDEST):
+        self._items = deque()
+        self._cond = Condition()
+        self._received = 0
+        self._dropped = 0
+        self._high_water = 0
+        self._capacity = None
+        self._policy = None
+        self.configure(capacity, policy)
+
+    def configure(self, capacity=None, policy=None):
+        """Set the *capacity* and, unless `None`, the *policy*. Lowering the
+        capacity drops nothing until the next notification arrives."""
+        _check_config(capacity, policy)
+        with self._cond:
+            self._capacity = capacity
+            if policy is not None:
+                self._policy = policy
+            self._cond.notify_all()
+
+    @property
+    def capacity(self):
+        "Most notifications queued at once, `None` for no limit."
+        return self._capacity
+
+    @property
+    def policy(self):
+        "The :class:`NotificationPolicy` for when the queue is full."
+        return self._policy
+
+    def _full(self):
+        return self._capacity is not None and len(self._items) >= self._capacity
+
+    def put(self, item, closing=None):
+        """Queue *item*, or drop it or the oldest one if the queue is full.
+        With :attr:`NotificationPolicy.BLOCK` wait for room, unless the
+        :class:`~threading.Event` *closing* is set.
+
+        :return: `False` if *item* was dropped
+        """
+        with self._cond:
+            self._received += 1
+            # a loop, as the policy may be changed while waiting for room
+            while self._full():
+                if self._policy == NotificationPolicy.DROP_OLDEST:
+                    self._items.popleft()
+                    self._dropped += 1
+                elif self._policy == NotificationPolicy.DROP_NEWEST or \
+                        (closing is not None and closing.is_set()):
+                    self._dropped += 1
+                    return False
+                else:
+                    self._cond.wait(self.WAIT)
+            self._items.append(item)
+            if len(self._items) > self._high_water:
+                self._high_water = len(self._items)
+            self._cond.notify_all()
+            return True
+
+    def get(self, block=True, timeout=None):
+        """Take the oldest notification queued, like :meth:`queue.Queue.get`.
+
+        :raise: :exc:`queue.Empty` if there is none
+        """
+        with self._cond:
+            if block and not self._items:
+                self._cond.wait_for(lambda: self._items, timeout)
+            if not self._items:
+                raise Empty
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        """Returns a dict of the *capacity* and *policy*, the current *size*,
+        the *high_water* mark and the number of notifications *received* and
+        *dropped* so far."""
+        with self._cond:
+            return {
+                'capacity': self._capacity,
+                'policy': self._policy,
+                'size': len(self._items),
+                'high_water': self._high_water,
+                'received': self._received,
+                'dropped': self._dropped,
+            }
@@ -0,0 +1,223 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The :class:`~ncclient.transport.metrics.SessionMetrics` of all the open
+sessions in the OpenMetrics text format, over HTTP.
+
+::
+
+    >>> from ncclient.transport import MetricsExporter
+    >>> exporter = MetricsExporter(port=9464).start()
+    >>> m = manager.connect(host='r1', ...)
+    >>> m.metrics_labels['name'] = 'r1'
+
+after which ``http://127.0.0.1:9464/metrics`` can be scraped. Every sample
+is labelled with the *host* and *session_id* of its session, plus the
+:attr:`~ncclient.transport.metrics.SessionMetrics.labels` of the session.
+"""
+
+import logging
+from threading import Thread
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+from ncclient.transport.metrics import LatencyHistogram, tracked
+
+logger = logging.getLogger('ncclient.transport.openmetrics')
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+BUCKETS = [LatencyHistogram.bound(i) for i in range(12, 89, 4)]
+"Upper bounds of the exported RPC duration buckets: powers of 2 from 80us to 42s."
+
+# name, type, help, value of a snapshot, for the session as a whole
+SESSION_FAMILIES = [
+    ('netconf_connected', 'gauge', 'Whether the session is connected.',
+     lambda s: int(bool(s['connected']))),
+    ('netconf_received_bytes', 'counter', 'Bytes read from the transport.',
+     lambda s: s['bytes_in']),
+    ('netconf_sent_bytes', 'counter', 'Bytes of framed messages sent.',
+     lambda s: s['bytes_out']),
+    ('netconf_received_frames', 'counter', 'Chunks (base:1.1) or messages (base:1.0) delimited.',
+     lambda s: s['frames_in']),
+    ('netconf_received_messages', 'counter', 'Messages received.',
+     lambda s: s['messages_in']),
+    ('netconf_sent_messages', 'counter', 'Messages sent.',
+     lambda s: s['messages_out']),
+    ('netconf_parse_seconds', 'counter', 'Time spent parsing received messages.',
+     lambda s: s['parse_seconds']),
+    ('netconf_send_queue_depth', 'gauge', 'Writes waiting in the send queue.',
+     lambda s: s['send_queue']),
+    ('netconf_pending_rpcs', 'gauge', 'RPCs waiting for their reply.',
+     lambda s: s['pending_rpcs']),
+    ('netconf_notifications', 'counter', 'Notifications received.',
+     lambda s: s['notifications']['received']),
+    ('netconf_notifications_dropped', 'counter', 'Notifications dropped by a full queue.',
+     lambda s: s['notifications']['dropped']),
+    ('netconf_notification_queue_depth', 'gauge', 'Notifications waiting to be taken.',
+     lambda s: s['notifications']['size']),
+]
+
+# name, help, key of the counters of an operation
+RPC_COUNTERS = [
+    ('netconf_rpc_replies', 'Replies received.', 'count'),
+    ('netconf_rpc_errors', 'Replies holding an rpc-error, counted when parsed.', 'errors'),
+    ('netconf_rpc_failures', 'RPCs that an error prevented from being replied to.', 'failures'),
+    ('netconf_rpc_timeouts', 'Synchronous RPCs that timed out.', 'timeouts'),
+]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in labels.items())
+
+
+def _number(x):
+    if x == float('inf'):
+        return '+Inf'
+    return repr(x)
+
+
+def _cumulative(buckets, count, bound):
+    "Number of durations up to *bound* from the (upper bound, cumulative count) of a histogram."
+    seen = 0
+    for b, n in buckets:
+        if b > bound:
+            return seen
+        seen = n
+    return count
+
+
+def render(snapshots):
+    """Returns the *snapshots* (see :meth:`~ncclient.transport.metrics.SessionMetrics.snapshot`)
+    in the OpenMetrics text format."""
+    sessions = []
+    for s in snapshots:
+        labels = {'host': s['host'] or '', 'session_id': s['session_id'] or ''}
+        labels.update(s['labels'])
+        sessions.append((labels, s))
+    lines = []
+    for name, type_, help_, value in SESSION_FAMILIES:
+        lines.append('# TYPE %s %s' % (name, type_))
+        lines.append('# HELP %s %s' % (name, help_))
+        suffix = '_total' if type_ == 'counter' else ''
+        for labels, s in sessions:
+            lines.append('%s%s%s %s' % (name, suffix, _labels(labels), _number(value(s))))
+    for name, help_, key in RPC_COUNTERS:
+        lines.append('# TYPE %s counter' % name)
+        lines.append('# HELP %s %s' % (name, help_))
+        for labels, s in sessions:
+            for op, stats in sorted(s['rpcs'].items()):
+                lines.append('%s_total%s %d' % (name, _labels(dict(labels, operation=op)), stats[key]))
+    name = 'netconf_rpc_duration_seconds'
+    lines.append('# TYPE %s histogram' % name)
+    lines.append('# HELP %s Time from sending a request to receiving its reply.' % name)
+    lines.append('# UNIT %s seconds' % name)
+    for labels, s in sessions:
+        for op, stats in sorted(s['rpcs'].items()):
+            op_labels = dict(labels, operation=op)
+            for bound in BUCKETS:
+                lines.append('%s_bucket%s %d' % (name, _labels(dict(op_labels, le='%.6g' % bound)),
+                                                 _cumulative(stats['buckets'], stats['count'], bound)))
+            lines.append('%s_bucket%s %d' % (name, _labels(dict(op_labels, le='+Inf')), stats['count']))
+            lines.append('%s_count%s %d' % (name, _labels(op_labels), stats['count']))
+            lines.append('%s_sum%s %s' % (name, _labels(op_labels), _number(stats['sum'])))
+    lines.append('# EOF\n')
+    return '\n'.join(lines)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        try:
+            body = render(self.server.exporter.snapshots()).encode()
+        except Exception as e:
+            logger.exception('error rendering metrics')
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class MetricsExporter(object):
+
+    """Serves the metrics of the sessions at ``/metrics`` over HTTP, from a
+    thread of its own.
+
+    *host* and *port* are the address to listen on, by default only on the
+    loopback interface, port 0 picks a free one (see :attr:`address`).
+
+    *sessions*, if given, is a callable returning the sessions (or managers)
+    to export, by default all those that still exist.
+    """
+
+    def __init__(self, host='127.0.0.1', port=9464, sessions=None):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.exporter = self
+        self._sessions = sessions
+        self._thread = None
+
+    def snapshots(self):
+        "Returns the snapshots of the metrics of the sessions exported."
+        if self._sessions is None:
+            metrics = tracked()
+        else:
+            # a Manager exports its session
+            metrics = [getattr(s, '_session', s).metrics for s in self._sessions()]
+        result = []
+        for m in metrics:
+            try:
+                result.append(m.snapshot())
+            except Exception as e:
+                # e.g. a session still being set up
+                logger.debug('no metrics for %r: %r', m, e)
+        return result
+
+    def start(self):
+        "Start serving, returns the exporter."
+        self._thread = Thread(target=self._server.serve_forever, daemon=True,
+                              name='metrics-exporter')
+        self._thread.start()
+        logger.info('exporting metrics at http://%s:%d/metrics' % self.address)
+        return self
+
+    def stop(self):
+        "Stop serving and close the listening socket."
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    @property
+    def address(self):
+        "The (host, port) listened on."
+        return self._server.server_address[:2]
@@ -25,10 +25,12 @@ except ImportError:
 from xml.sax.handler import ContentHandler
 
 from ncclient.transport.errors import NetconfFramingError
-from ncclient.transport.session import NetconfBase
+from ncclient.transport.session import NetconfBase, SpillBuffer
+from ncclient import tracing
 from ncclient.logging_ import SessionLoggerAdapter
 from ncclient.operations.errors import OperationError
 from ncclient.transport import SessionListener
+from ncclient.transport.stream import ReplyStreamer
 
 import logging
 logger = logging.getLogger("ncclient.transport.parser")
@@ -46,6 +48,7 @@ BUF_SIZE = 10*1024*1204
 # v1.0: RFC 4742
 MSG_DELIM = "]]>]]>"
 MSG_DELIM_LEN = len(MSG_DELIM)
+RE_MSG_DELIM = re.compile(re.escape(MSG_DELIM.encode()))
 # v1.1: RFC 6242
 END_DELIM = '\n##\n'
 
@@ -59,7 +62,9 @@ TICK = 0.1
 # * result.group(1) will contain the digit string for a chunk
 # * result.group(2) will be defined if '##' found
 #
-RE_NC11_DELIM = re.compile(r'\n(?:#([0-9]+)|(##))\n')
+RE_NC11_DELIM = re.compile(br'\n(?:#([0-9]+)|(##))\n')
+# Longest chunk header allowed by RFC 6242: '\n#4294967295\n'
+MAX_CHUNK_HEADER_LEN = 13
 
 if sys.version < '3':
     def textify(buf):
@@ -100,6 +105,15 @@ class DefaultXMLParser(object):
         """
         self._session = session
         self._parsing_pos10 = 0
+        # netconf v1.0 payload of an oversized message moved out of the buffer
+        self._message10 = SpillBuffer(session)
+        # netconf v1.1 decoder state: undecoded input, payload bytes still
+        # expected for the current chunk and the message assembled so far
+        self._buffer11 = bytearray()
+        self._chunk_remaining = 0
+        self._message11 = SpillBuffer(session)
+        # diverts replies that have a sink registered while they arrive
+        self._streamer = ReplyStreamer(session)
         self.logger = SessionLoggerAdapter(logger, {'session': self._session})
 
     def parse(self, data):
@@ -110,131 +124,164 @@ class DefaultXMLParser(object):
         :return: None
         """
         if data:
-            self._session._buffer.seek(0, os.SEEK_END)
-            self._session._buffer.write(data)
             if self._session._base == NetconfBase.BASE_11:
+                self._buffer11 += data
                 self._parse11()
             else:
+                self._session._buffer.seek(0, os.SEEK_END)
+                self._session._buffer.write(data)
                 self._parse10()
 
+    def _dispatch_buffered(self, message):
+        "Dispatch the message assembled in the :class:`SpillBuffer` *message*."
+        if message.spilled:
+            self._session._dispatch_spilled(message.detach())
+        else:
+            raw = message.decode().strip()
+            message.clear()
+            self._session._dispatch_message(raw)
+
     def _parse10(self):
 
-        """Messages are delimited by MSG_DELIM. The buffer could have grown by
-        a maximum of BUF_SIZE bytes everytime this method is called. Retains
-        state across method calls and if a chunk has been read it will not be
-        considered again."""
+        """Messages are delimited by MSG_DELIM. The delimiter is searched for
+        in the bytes of the receive buffer, resuming where the previous
+        search stopped, so data that has already been scanned is never
+        looked at again. Every complete message in the buffer is sliced out
+        and dispatched in one pass, after which the buffer is compacted in
+        place and only the incomplete tail is retained."""
 
         self.logger.debug("parsing netconf v1.0")
         buf = self._session._buffer
-        buf.seek(self._parsing_pos10)
-        if MSG_DELIM in buf.read().decode('UTF-8', errors='replace'):
-            buf.seek(0)
-            msg, _, remaining = buf.read().decode('UTF-8', errors='replace').partition(MSG_DELIM)
-            msg = msg.strip()
-            if sys.version < '3':
-                self._session._dispatch_message(msg.encode())
-            else:
-                self._session._dispatch_message(msg)
-            self._session._buffer = StringIO()
-            self._parsing_pos10 = 0
-            if len(remaining.strip()) > 0:
-                # There could be another entire message in the
-                # buffer, so we should try to parse again.
-                if type(self._session.parser) != DefaultXMLParser:
-                    self.logger.debug('send remaining data to SAX parser')
-                    self._session.parser.parse(remaining.encode())
+        view = buf.getbuffer()
+        start = 0
+        pos = self._parsing_pos10
+        switched = False
+        try:
+            while True:
+                match = RE_MSG_DELIM.search(view, pos)
+                if match:
+                    end = match.start()
                 else:
-                    self.logger.debug('Trying another round of parsing since there is still data')
-                    self._session._buffer.write(remaining.encode())
-                    self._parse10()
-        else:
-            # handle case that MSG_DELIM is split over two chunks
-            self._parsing_pos10 = buf.tell() - MSG_DELIM_LEN
-            if self._parsing_pos10 < 0:
+                    # handle case that MSG_DELIM is split over two chunks
+                    end = max(len(view) - MSG_DELIM_LEN + 1, pos)
+                if end > pos:
+                    with view[pos:end] as data:
+                        if self._streamer.feed(data):
+                            # streamed into a reply sink, nothing is kept here
+                            start = end
+                            if self._message10:
+                                self._message10.clear()
+                threshold = self._session._spill_threshold
+                if threshold is not None and (self._message10 or end - start > threshold):
+                    # oversized message, keep its payload out of the buffer
+                    with view[start:end] as data:
+                        self._message10.write(data)
+                    start = end
+                pos = end
+                if not match:
+                    break
+                self._session._metrics.frame_received()
+                if tracing.tracer is not None:
+                    tracing.tracer.instant('frame_complete', tracing.now(), session=self._session.id,
+                                           size=len(self._message10) + end - start)
+                if self._streamer.end():
+                    pass
+                elif self._message10:
+                    self._dispatch_buffered(self._message10)
+                else:
+                    msg = textify(bytes(view[start:end])).strip()
+                    self._session._dispatch_message(msg)
+                start = pos = match.end()
+                if type(self._session.parser) != DefaultXMLParser:
+                    switched = True
+                    break
+            remaining = bytes(view[start:]) if start else None
+        finally:
+            view.release()
+
+        self._parsing_pos10 = pos - start
+        if remaining is not None:
+            buf.seek(0)
+            buf.truncate()
+            if switched:
                 self._parsing_pos10 = 0
+                if len(remaining.strip()) > 0:
+                    # There could be another entire message in the
+                    # buffer, so let the SAX parser take over.
+                    self.logger.debug('send remaining data to SAX parser')
+                    self._session.parser.parse(remaining)
+            else:
+                buf.write(remaining)
 
     def _parse11(self):
 
         """Messages are split into chunks. Chunks and messages are delimited
-        by the regex #RE_NC11_DELIM defined earlier in this file. Each
-        time we get called here either a chunk delimiter or an
-        end-of-message delimiter should be found iff there is enough
-        data. If there is not enough data, we will wait for more. If a
-        delimiter is found in the wrong place, a #NetconfFramingError
-        will be raised."""
-
-        self.logger.debug("_parse11: starting")
-
-        # suck in whole string that we have (this is what we will work on in
-        # this function) and initialize a couple of useful values
-        self._session._buffer.seek(0, os.SEEK_SET)
-        data = self._session._buffer.getvalue()
-        data_len = len(data)
+        by the regex #RE_NC11_DELIM defined earlier in this file, which is
+        matched directly on the bytes of the receive buffer. The decoder is
+        stateful: a chunk payload is copied exactly once into the message
+        being assembled, even if it is spread over several reads, and only
+        an incomplete chunk header is ever kept back in the receive buffer.
+        Each byte received is therefore looked at a constant number of
+        times. If a delimiter is not found where one is expected, a
+        #NetconfFramingError will be raised."""
+
+        buf = self._buffer11
+        buf_len = len(buf)
+        view = memoryview(buf)
         start = 0
-        self.logger.debug('_parse11: working with buffer of %d bytes', data_len)
-        while True and start < data_len:
-            # match to see if we found at least some kind of delimiter
-            self.logger.debug('_parse11: matching from %d bytes from start of buffer', start)
-            re_result = RE_NC11_DELIM.match(data[start:].decode('utf-8', errors='replace'))
-            if not re_result:
-
-                # not found any kind of delimiter just break; this should only
-                # ever happen if we just have the first few characters of a
-                # message such that we don't yet have a full delimiter
-                self.logger.debug('_parse11: no delimiter found, buffer="%s"', data[start:].decode())
-                break
-
-            # save useful variables for reuse
-            re_start = re_result.start()
-            re_end = re_result.end()
-            self.logger.debug('_parse11: regular expression start=%d, end=%d', re_start, re_end)
-
-            # If the regex doesn't start at the beginning of the buffer,
-            # we're in trouble, so throw an error
-            if re_start != 0:
-                raise NetconfFramingError('_parse11: delimiter not at start of match buffer', data[start:])
-
-            if re_result.group(2):
-                # we've found the end of the message, need to form up
-                # whole message, save back remainder (if any) to buffer
-                # and dispatch the message
-                start += re_end
-                message = ''.join(self._session._message_list)
-                self._session._message_list = []
-                self.logger.debug('_parse11: found end of message delimiter')
-                self._session._dispatch_message(message)
-                break
-
-            elif re_result.group(1):
-                # we've found a chunk delimiter, and group(2) is the digit
-                # string that will tell us how many bytes past the end of
-                # where it was found that we need to have available to
-                # save the next chunk off
-                self.logger.debug('_parse11: found chunk delimiter')
-                digits = int(re_result.group(1))
-                self.logger.debug('_parse11: chunk size %d bytes', digits)
-                if (data_len-start) >= (re_end + digits):
-                    # we have enough data for the chunk
-                    fragment = textify(data[start+re_end:start+re_end+digits])
-                    self._session._message_list.append(fragment)
-                    start += re_end + digits
-                    self.logger.debug('_parse11: appending %d bytes', digits)
-                    self.logger.debug('_parse11: fragment = "%s"', fragment)
-                else:
-                    # we don't have enough bytes, just break out for now
-                    # after updating start pointer to start of new chunk
-                    start += re_start
-                    self.logger.debug('_parse11: not enough data for chunk yet')
-                    self.logger.debug('_parse11: setting start to %d', start)
+        switched = False
+        self.logger.debug('_parse11: working with buffer of %d bytes', buf_len)
+        try:
+            while start < buf_len:
+                if self._chunk_remaining:
+                    # consume (part of) the payload of the current chunk
+                    end = min(start + self._chunk_remaining, buf_len)
+                    with view[start:end] as chunk:
+                        if self._streamer.feed(chunk):
+                            # streamed into a reply sink, nothing is kept here
+                            if self._message11:
+                                self._message11.clear()
+                        else:
+                            self._message11.write(chunk)
+                    self._chunk_remaining -= end - start
+                    start = end
+                    continue
+
+                re_result = RE_NC11_DELIM.match(buf, start)
+                if not re_result:
+                    if buf_len - start >= MAX_CHUNK_HEADER_LEN:
+                        raise NetconfFramingError(
+                            '_parse11: delimiter not at start of match buffer',
+                            bytes(view[start:start + MAX_CHUNK_HEADER_LEN]))
+                    # only the first few bytes of a delimiter, wait for more
+                    self.logger.debug('_parse11: no complete delimiter, %d bytes left',
+                                      buf_len - start)
                     break
 
-        # Now out of the loop, need to see if we need to save back any content
-        if start > 0:
-            self.logger.debug(
-                '_parse11: saving back rest of message after %d bytes, original size %d',
-                start, data_len)
-            self._session._buffer = StringIO(data[start:])
-            if start < data_len:
-                self.logger.debug('_parse11: still have data, may have another full message!')
-                self._parse11()
+                start = re_result.end()
+                if re_result.group(2):
+                    # end of message, the payload has already been assembled
+                    self.logger.debug('_parse11: found end of message delimiter')
+                    if tracing.tracer is not None:
+                        tracing.tracer.instant('frame_complete', tracing.now(), session=self._session.id,
+                                               size=len(self._message11))
+                    if not self._streamer.end():
+                        self._dispatch_buffered(self._message11)
+                    if self._session.parser is not self:
+                        switched = True
+                        break
+                else:
+                    self._chunk_remaining = int(re_result.group(1))
+                    self._session._metrics.frame_received()
+                    self.logger.debug('_parse11: chunk size %d bytes', self._chunk_remaining)
+        finally:
+            view.release()
+
+        del buf[:start]
+        if switched and buf:
+            # the parser was switched while dispatching, hand over the rest
+            self.logger.debug('_parse11: send remaining data to new parser')
+            remaining = bytes(buf)
+            del buf[:]
+            self._session.parser.parse(remaining)
         self.logger.debug('_parse11: ending')
@@ -0,0 +1,208 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Running the main loop of many sessions in one thread.
+
+By default every :class:`~ncclient.transport.Session` reads, frames and
+dispatches its messages in a thread of its own. A session that has a
+:class:`SessionReactor` set as its :attr:`~ncclient.transport.Session.reactor`
+is registered with the selector of the reactor instead, so that any number
+of sessions are served by a single thread::
+
+    reactor = SessionReactor()
+    managers = [manager.connect_ssh(host=h, username="admin", reactor=reactor)
+                for h in hosts]
+
+A :class:`ReactorPool` spreads the sessions over a few reactors.
+
+Listeners of sessions sharing a reactor are called from its thread, one
+message at a time, so they should return quickly.
+"""
+
+import socket
+from threading import Thread, Lock, Event
+try:
+    import selectors
+except ImportError:
+    import selectors2 as selectors
+
+from ncclient.transport.session import TICK
+
+import logging
+logger = logging.getLogger("ncclient.transport.reactor")
+
+POLL = 0.005
+"Select timeout while a session waits to be able to send the rest of a write."
+
+
+class SessionReactor(Thread):
+
+    """A thread running the main loop of all the sessions registered with it.
+
+    The thread is started when the first session is registered and runs
+    until :meth:`stop` is called.
+    """
+
+    def __init__(self, name='session-reactor'):
+        Thread.__init__(self, daemon=True, name=name)
+        self._selector = selectors.DefaultSelector()
+        self._lock = Lock()
+        self._keys = {} # session -> selector key
+        self._added = [] # sessions registered since the last iteration
+        self._stopping = Event()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    def __len__(self):
+        "Number of sessions registered."
+        with self._lock:
+            return len(self._keys) + len(self._added)
+
+    def register(self, session):
+        """Run the main loop of *session*, which must be connected, from now on.
+        Called by the session itself if this is its reactor.
+
+        :return: this reactor
+        """
+        with self._lock:
+            if self._stopping.is_set():
+                raise RuntimeError("%s has been stopped" % self.name)
+            self._added.append(session)
+            if self.ident is None:
+                self.start()
+        self.wakeup()
+        return self
+
+    def wakeup(self):
+        "Make the thread pick up registered sessions and queued messages at once."
+        try:
+            self._wakeup_w.send(b'\0')
+        except (OSError, socket.error):
+            # a wakeup is already pending, or the reactor has stopped
+            pass
+
+    def stop(self):
+        "End the thread. Sessions still registered are closed."
+        self._stopping.set()
+        self.wakeup()
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except (OSError, socket.error):
+            pass
+
+    def _add_sessions(self):
+        with self._lock:
+            added, self._added = self._added, []
+        for session in added:
+            self._step(session, self._register, session)
+
+    def _register(self, session):
+        self._keys[session] = session._transport_register(
+            self._selector, selectors.EVENT_READ, session)
+        session.logger.debug('main loop running in %s', self.name)
+
+    def _remove(self, session):
+        key = self._keys.pop(session, None)
+        if key is not None:
+            try:
+                # by fd: a closed paramiko channel asked for its fileno makes a new pipe
+                self._selector.unregister(key.fd)
+            except (KeyError, ValueError):
+                pass
+
+    def _step(self, session, fn, *args):
+        """Call *fn* for *session* as its own main loop would. If that fails,
+        the error is dispatched and the session dropped and closed."""
+        try:
+            return fn(*args)
+        except Exception as e:
+            session.logger.debug("Broke out of main loop, error=%r", e)
+            self._remove(session)
+            session._dispatch_error(e)
+            session.close()
+
+    def run(self):
+        selector = self._selector
+        timeout = TICK
+        try:
+            while not self._stopping.is_set():
+                for key, _ in selector.select(timeout=timeout):
+                    if key.fileobj is self._wakeup_r:
+                        self._drain_wakeup()
+                    elif key.data in self._keys:
+                        session = key.data
+                        if self._step(session, session._read_ready) is False:
+                            self._remove(session)
+                self._add_sessions()
+                timeout = TICK
+                for session in list(self._keys):
+                    if not session.connected:
+                        # closed without the transport noticing, e.g. by close_session()
+                        self._remove(session)
+                    elif session._send_pending() and session._send_ready():
+                        self._step(session, session._send_queued, False)
+                    if session in self._keys and session._out is not None:
+                        timeout = POLL
+        except Exception as e:
+            logger.error('%s failed: %r', self.name, e)
+            raise
+        finally:
+            with self._lock:
+                self._stopping.set()
+                sessions = list(self._keys) + self._added
+                self._added = []
+            for session in sessions:
+                self._remove(session)
+                if session.connected:
+                    session.close()
+            self._selector.close()
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+
+
+class ReactorPool(object):
+
+    """A few :class:`SessionReactor` threads sharing the sessions registered
+    with the pool, for when one thread is not enough. Each session is given
+    to the reactor with the fewest sessions at the time."""
+
+    def __init__(self, size=2, name='session-reactor'):
+        self._reactors = [SessionReactor('%s-%d' % (name, i)) for i in range(size)]
+
+    def __len__(self):
+        "Number of sessions registered."
+        return sum(len(r) for r in self._reactors)
+
+    def register(self, session):
+        """Give *session* to one of the reactors.
+
+        :return: the reactor the session has been registered with
+        """
+        return min(self._reactors, key=len).register(session)
+
+    def wakeup(self):
+        for reactor in self._reactors:
+            reactor.wakeup()
+
+    def stop(self):
+        for reactor in self._reactors:
+            reactor.stop()
+
+    @property
+    def reactors(self):
+        "The :class:`SessionReactor` instances of the pool."
+        return list(self._reactors)
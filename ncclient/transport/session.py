@@ -15,6 +15,7 @@
 
 
 import logging
+import socket
 from threading import Thread, Lock, Event
 try:
     from Queue import Queue, Empty
@@ -24,13 +25,18 @@ try:
     import selectors
 except ImportError:
     import selectors2 as selectors
+import tempfile
 import time
+from collections import OrderedDict
 import ncclient.transport
+from ncclient import tracing
 from ncclient.xml_ import *
 from ncclient.capabilities import Capabilities
 from ncclient.logging_ import SessionLoggerAdapter
 from ncclient.transport.errors import TransportError, SessionError, SessionCloseError
-from ncclient.transport.notify import Notification
+from ncclient.transport.notify import Notification, NotificationQueue
+from ncclient.transport.metrics import SessionMetrics, track
+from ncclient.transport.stream import SpooledReply
 
 logger = logging.getLogger('ncclient.transport.session')
 
@@ -41,6 +47,9 @@ END_DELIM = b'\n##\n'
 
 TICK = 0.1
 
+TIMESTAMPS_KEPT = 100
+"Number of messages whose send and receive times are kept for :meth:`Session.get_timestamp`."
+
 
 class NetconfBase(object):
     '''Netconf Base protocol version'''
@@ -48,6 +57,86 @@ class NetconfBase(object):
     BASE_11 = 2
 
 
+class SpillBuffer(object):
+
+    """Receive buffer for the payload of one message. The payload is kept in
+    memory until it grows past the :attr:`Session.spill_threshold` of
+    *session*, and is then moved to a temporary file, so that oversized
+    replies do not have to fit in RAM."""
+
+    def __init__(self, session):
+        self._session = session
+        self._mem = bytearray()
+        self._file = None
+
+    def __len__(self):
+        if self._file is not None:
+            return self._file.tell()
+        return len(self._mem)
+
+    @property
+    def spilled(self):
+        "Whether the payload has been moved to a temporary file."
+        return self._file is not None
+
+    def write(self, data):
+        if self._file is not None:
+            self._file.write(data)
+            return
+        self._mem += data
+        threshold = self._session._spill_threshold
+        if threshold is not None and len(self._mem) > threshold:
+            self._file = tempfile.NamedTemporaryFile(prefix='ncclient-', suffix='.xml')
+            self._file.write(self._mem)
+            self._mem = bytearray()
+
+    def decode(self):
+        "The in-memory payload as a string."
+        return self._mem.decode('UTF-8', errors='replace')
+
+    def detach(self):
+        """Hand the spilled payload over as a
+        :class:`~ncclient.transport.stream.SpooledReply` and start over."""
+        message = SpooledReply(self._file)
+        self._file = None
+        return message
+
+    def clear(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._mem:
+            self._mem = bytearray()
+
+
+class ReceiveBuffer(object):
+
+    """Preallocated buffer for transports that can read with `recv_into()`.
+
+    :meth:`read` returns a memoryview of the bytes read, valid until the next
+    call, so nothing is allocated or copied before the framing parser takes
+    the data. The buffer starts at *size* bytes and doubles, up to
+    *max_size*, whenever a read fills it."""
+
+    def __init__(self, size=64 * 1024, max_size=4 * 1024 * 1024):
+        self._max_size = max_size
+        self._view = memoryview(bytearray(size))
+        self._full = False
+
+    def __len__(self):
+        return len(self._view)
+
+    def read(self, recv_into):
+        """Read with *recv_into*, e.g. the `recv_into` method of a socket, and
+        return a memoryview of what was read (empty at the end of the stream)."""
+        if self._full and len(self._view) < self._max_size:
+            # a new buffer, slices of the old one may still be referenced
+            self._view = memoryview(bytearray(min(2 * len(self._view), self._max_size)))
+        n = recv_into(self._view)
+        self._full = n == len(self._view)
+        return self._view[:n]
+
+
 class Session(Thread):
 
     "Base class for use by transport protocol implementations."
@@ -55,9 +144,16 @@ class Session(Thread):
     def __init__(self, capabilities):
         Thread.__init__(self, daemon=True, name='session')
         self._listeners = set()
+        # snapshots of _listeners taken when it changes, see _dispatch_message
+        self._fanout = ()
+        self._reply_observers = ()
+        self._reply_router = None
         self._lock = Lock()
         self._q = Queue()
-        self._notification_q = Queue()
+        # written to by send() so that the main loop picks up a queued
+        # message at once instead of at the next TICK, see start
+        self._wakeup_r = self._wakeup_w = None
+        self._notification_q = NotificationQueue()
         self._client_capabilities = capabilities
         self._server_capabilities = None # yet
         self._base = NetconfBase.BASE_10
@@ -68,40 +164,104 @@ class Session(Thread):
                           self, self._client_capabilities)
         self._device_handler = None # Should be set by child class
         self._msg_id = -1
-        self._send_timestamps = []
-        self._recv_timestamps = []
+        self._msg_id_lock = Lock()
+        self._timestamps = OrderedDict() # message-id -> [sent, received], see get_timestamp
+        self._reply_sinks = {} # message-id -> ReplySink, see add_reply_sink
+        self._spill_threshold = None # see spill_threshold
+        self._reactor = None # see reactor
+        self._out = None # what is left of a partial write, see _send_queued
+        self._metrics = SessionMetrics(self)
+        track(self._metrics) # exported by ncclient.transport.openmetrics
 
     @property
     def msg_id(self):
-        self._msg_id += 1
-        strid = str(self._msg_id)
-        return strid
+        "Allocates the next message-id, unique within the session whichever thread asks."
+        with self._msg_id_lock:
+            self._msg_id += 1
+            return str(self._msg_id)
+
+    def _log_timestamp(self, msg_id, type, t=None):
+        """Record *t* (by default now) as the time the message with *msg_id*
+        was sent (*type* 0) or its reply received (*type* 1)."""
+        if msg_id is None:
+            return
+        with self._lock:
+            ts = self._timestamps.get(msg_id)
+            if ts is None:
+                ts = self._timestamps[msg_id] = [None, None]
+                if len(self._timestamps) > TIMESTAMPS_KEPT:
+                    self._timestamps.popitem(last=False)
+            ts[type] = time.time() if t is None else t
 
     def _dispatch_message(self, raw):
+        # listeners get the message as a ParsedMessage, so that the element
+        # tree is built at most once however many of them look at it
+        received = time.time()
+        tracer = tracing.tracer
+        if tracer is not None:
+            start_dispatch = tracing.now()
+        self._metrics.message_received()
         try:
-            # lijq log recv timestamp
-            ts = {}
-            ts[str(self._msg_id)] = time.time()
-            self._recv_timestamps.insert(0, ts)
-            del (self._recv_timestamps[20:])
-            root = parse_root(raw)
+            start = time.perf_counter()
+            raw = ParsedMessage(raw)
+            root = raw.head
+            self._metrics.parsed(time.perf_counter() - start)
         except Exception as e:
             device_handled_raw=self._device_handler.handle_raw_dispatch(raw)
             if isinstance(device_handled_raw, str):
-                root = parse_root(device_handled_raw)
+                raw = ParsedMessage(device_handled_raw)
+                root = raw.head
             elif isinstance(device_handled_raw, Exception):
                 self._dispatch_error(device_handled_raw)
                 return
             else:
                 self.logger.error('error parsing dispatch message: %s', e)
                 return
+        self._log_timestamp(root[1].get('message-id'), 1, received)
         self.logger.debug('dispatching message to different listeners: %s',
                           raw)
-        with self._lock:
-            listeners = list(self._listeners)
-        for l in listeners:
+        for l in self._route(root, raw):
             self.logger.debug('dispatching message to listener: %r', l)
             l.callback(root, raw) # no try-except; fail loudly if you must!
+        if tracer is not None:
+            tracer.span('dispatch', start_dispatch, tracing.now(), session=self._id,
+                        message_id=root[1].get('message-id'), tag=root[0], size=raw.size)
+
+    def _route(self, root, raw):
+        """Deliver an *rpc-reply* straight to the RPC waiting for it, by its
+        message-id. Returns the listeners that the message still has to be
+        dispatched to: only those that observe replies if it was delivered,
+        all but the router otherwise."""
+        router = self._reply_router
+        if router is not None and router.route(root, raw):
+            return self._reply_observers
+        return self._fanout
+
+    def _dispatch_stream(self, root, sink):
+        """Dispatch a reply whose payload was streamed into *sink* instead of
+        being assembled as a string. Listeners get the sink as *raw*."""
+        self._log_timestamp(root[1].get('message-id'), 1)
+        self._metrics.message_received()
+        self.logger.debug('dispatching streamed reply to listeners: %r', sink)
+        for l in self._route(root, sink):
+            l.callback(root, sink)
+
+    def _dispatch_spilled(self, message):
+        """Dispatch a message that the receive buffer spilled to disk.
+        Replies are delivered like streamed ones and parsed from the file,
+        anything else is read back and dispatched as usual."""
+        try:
+            root = message.parse_root()
+        except Exception:
+            root = None
+        if root is not None and 'message-id' in root[1] and \
+                etree.QName(root[0]).localname == 'rpc-reply':
+            self.logger.info('dispatching spilled reply of %d bytes', message.size)
+            self._dispatch_stream(root, message)
+        else:
+            raw = message.read_text()
+            message.close()
+            self._dispatch_message(raw)
 
     def _dispatch_error(self, err):
         with self._lock:
@@ -125,12 +285,17 @@ class Session(Thread):
         def err_cb(err):
             error[0] = err
             init_event.set()
-        self.add_listener(NotificationHandler(self._notification_q))
+        self.add_listener(NotificationHandler(self._notification_q, getattr(self, '_closing', None)))
         listener = HelloHandler(ok_cb, err_cb)
         self.add_listener(listener)
-        self.send(HelloHandler.build(self._client_capabilities, self._device_handler))
-        self.logger.debug('starting main loop')
-        self.start()
+        if self._reactor is not None:
+            self.logger.debug('registering with %r', self._reactor)
+            self._reactor = self._reactor.register(self)
+            self.send(HelloHandler.build(self._client_capabilities, self._device_handler))
+        else:
+            self.send(HelloHandler.build(self._client_capabilities, self._device_handler))
+            self.logger.debug('starting main loop')
+            self.start()
         # we expect server's hello message, if server doesn't responds in 60 seconds raise exception
         init_event.wait(timeout)
         if not init_event.is_set():
@@ -139,6 +304,9 @@ class Session(Thread):
         self.remove_listener(listener)
         if error[0]:
             raise error[0]
+        self._select_base()
+
+    def _select_base(self):
         #if ':base:1.0' not in self.server_capabilities:
         #    raise MissingCapabilityError(':base:1.0')
         if 'urn:ietf:params:netconf:base:1.1' in self._server_capabilities and 'urn:ietf:params:netconf:base:1.1' in self._client_capabilities:
@@ -158,6 +326,7 @@ class Session(Thread):
             raise SessionError("Listener must be a SessionListener type")
         with self._lock:
             self._listeners.add(listener)
+            self._update_fanout()
 
     def remove_listener(self, listener):
         """Unregister some listener; ignore if the listener was never
@@ -168,6 +337,36 @@ class Session(Thread):
         self.logger.debug('discarding listener %r', listener)
         with self._lock:
             self._listeners.discard(listener)
+            if listener is self._reply_router:
+                self._reply_router = None
+            self._update_fanout()
+
+    def _set_reply_router(self, listener):
+        """Make *listener*, which must be registered, the one that
+        :meth:`_route` hands replies to. It is left out of the fan-out to the
+        other listeners."""
+        with self._lock:
+            self._reply_router = listener
+            self._update_fanout()
+
+    def _update_fanout(self):
+        # with self._lock held
+        others = [l for l in self._listeners if l is not self._reply_router]
+        self._fanout = tuple(others)
+        self._reply_observers = tuple(l for l in others if l.receives_replies)
+
+    def add_reply_sink(self, msg_id, sink):
+        """Stream the reply to the message with *msg_id* into *sink* while it
+        arrives, instead of assembling it as a string.
+
+        :type sink: :class:`~ncclient.transport.stream.ReplySink`
+        """
+        with self._lock:
+            self._reply_sinks[msg_id] = sink
+
+    def _pop_reply_sink(self, msg_id):
+        with self._lock:
+            return self._reply_sinks.pop(msg_id, None)
 
     def get_listener_instance(self, cls):
         """If a listener of the specified type is registered, returns the
@@ -188,7 +387,8 @@ class Session(Thread):
         Read data from underlying Transport layer, either SSH or TLS, as
         implemented in subclass.
 
-        :return: Byte string read from Transport, or None if nothing was read.
+        :return: Bytes read from Transport, possibly as a memoryview that is
+            only valid until the next read, or None if nothing was read.
         """
         raise NotImplementedError
 
@@ -197,18 +397,20 @@ class Session(Thread):
         Write data into underlying Transport layer, either SSH or TLS, as
         implemented in subclass.
 
-        :param data: Byte string to write.
+        :param data: Bytes-like object to write.
         :return: Number of bytes sent, or 0 if the stream is closed.
         """
         raise NotImplementedError
 
-    def _transport_register(self, selector, event):
+    def _transport_register(self, selector, event, data=None):
         """
         Register the channel/socket of Transport layer for selection.
         Implemented in a subclass.
 
         :param selector: Selector to register with.
         :param event: Type of event for selection.
+        :param data: Data to attach to the selector key.
+        :return: The selector key.
         """
         raise NotImplementedError
 
@@ -221,73 +423,173 @@ class Session(Thread):
         """
         raise NotImplementedError
 
-    def run(self):
-        q = self._q
+    def _parse_received(self, data):
+        "Feed *data* read from the transport to the framing parser."
+        self._metrics.received(len(data))
+        if isinstance(data, memoryview) and type(self.parser) is not ncclient.transport.parser.DefaultXMLParser:
+            # only the default parser is known not to keep a reference to the
+            # data, which may be a view of a ReceiveBuffer
+            data = data.tobytes()
+        try:
+            self.parser.parse(data)
+        except ncclient.transport.parser.SAXFilterXMLNotFoundError:
+            self.logger.debug('switching from sax to dom parsing')
+            self.parser = ncclient.transport.parser.DefaultXMLParser(self)
+            self.parser.parse(data)
+
+    def _frame(self, message):
+        "Returns *message* (xml string) encoded and framed for the wire."
+        data = message.encode()
+        if self._base == NetconfBase.BASE_11:
+            data = b"\n#%i\n%s%s" % (len(data), data, END_DELIM)
+        else:
+            data = b"%s%s" % (data, MSG_DELIM)
+        self._metrics.sent(len(data))
+        self.logger.info("Sending:\n%s", data)
+        return data
 
-        def start_delim(data_len):
-            return b'\n#%i\n' % data_len
+    def _read_ready(self):
+        """Read from the transport once it is readable and parse what was read.
 
+        :return: False at the expected end of the session, True otherwise.
+        """
+        tracer = tracing.tracer
+        if tracer is not None:
+            start = tracing.now()
+        data = self._transport_read()
+        if tracer is not None:
+            tracer.span('transport_read', start, tracing.now(), session=self._id,
+                        size=len(data) if data else 0)
+        if data:
+            self._parse_received(data)
+            return True
+        elif self._closing.is_set():
+            # End of session, expected
+            return False
+        else:
+            # End of session, unexpected
+            raise SessionCloseError(self._buffer.getvalue())
+
+    def _send_queued(self, block=True):
+        """Write the messages queued by :meth:`send`, coalesced into a single write.
+
+        Unless *block*, returns as soon as the transport is no longer ready to send and keeps
+        the rest for the next call.
+
+        :return: True if everything queued has been written.
+        """
+        if self._out is None:
+            frames = []
+            while True:
+                try:
+                    item = self._q.get_nowait()
+                except Empty:
+                    break
+                frames.append(item)
+            if not frames:
+                return True
+            self.logger.debug("Sending %d frame(s)", len(frames))
+            self._out = memoryview(b"".join(frames))
+        data = self._out
+        while data:
+            n = self._transport_write(data)
+            if n <= 0:
+                raise SessionCloseError(self._buffer.getvalue(), bytes(data))
+            data = data[n:]
+            if not block and data and not self._send_ready():
+                self._out = data
+                return False
+        self._out = None
+        return True
+
+    def _send_pending(self):
+        "Whether there is anything for :meth:`_send_queued` to write."
+        return self._out is not None or not self._q.empty()
+
+    def run(self):
         try:
             s = selectors.DefaultSelector()
             self._transport_register(s, selectors.EVENT_READ)
+            s.register(self._wakeup_r, selectors.EVENT_READ)
             self.logger.debug('selector type = %s', s.__class__.__name__)
             while True:
                 events = s.select(timeout=TICK)
-                if events:
-                    data = self._transport_read()
-                    if data:
-                        try:
-                            self.parser.parse(data)
-                        except ncclient.transport.parser.SAXFilterXMLNotFoundError:
-                            self.logger.debug('switching from sax to dom parsing')
-                            self.parser = ncclient.transport.parser.DefaultXMLParser(self)
-                            self.parser.parse(data)
-                    elif self._closing.is_set():
-                        # End of session, expected
-                        break
+                readable = False
+                for key, _ in events:
+                    if key.fileobj is self._wakeup_r:
+                        self._drain_wakeup()
                     else:
-                        # End of session, unexpected
-                        raise SessionCloseError(self._buffer.getvalue())
-                if not q.empty() and self._send_ready():
-                    self.logger.debug("Sending message")
-                    data = q.get().encode()
-                    if self._base == NetconfBase.BASE_11:
-                        data = b"%s%s%s" % (start_delim(len(data)), data, END_DELIM)
-                    else:
-                        data = b"%s%s" % (data, MSG_DELIM)
-                    self.logger.info("Sending:\n%s", data)
-                    ts = {}
-                    ts[str(self._msg_id)] = time.time()
-                    self._send_timestamps.insert(0, ts)
-                    del (self._send_timestamps[20:])
-                    while data:
-                        n = self._transport_write(data)
-                        if n <= 0:
-                            raise SessionCloseError(self._buffer.getvalue(), data)
-                        data = data[n:]
+                        readable = True
+                if readable and not self._read_ready():
+                    break
+                if self._closing.is_set() and not readable:
+                    # woken up by close(), the transport may not signal the end itself
+                    break
+                if self._send_pending() and self._send_ready():
+                    self._send_queued()
         except Exception as e:
             self.logger.debug("Broke out of main loop, error=%r", e)
             self._dispatch_error(e)
             self.close()
+        finally:
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+
+    def start(self):
+        "Start the main loop in a thread of its own."
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        # for whatever was queued before, e.g. the hello message
+        self._wakeup()
+        Thread.start(self)
+
+    def _wakeup(self):
+        if self._reactor is not None:
+            self._reactor.wakeup()
+            return
+        if self._wakeup_w is None:
+            return
+        try:
+            self._wakeup_w.send(b'\0')
+        except (OSError, socket.error):
+            # a wakeup is already pending, or the main loop has ended
+            pass
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except (OSError, socket.error):
+            pass
 
     def get_timestamp(self, msgid: str, type: int):
-        """Get timestamp of rpc send(type=0) or reply(type=1)"""
-        if type == 0:
-            timestamps = self._send_timestamps
-        else:
-            timestamps = self._recv_timestamps
-        for ts in timestamps:
-            t = ts.get(f'{msgid}')
-            if t is not None:
-                return t
-        return None
+        """Get timestamp of rpc send(type=0) or reply(type=1), `None` if unknown.
+        Only the last :data:`TIMESTAMPS_KEPT` messages are remembered, see also
+        :attr:`~ncclient.operations.RPC.sent_time`."""
+        with self._lock:
+            ts = self._timestamps.get(f'{msgid}')
+            return ts[type] if ts is not None else None
 
     def send(self, message):
         """Send the supplied *message* (xml string) to NETCONF server."""
         if not self.connected:
             raise TransportError('Not connected to NETCONF server')
         self.logger.debug('queueing %s', message)
-        self._q.put(message)
+        # framed right away, the hello exchange may change the framing before it is written
+        self._q.put(self._frame(message))
+        self._metrics.queued(self._q.qsize())
+        self._wakeup()
+
+    def send_many(self, messages):
+        """Send all the supplied *messages* (xml strings) to NETCONF server
+        back to back, framed into a single write."""
+        if not self.connected:
+            raise TransportError('Not connected to NETCONF server')
+        self.logger.debug('queueing %d messages', len(messages))
+        self._q.put(b"".join(self._frame(message) for message in messages))
+        self._metrics.queued(self._q.qsize())
+        self._wakeup()
 
     def scp(self):
         raise NotImplementedError
@@ -319,6 +621,43 @@ class Session(Thread):
         """A string representing the `session-id`. If the session has not been initialized it will be `None`"""
         return self._id
 
+    @property
+    def reactor(self):
+        """The :class:`~ncclient.transport.reactor.SessionReactor` (or
+        :class:`~ncclient.transport.reactor.ReactorPool`) that runs the main
+        loop of this session, or `None` (the default) for a thread of its
+        own. Must be set before connecting."""
+        return self._reactor
+
+    @reactor.setter
+    def reactor(self, x):
+        if self._connected:
+            raise SessionError("The reactor must be set before connecting")
+        self._reactor = x
+
+    @property
+    def spill_threshold(self):
+        """Size in bytes past which the payload of an incoming message is moved
+        from memory to a temporary file, `None` (the default) to never spill.
+        Spilled replies are parsed from the file when needed."""
+        return self._spill_threshold
+
+    @spill_threshold.setter
+    def spill_threshold(self, x):
+        self._spill_threshold = x
+
+    @property
+    def notification_queue(self):
+        """The :class:`~ncclient.transport.notify.NotificationQueue` received
+        notifications are put into, of unlimited capacity by default."""
+        return self._notification_q
+
+    @property
+    def metrics(self):
+        """The :class:`~ncclient.transport.metrics.SessionMetrics` of this
+        session, see :meth:`~ncclient.transport.metrics.SessionMetrics.snapshot`."""
+        return self._metrics
+
 
 class SessionListener(object):
 
@@ -329,12 +668,19 @@ class SessionListener(object):
         Avoid time-intensive tasks in a callback's context.
     """
 
+    receives_replies = True
+    """Whether :meth:`callback` is also called for the *rpc-reply* messages
+    that have been delivered to the RPC waiting for them. Listeners that only
+    look at other messages should set this to `False`, so that replies are
+    not dispatched to them at all."""
+
     def callback(self, root, raw):
         """Called when a new XML document is received. The *root* argument allows the callback to determine whether it wants to further process the document.
 
         Here, *root* is a tuple of *(tag, attributes)* where *tag* is the qualified name of the root element and *attributes* is a dictionary of its attributes (also qualified names).
 
-        *raw* will contain the XML document as a string.
+        *raw* will contain the XML document as a string, or the
+        :class:`~ncclient.transport.stream.ReplySink` it was streamed into.
         """
         raise NotImplementedError
 
@@ -348,6 +694,8 @@ class SessionListener(object):
 
 class HelloHandler(SessionListener):
 
+    receives_replies = False
+
     def __init__(self, init_cb, error_cb):
         self._init_cb = init_cb
         self._error_cb = error_cb
@@ -400,13 +748,17 @@ class HelloHandler(SessionListener):
 
 
 class NotificationHandler(SessionListener):
-    def __init__(self, notification_q):
+
+    receives_replies = False
+
+    def __init__(self, notification_q, closing=None):
         self._notification_q = notification_q
+        self._closing = closing
 
     def callback(self, root, raw):
         tag, _ = root
         if tag == qualify('notification', NETCONF_NOTIFICATION_NS):
-            self._notification_q.put(Notification(raw))
+            self._notification_q.put(Notification(raw), self._closing)
 
     def errback(self, _):
         pass
@@ -21,6 +21,7 @@ import six
 import sys
 import socket
 import threading
+import weakref
 from binascii import hexlify
 
 try:
@@ -54,6 +55,11 @@ BUF_SIZE = 4*1024*1024
 #
 RE_NC11_DELIM = re.compile(br'\n(?:#([0-9]+)|(##))\n')
 
+# paramiko.Transport -> number of SSHSession objects with a NETCONF channel on
+# it, the connection is closed along with the last of them
+_transport_users = weakref.WeakKeyDictionary()
+_transport_users_lock = threading.Lock()
+
 
 def default_unknown_host_cb(host, fingerprint):
     """An unknown host callback returns `True` if it finds the key acceptable, and `False` if not.
@@ -97,9 +103,9 @@ class SSHSession(Session):
         self._channel = None
         self._channel_id = None
         self._channel_name = None
+        self._holds_transport = False
         self._buffer = StringIO()
         self._device_handler = device_handler
-        self._message_list = []
         self._closing = threading.Event()
         self.parser = DefaultXMLParser(self)  # SAX or DOM parser
 
@@ -138,10 +144,33 @@ class SSHSession(Session):
         else:
             self._host_keys.load(filename)
 
+    def _hold_transport(self):
+        with _transport_users_lock:
+            _transport_users[self._transport] = _transport_users.get(self._transport, 0) + 1
+        self._holds_transport = True
+
+    def _release_transport(self):
+        "Returns whether this session was the last one using the transport."
+        if not self._holds_transport:
+            return False
+        self._holds_transport = False
+        with _transport_users_lock:
+            users = _transport_users.get(self._transport, 1) - 1
+            if users:
+                _transport_users[self._transport] = users
+            else:
+                _transport_users.pop(self._transport, None)
+        return users == 0
+
     def close(self):
         self._closing.set()
-        if self._transport.is_active():
-            self._transport.close()
+        if self._release_transport():
+            if self._transport.is_active():
+                self._transport.close()
+        else:
+            # the connection is still used by other sessions, or is not ours: only the
+            # channel is closed, below, once the main loop has stopped reading from it
+            self._wakeup()
 
         # Wait for the transport thread to close.
         while self.is_alive() and (self is not threading.current_thread()):
@@ -306,6 +335,7 @@ class SSHSession(Session):
         self.logger.info(f"Change sock SNDBUF len from: {sndbuf} to {sndbuf1}")
 
         self._transport = paramiko.Transport(sock)
+        self._hold_transport()
         self._transport.default_window_size = pow(2, 31)
         # self._transport.default_max_packet_size = pow(2, 29)
         self._transport.packetizer.REKEY_BYTES = pow(2, 40)
@@ -379,6 +409,38 @@ class SSHSession(Session):
         if keepalive:
             self._transport.set_keepalive(keepalive)
 
+        self._open_channel(timeout, environment)
+
+    def connect_channel(self, transport, timeout=None, environment=None):
+        """Initialize the NETCONF session on a new channel of an SSH connection that is
+        already authenticated, skipping the TCP connect, key exchange and authentication
+        done by :meth:`connect`.
+
+        *transport* is a connected :class:`SSHSession`, or its :attr:`transport`. Sessions
+        sharing a connection can be closed in any order, the connection is closed along
+        with the last of them. A `paramiko.Transport` that was not made by an
+        :class:`SSHSession` is left open.
+
+        *timeout* is how long to wait for the hello of the server.
+
+        *environment* a dictionary containing the name and respective values to set
+        """
+        if isinstance(transport, SSHSession):
+            self._host = transport.host
+            transport = transport.transport
+        if transport is None or not transport.is_active() or not transport.is_authenticated():
+            raise SSHError("Not an authenticated SSH connection")
+        self._transport = transport
+        with _transport_users_lock:
+            if transport in _transport_users:
+                _transport_users[transport] += 1
+                self._holds_transport = True
+
+        self._connected = True
+        self._closing.clear()
+        self._open_channel(timeout, environment)
+
+    def _open_channel(self, timeout, environment):
         # TODO: leopoul: Review, test, and if needed rewrite this part
         subsystem_names = self._device_handler.get_ssh_subsystem_names()
         for subname in subsystem_names:
@@ -516,8 +578,8 @@ class SSHSession(Session):
     def _transport_write(self, data):
         return self._channel.send(data)
 
-    def _transport_register(self, selector, event):
-        selector.register(self._channel, event)
+    def _transport_register(self, selector, event, data=None):
+        return selector.register(self._channel, event, data)
 
     def _send_ready(self):
         return self._channel.send_ready()
@@ -531,5 +593,5 @@ class SSHSession(Session):
 
     @property
     def transport(self):
-        "Underlying `paramiko.Transport <http://www.lag.net/paramiko/docs/paramiko.Transport-class.html>`_ object. This makes it possible to call methods like :meth:`~paramiko.Transport.set_keepalive` on it."
+        "Underlying `paramiko.Transport <http://www.lag.net/paramiko/docs/paramiko.Transport-class.html>`_ object. This makes it possible to call methods like :meth:`~paramiko.Transport.set_keepalive` on it. It may be shared with other sessions, see :meth:`connect_channel`."
         return self._transport
@@ -0,0 +1,353 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming delivery of *rpc-reply* messages.
+
+Normally a reply is assembled as one string by the framing layer before it is
+dispatched and parsed. For replies that have a :class:`ReplySink` registered
+with the session, the framed bytes are handed to the sink while they arrive
+instead, so the reply never exists as one Python string.
+"""
+
+import codecs
+
+from lxml import etree
+
+from ncclient.xml_ import qualify
+
+import logging
+logger = logging.getLogger("ncclient.transport.stream")
+
+
+class ReplySink(object):
+
+    """Base class for the receivers of a streamed *rpc-reply*.
+
+    :meth:`feed` is called with the payload bytes of the reply in order, from
+    the session thread, and :meth:`close` once the reply is complete. After
+    :meth:`close`, :attr:`root` holds the *rpc-reply* element (or at least the
+    parts of it needed to tell whether the operation was successful) and
+    :attr:`error` the exception that prevented parsing it, if any.
+    """
+
+    def __init__(self, huge_tree=False):
+        self.root = None
+        self.error = None
+        self.size = 0
+        self.replaced = False  # non UTF-8 bytes were replaced while decoding
+        self._huge_tree = huge_tree
+        self._decoder = codecs.getincrementaldecoder('UTF-8')(errors='replace')
+        self._started = False
+
+    def _text(self, data, final=False):
+        "Decode the next piece of payload the same way the framing layer would."
+        text = self._decoder.decode(data, final)
+        if not self._started:
+            # leading blanks before the XML declaration are not well-formed
+            text = text.lstrip()
+            self._started = bool(text)
+        if u'�' in text:
+            self.replaced = True
+        return text
+
+    def feed(self, data):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def parse(self, huge_tree=False):
+        "Returns the *rpc-reply* element, or raises the error that prevented parsing it."
+        if self.error is not None:
+            raise self.error
+        return self.root
+
+    @property
+    def path(self):
+        "Path of the file the reply was written to, or `None`."
+        return None
+
+
+class TreeSink(ReplySink):
+
+    "Builds the element tree of the reply with an lxml pull parser while it arrives."
+
+    def __init__(self, huge_tree=False):
+        ReplySink.__init__(self, huge_tree)
+        self._parser = etree.XMLPullParser(huge_tree=huge_tree)
+
+    def feed(self, data):
+        self.size += len(data)
+        if self.error is not None:
+            return
+        try:
+            self._parser.feed(self._text(data))
+        except etree.XMLSyntaxError as e:
+            self.error = e
+
+    def close(self):
+        if self.error is None:
+            try:
+                self._parser.feed(self._text(b'', final=True))
+                self.root = self._parser.close()
+            except etree.XMLSyntaxError as e:
+                self.error = e
+        self._parser = None
+
+
+class FileSink(ReplySink):
+
+    """Writes the reply as received to a file.
+
+    *target* is either a path, which is opened (and closed again) by the sink,
+    or an object with a `write()` method taking bytes.
+
+    The reply is also scanned with a pull parser that keeps only the `ok` and
+    `rpc-error` children of the *rpc-reply* element in :attr:`root` (other
+    children are left empty), so the outcome of the operation is known
+    without holding the reply in memory.
+    The full reply can be parsed from :attr:`path` afterwards.
+    """
+
+    KEEP = (qualify('ok'), qualify('rpc-error'), 'ok', 'rpc-error')
+
+    def __init__(self, target, huge_tree=False):
+        ReplySink.__init__(self, huge_tree)
+        if hasattr(target, 'write'):
+            self._file = target
+            self._owned = False
+        else:
+            self._file = open(target, 'wb')
+            self._owned = True
+        self._path = getattr(self._file, 'name', None)
+        self._scanner = etree.XMLPullParser(events=('start', 'end'), huge_tree=huge_tree)
+        self._depth = 0
+        self._keep = False
+
+    def feed(self, data):
+        self.size += len(data)
+        if not self._started:
+            data = bytes(data).lstrip()
+        self._file.write(data)
+        if self.error is not None:
+            return
+        try:
+            self._scanner.feed(self._text(data))
+            self._prune()
+        except etree.XMLSyntaxError as e:
+            self.error = e
+
+    def _prune(self):
+        for event, ele in self._scanner.read_events():
+            if event == 'start':
+                self._depth += 1
+                if self._depth == 2:
+                    self._keep = ele.tag in self.KEEP
+                continue
+            self._depth -= 1
+            if self._depth >= 1 and not self._keep:
+                # drop the content as soon as it is complete
+                ele.clear()
+                if self._depth > 1:
+                    while ele.getprevious() is not None:
+                        del ele.getparent()[0]
+
+    def close(self):
+        try:
+            if self.error is None:
+                try:
+                    self._scanner.feed(self._text(b'', final=True))
+                    self._prune()
+                    self.root = self._scanner.close()
+                except etree.XMLSyntaxError as e:
+                    self.error = e
+            self._scanner = None
+        finally:
+            if self._owned:
+                self._file.close()
+            else:
+                self._file.flush()
+
+    @property
+    def path(self):
+        return self._path
+
+
+class SpooledReply(ReplySink):
+
+    """A message that the receive buffer spilled to a temporary file because
+    it was too large to keep in memory (see
+    :attr:`ncclient.transport.Session.spill_threshold`).
+
+    Nothing is parsed until :meth:`parse` is called, which then reads the file
+    back in blocks into a :class:`TreeSink`. The file is removed when the
+    reply is garbage collected.
+    """
+
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, file):
+        ReplySink.__init__(self)
+        self._file = file
+        self.size = file.tell()
+
+    def _blocks(self):
+        self._file.seek(0)
+        while True:
+            block = self._file.read(self.BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+
+    def parse_root(self):
+        "Returns a tuple of the qualified name and the attributes of the root element."
+        probe = _RootProbe()
+        for block in self._blocks():
+            root = probe.feed(block)
+            if root is not None:
+                return root
+        raise etree.XMLSyntaxError('no root element in spooled message', None, 1, 1)
+
+    def read_text(self):
+        "Returns the whole message as a string, as the framing layer would have."
+        return b''.join(self._blocks()).decode('UTF-8', errors='replace').strip()
+
+    def parse(self, huge_tree=False):
+        if self.root is None and self.error is None:
+            sink = TreeSink(huge_tree)
+            for block in self._blocks():
+                sink.feed(block)
+            sink.close()
+            self.root, self.error, self.replaced = sink.root, sink.error, sink.replaced
+        return ReplySink.parse(self, huge_tree)
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def path(self):
+        return self._file.name
+
+
+class _RootProbe(ReplySink):
+
+    "Finds the root element at the start of a message."
+
+    def __init__(self):
+        ReplySink.__init__(self)
+        self._parser = etree.XMLPullParser(events=('start',))
+
+    def feed(self, data):
+        """Returns a tuple of the qualified name and the attributes of the
+        root element once it has been seen, `None` before."""
+        self._parser.feed(self._text(data))
+        for _, ele in self._parser.read_events():
+            return ele.tag, dict(ele.attrib)
+        return None
+
+
+def make_sink(spec, message_id, huge_tree=False):
+    """Create the :class:`ReplySink` for the reply to *message_id* from a
+    sink specification as accepted by :attr:`ncclient.operations.RPC.reply_sink`:
+
+    * `True` builds the element tree while the reply arrives (:class:`TreeSink`)
+    * a path or an object with a `write()` method receives the reply as is (:class:`FileSink`)
+    * a :class:`ReplySink` instance is used as it is
+    * a callable is called with the message-id and must return one of the above
+    """
+    if isinstance(spec, ReplySink):
+        return spec
+    if spec is True:
+        return TreeSink(huge_tree)
+    if isinstance(spec, str) or hasattr(spec, 'write'):
+        return FileSink(spec, huge_tree)
+    if callable(spec):
+        return make_sink(spec(message_id), message_id, huge_tree)
+    raise ValueError("Invalid reply sink: %r" % (spec,))
+
+
+class ReplyStreamer(object):
+
+    """Diverts the payload of replies that have a sink registered with the
+    session away from the framing buffer, one message at a time.
+
+    The framer passes every piece of payload to :meth:`feed` before keeping
+    it. While the root element of a message has not been seen, the payload
+    is also fed to a small pull parser. Once the message-id is known, either
+    the reply is claimed by its sink or the message is left to the framer.
+    The framer calls :meth:`end` at the end of every message.
+    """
+
+    PROBE_LIMIT = 64 * 1024
+    "Give up looking for the root element after this many bytes."
+
+    def __init__(self, session):
+        self._session = session
+        self._reset()
+
+    def _reset(self):
+        self._probe = None
+        self._head = None
+        self._sink = None
+        self._root = None
+        self._decided = False
+
+    def feed(self, data):
+        """Returns `True` if *data*, and all payload fed for this message
+        before it, belongs to a sink and must not be kept by the framer."""
+        if self._sink is not None:
+            self._sink.feed(data)
+            return True
+        if self._decided:
+            return False
+        if self._probe is None:
+            if not self._session._reply_sinks:
+                self._decided = True
+                return False
+            self._probe = _RootProbe()
+            self._head = bytearray()
+        self._head += data
+        try:
+            root = self._probe.feed(data)
+        except etree.XMLSyntaxError:
+            root = None
+            self._decided = True
+        if root is not None:
+            return self._claim(*root)
+        if len(self._head) > self.PROBE_LIMIT:
+            self._decided = True
+        return False
+
+    def _claim(self, tag, attrs):
+        self._decided = True
+        self._probe = None
+        msg_id = attrs.get('message-id')
+        sink = self._session._pop_reply_sink(msg_id) if msg_id else None
+        head, self._head = self._head, None
+        if sink is None:
+            return False
+        logger.debug('streaming reply %s to %r', msg_id, sink)
+        self._root = (tag, attrs)
+        self._sink = sink
+        sink.feed(head)
+        return True
+
+    def end(self):
+        """Finish the current message. Returns `True` if it was streamed, in
+        which case it has already been dispatched."""
+        sink, root = self._sink, self._root
+        self._reset()
+        if sink is None:
+            return False
+        sink.close()
+        self._session._dispatch_stream(root, sink)
+        return True
@@ -28,7 +28,7 @@ else:
 from ncclient.capabilities import Capabilities
 from ncclient.logging_ import SessionLoggerAdapter
 from ncclient.transport.errors import TLSError
-from ncclient.transport.session import Session
+from ncclient.transport.session import Session, ReceiveBuffer
 from ncclient.transport.parser import DefaultXMLParser
 
 logger = logging.getLogger("ncclient.transport.tls")
@@ -36,8 +36,6 @@ logger = logging.getLogger("ncclient.transport.tls")
 DEFAULT_TLS_NETCONF_PORT = 6513
 DEFAULT_TLS_TIMEOUT = 120
 
-BUF_SIZE = 4096
-
 
 class TLSSession(Session):
 
@@ -47,9 +45,9 @@ class TLSSession(Session):
         self._host = None
         self._connected = False
         self._socket = None
+        self._recv_buffer = ReceiveBuffer()
         self._buffer = StringIO()
         self._device_handler = device_handler
-        self._message_list = []
         self._closing = threading.Event()
         self.parser = DefaultXMLParser(self)
         self.logger = SessionLoggerAdapter(logger, {'session': self})
@@ -138,13 +136,13 @@ class TLSSession(Session):
         self._post_connect()
 
     def _transport_read(self):
-        return self._socket.recv(BUF_SIZE)
+        return self._recv_buffer.read(self._socket.recv_into)
 
     def _transport_write(self, data):
         return self._socket.send(data)
 
-    def _transport_register(self, selector, event):
-        selector.register(self._socket, event)
+    def _transport_register(self, selector, event, data=None):
+        return selector.register(self._socket, event, data)
 
     def _send_ready(self):
         # In contrast to Paramiko's `Channel`, pure python sockets do not
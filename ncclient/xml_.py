@@ -29,6 +29,7 @@ from lxml import etree
 # well as lxml v3.0+
 
 from ncclient import NCClientError
+from ncclient import tracing
 
 parser = etree.XMLParser(recover=False)
 huge_parser = etree.XMLParser(recover=False, huge_tree=True)
@@ -131,13 +132,119 @@ def to_ele(x, huge_tree=False):
 
 def parse_root(raw):
     "Efficiently parses the root element of a *raw* XML document, returning a tuple of its qualified name and attribute dictionary."
+    if isinstance(raw, ParsedMessage):
+        return raw.head
+    tracer = tracing.tracer
+    start = tracing.now() if tracer is not None else None
     if sys.version < '3':
         fp = StringIO(raw)
     else:
         fp = BytesIO(raw.encode('UTF-8'))
     for event, element in etree.iterparse(fp, events=('start',)):
+        if tracer is not None:
+            tracer.span('parse_root', start, tracing.now(), size=len(fp.getvalue()))
         return (element.tag, element.attrib)
 
+class ParsedMessage(str):
+
+    """A message received by a session, parsed only as far and as often as
+    needed. It is the *raw* XML string itself, so it can be handed to
+    anything that expects one, and carries what has been parsed of it:
+
+    * :attr:`data`, the UTF-8 encoded message, encoded once
+    * :attr:`tag`, :attr:`attrs` and :attr:`message_id` of the root element,
+      from a scan of its start tag only
+    * :attr:`root`, the whole document, parsed on first access
+
+    The session creates one per message and passes it to its listeners as
+    *raw*, so that the :class:`~ncclient.operations.rpc.RPCReply`, the
+    :class:`~ncclient.transport.notify.Notification` and whoever displays
+    the message share a single parse.
+
+    The element tree is shared: whoever wants to change it must work on a
+    copy. Two threads asking for :attr:`root` at the same time may each
+    parse the message, one of the trees is kept.
+    """
+
+    def __new__(cls, raw):
+        self = str.__new__(cls, raw)
+        self._data = None
+        self._head = None
+        self._root = None
+        return self
+
+    @property
+    def data(self):
+        "The message encoded as UTF-8."
+        if self._data is None:
+            self._data = self.encode('UTF-8')
+        return self._data
+
+    @property
+    def size(self):
+        "Size of the message in bytes."
+        return len(self.data)
+
+    @property
+    def head(self):
+        "A tuple of the qualified name and attribute dictionary of the root element, as returned by :func:`parse_root`."
+        if self._head is None:
+            if self._root is not None:
+                self._head = (self._root.tag, self._root.attrib)
+            else:
+                tracer = tracing.tracer
+                start = tracing.now() if tracer is not None else None
+                for event, element in etree.iterparse(BytesIO(self.data), events=('start',)):
+                    self._head = (element.tag, element.attrib)
+                    break
+                if tracer is not None:
+                    tracer.span('parse_root', start, tracing.now(), size=self.size)
+        return self._head
+
+    @property
+    def tag(self):
+        "Qualified name of the root element."
+        return self.head[0]
+
+    @property
+    def attrs(self):
+        "Attributes of the root element."
+        return self.head[1]
+
+    @property
+    def message_id(self):
+        "The message-id attribute of the root element, `None` if it has none."
+        return self.head[1].get('message-id')
+
+    @property
+    def parsed(self):
+        "Whether :attr:`root` has been parsed yet."
+        return self._root is not None
+
+    @property
+    def root(self):
+        "The root :class:`~lxml.etree._Element` of the message, parsed on first access."
+        return self.element()
+
+    def element(self, huge_tree=False):
+        """Returns :attr:`root`, parsing the message with *huge_tree* if that
+        has not been done yet.
+
+        *huge_tree*: parse XML with very deep trees and very long text content
+        """
+        if self._root is None:
+            tracer = tracing.tracer
+            start = tracing.now() if tracer is not None else None
+            self._root = etree.fromstring(self.data, parser=_get_parser(huge_tree))
+            if tracer is not None:
+                tracer.span('parse_tree', start, tracing.now(), size=self.size)
+        return self._root
+
+    def __reduce__(self):
+        # pickled and copied as the plain string, lxml trees do not pickle
+        return (str, (str(self),))
+
+
 def validated_element(x, tags=None, attrs=None):
     """Checks if the root element of an XML document or Element meets the supplied criteria.
 
@@ -236,8 +343,12 @@ class NCElement(object):
         self.__parser = etree.XMLParser(remove_blank_text=True, huge_tree=self.__huge_tree)
         self.__xslt_doc = etree.parse(io.BytesIO(self.__xslt), self.__parser)
         self.__transform = etree.XSLT(self.__xslt_doc)
-        self.__root = etree.fromstring(str(self.__transform(etree.parse(StringIO(str(rpc_reply)),
-                                                                        parser=self.__parser))),
+        if isinstance(rpc_reply.xml, ParsedMessage):
+            # transform the reply as the session parsed it, instead of parsing it again
+            source = rpc_reply.root
+        else:
+            source = etree.parse(StringIO(str(rpc_reply)), parser=self.__parser)
+        self.__root = etree.fromstring(str(self.__transform(source)),
                                        parser=self.__parser)
         return self.__root
 
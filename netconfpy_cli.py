@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""netconfpy-cli: 不启动GUI，在一个或多个会话上执行收藏夹中的请求或XML文件，
+结果按JSON Lines输出，每个会话的每个请求一行。
+
+会话和收藏夹读取自NetConf Tool保存的setting.json，例如：
+
+    python3 netconfpy_cli.py -s core-1 -s core-2 -f "Daily/get-config" -o result.jsonl
+    python3 netconfpy_cli.py --all-sessions -x get-config.xml
+    python3 netconfpy_cli.py --host 192.0.2.1:830 -u admin -x - < rpc.xml
+    python3 netconfpy_cli.py --list
+
+每行的内容：session, host, port, request(序号), name(收藏夹路径或文件名),
+operation, status(ok/rpc-error/failed/skipped), time(发送时间, UTC), latency_ms,
+reply(应答XML), error(失败原因), rpc_errors(rpc-error的type/tag/severity/path/message)。
+所有请求的status都为ok时退出码为0，否则为1。
+
+只依赖ncclient，不导入PyQt5，可在没有显示的cron和CI容器中运行；
+ncclient在参数检查通过后才导入，--help和--list不需要它。
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# 收藏夹节点data为[name, xml, type]，type为1时是分类
+FAVORITE_CATEGORY = 1
+# 与device_manage.SessionOption.SessionType相同
+SESSION_CALLHOME = 1
+DEFAULT_PARALLEL = 16
+
+def setting_dir() -> str:
+    "与utils.AppInfo.settingDir()相同的目录(QStandardPaths.GenericConfigLocation下的NetconfTool)"
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~/AppData/Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Preferences')
+    else:
+        base = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+    return os.path.join(base, 'NetconfTool')
+
+def load_settings(path=None) -> dict:
+    "读取setting.json，格式见data.AppData"
+    if path is None:
+        path = os.path.join(setting_dir(), 'setting.json')
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def favorite_nodes(node: dict, path=()):
+    "按收藏夹中的顺序列出所有节点，返回(路径, 节点)，路径为各级名称的元组"
+    for child in node.get('children', []):
+        child_path = path + (str(child['data'][0]),)
+        yield child_path, child
+        yield from favorite_nodes(child, child_path)
+
+def favorite_requests(favorite: dict, name: str) -> list:
+    """查找收藏夹中的请求，返回[(路径, xml)]。
+    name为用'/'分隔的完整路径，或者唯一的节点名称；是分类时返回其下所有的请求"""
+    found = [(p, n) for p, n in favorite_nodes(favorite)
+             if '/'.join(p) == name or ('/' not in name and p[-1] == name)]
+    if not found:
+        raise LookupError(f"favorite '{name}' not found")
+    if len(found) > 1:
+        raise LookupError(f"favorite '{name}' is ambiguous: " +
+                          ', '.join('/'.join(p) for p, _ in found))
+    path, node = found[0]
+    if node['data'][2] != FAVORITE_CATEGORY:
+        return [('/'.join(path), node['data'][1])]
+    return [('/'.join(path + p), n['data'][1]) for p, n in favorite_nodes(node)
+            if n['data'][2] != FAVORITE_CATEGORY]
+
+def select_sessions(sessions: list, names: list) -> list:
+    "按名称(或地址)选择保存的会话"
+    selected = []
+    for name in names:
+        found = [s for s in sessions if s.get('name') == name]
+        if not found:
+            found = [s for s in sessions if s.get('host') == name]
+        if not found:
+            raise LookupError(f"session '{name}' not found")
+        if len(found) > 1:
+            raise LookupError(f"session '{name}' is ambiguous, there are {len(found)} of them")
+        selected.append(found[0])
+    return selected
+
+def host_session(host: str, args) -> dict:
+    "--host HOST[:PORT]对应的会话配置"
+    port = 830
+    if host.startswith('['):
+        # [IPv6]:PORT
+        addr, _, rest = host[1:].partition(']')
+        if rest.startswith(':'):
+            port = int(rest[1:])
+        host = addr
+    elif host.count(':') == 1:
+        host, port = host.split(':')
+        port = int(port)
+    return {'name': host, 'host': host, 'port': port, 'user': args.user,
+            'passwd': args.password or os.environ.get('NETCONF_PASSWORD', ''),
+            'timeout': args.timeout or 60}
+
+def read_xml_file(path: str) -> str:
+    if path == '-':
+        return sys.stdin.read()
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def prepare_request(text: str) -> str:
+    "与会话窗口发送请求前的处理相同：去掉只有空白的文本，<rpc>中的请求取出来单独发送"
+    from ncclient.xml_ import to_ele, to_xml, etree
+    rpc = to_ele(text)
+    for elem in rpc.iter():
+        if elem.text and elem.text.isspace():
+            elem.text = None
+    if etree.QName(rpc).localname == 'rpc':
+        if not len(rpc):
+            raise ValueError("<rpc> without an operation")
+        rpc = rpc[-1]
+    return to_xml(rpc)
+
+class Runner(object):
+    "每个会话一个连接，会话内按顺序执行所有请求，最多parallel个会话同时进行"
+    def __init__(self, sessions: list, requests: list, out, timeout=None):
+        self._sessions = sessions
+        self._requests = requests
+        self._out = out
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.failures = 0
+
+    def run(self, parallel: int):
+        # paramiko只在解析ssh_config的"Match exec"时用到invoke，导入它的时间比ncclient的其他部分加起来还长；
+        # 这里不读取ssh_config
+        sys.modules.setdefault('invoke', None)
+        from ncclient import manager
+        from ncclient.operations import RaiseMode
+        from ncclient.transport import SessionReactor
+        from ncclient.devices.undefined import UndefinedDeviceHandler
+        from ncclient.xml_ import to_ele
+        self._manager, self._raise_mode = manager, RaiseMode.NONE
+        self._handler, self._to_ele = UndefinedDeviceHandler, to_ele
+        # 和GUI一样，所有会话共用一个线程读取报文
+        self._reactor = SessionReactor('netconfpy-cli')
+
+        todo = queue.Queue()
+        for cfg in self._sessions:
+            todo.put(cfg)
+        workers = [threading.Thread(target=self._work, args=(todo,), daemon=True)
+                   for _ in range(min(parallel, len(self._sessions)))]
+        for w in workers:
+            w.start()
+        try:
+            for w in workers:
+                # 带超时的join，Ctrl+C可以中断等待
+                while w.is_alive():
+                    w.join(0.2)
+        except KeyboardInterrupt:
+            self._stopped.set()
+            raise
+
+    def _work(self, todo: queue.Queue):
+        while not self._stopped.is_set():
+            try:
+                cfg = todo.get_nowait()
+            except queue.Empty:
+                return
+            self._run_session(cfg)
+
+    def _run_session(self, cfg: dict):
+        mgr = None
+        error = None
+        if cfg.get('type', 0) == SESSION_CALLHOME:
+            error = "NETCONF Call Home sessions are not supported"
+        else:
+            try:
+                timeout = self._timeout or cfg.get('timeout', 60)
+                mgr = self._manager.connect_ssh(host=cfg['host'], port=cfg['port'],
+                                                username=cfg['user'], password=cfg['passwd'],
+                                                hostkey_verify=False, timeout=timeout,
+                                                device_params={'handler': self._handler},
+                                                reactor=self._reactor)
+                mgr.timeout = timeout
+                mgr.raise_mode = self._raise_mode
+                mgr.huge_tree = True
+            except Exception as ex:
+                error = f"connect failed: {ex}"
+        try:
+            for seq, (name, xml) in enumerate(self._requests):
+                record = {'session': cfg.get('name') or cfg['host'], 'host': cfg['host'],
+                          'port': cfg['port'], 'request': seq, 'name': name}
+                if error is not None:
+                    # 连接失败，或前一个请求没有收到应答，剩余的请求不再发送
+                    record['status'] = 'failed' if mgr is None else 'skipped'
+                    record['error'] = error
+                elif self._stopped.is_set():
+                    record['status'] = 'skipped'
+                    record['error'] = "interrupted"
+                else:
+                    error = self._execute(mgr, xml, record)
+                self._write(record)
+        finally:
+            if mgr is not None:
+                try:
+                    if mgr.connected:
+                        mgr.close_session()
+                except Exception:
+                    pass
+
+    def _execute(self, mgr, xml: str, record: dict):
+        "发送一个请求并等待应答，填写record；没有收到应答时返回原因"
+        rpc = self._to_ele(xml)
+        record['operation'] = rpc.tag.rpartition('}')[2]
+        record['time'] = datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        start = time.monotonic()
+        try:
+            reply, _ = mgr.dispatch(rpc)
+        except Exception as ex:
+            record['latency_ms'] = int((time.monotonic() - start) * 1000)
+            record['status'] = 'failed'
+            record['error'] = str(ex) or ex.__class__.__name__
+            return record['error']
+        record['latency_ms'] = int((time.monotonic() - start) * 1000)
+        record['reply'] = str(reply.xml)
+        if reply.error:
+            record['status'] = 'rpc-error'
+            record['rpc_errors'] = [{'type': e.type, 'tag': e.tag, 'severity': e.severity,
+                                     'path': e.path, 'message': e.message} for e in reply.errors]
+        else:
+            record['status'] = 'ok'
+        return None
+
+    def _write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if record['status'] != 'ok':
+                self.failures += 1
+            self._out.write(line + '\n')
+            self._out.flush()
+
+def list_settings(settings: dict, out):
+    out.write("Sessions:\n")
+    for s in settings.get('session', []):
+        out.write(f"  {s.get('name') or s.get('host')}\t{s.get('host')}:{s.get('port')}\n")
+    out.write("Favorites:\n")
+    for path, node in favorite_nodes(settings.get('favorite', {})):
+        suffix = '/' if node['data'][2] == FAVORITE_CATEGORY else ''
+        out.write(f"  {'/'.join(path)}{suffix}\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='netconfpy-cli',
+        description="Run favorites or XML requests on NETCONF sessions saved by NetConf Tool, "
+                    "and write one JSON line per session and request.")
+    parser.add_argument('-s', '--session', action='append', default=[], metavar='NAME',
+                        help="saved session to run on, by name or host (repeatable)")
+    parser.add_argument('-a', '--all-sessions', action='store_true',
+                        help="run on all the saved sessions")
+    parser.add_argument('--host', action='append', default=[], metavar='HOST[:PORT]',
+                        help="device that is not saved as a session (repeatable)")
+    parser.add_argument('-u', '--user', default=os.environ.get('NETCONF_USER', ''),
+                        help="user name for --host (default: $NETCONF_USER)")
+    parser.add_argument('-p', '--password', default=None,
+                        help="password for --host (default: $NETCONF_PASSWORD)")
+    parser.add_argument('-f', '--favorite', dest='requests', action='append', metavar='PATH',
+                        type=lambda v: ('favorite', v),
+                        help="favorite to run, 'Category/Name' or a unique name; "
+                             "a category runs all the requests in it (repeatable)")
+    parser.add_argument('-x', '--xml', dest='requests', action='append', metavar='FILE',
+                        type=lambda v: ('xml', v),
+                        help="XML file with a request to run, - for stdin (repeatable)")
+    parser.add_argument('-j', '--parallel', type=int, default=None, metavar='N',
+                        help="sessions to run at the same time "
+                             "(default: as set in the GUI, or %d)" % DEFAULT_PARALLEL)
+    parser.add_argument('-t', '--timeout', type=int, default=None, metavar='SECONDS',
+                        help="connect and reply timeout (default: that of each session)")
+    parser.add_argument('-o', '--output', default='-', metavar='FILE',
+                        help="JSON Lines file to write the results to (default: stdout)")
+    parser.add_argument('--settings', default=None, metavar='FILE',
+                        help="setting.json to use (default: %s)"
+                             % os.path.join(setting_dir(), 'setting.json'))
+    parser.add_argument('--list', action='store_true',
+                        help="list the saved sessions and favorites, and exit")
+    args = parser.parse_args(argv)
+
+    try:
+        settings = load_settings(args.settings)
+    except (OSError, ValueError) as ex:
+        parser.error(f"cannot read settings: {ex}")
+    if args.list:
+        list_settings(settings, sys.stdout)
+        return 0
+
+    saved = settings.get('session', [])
+    try:
+        sessions = list(saved) if args.all_sessions else select_sessions(saved, args.session)
+    except LookupError as ex:
+        parser.error(str(ex))
+    sessions += [host_session(h, args) for h in args.host]
+    if not sessions:
+        parser.error("no session given, use --session, --all-sessions or --host")
+    if not args.requests:
+        parser.error("no request given, use --favorite or --xml")
+
+    requests = []
+    try:
+        for kind, value in args.requests:
+            if kind == 'favorite':
+                found = favorite_requests(settings.get('favorite', {}), value)
+                if not found:
+                    raise LookupError(f"favorite category '{value}' is empty")
+                requests += found
+            else:
+                requests.append((value, read_xml_file(value)))
+    except (LookupError, OSError) as ex:
+        parser.error(str(ex))
+    for i, (name, xml) in enumerate(requests):
+        try:
+            requests[i] = (name, prepare_request(xml))
+        except Exception as ex:
+            parser.error(f"XML parse error in '{name}': {ex}")
+
+    parallel = args.parallel or settings.get('ui-config', {}).get('fleet_parallel', DEFAULT_PARALLEL)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        runner = Runner(sessions, requests, out, args.timeout)
+        runner.run(max(1, parallel))
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if runner.failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
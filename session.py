@@ -1,4 +1,5 @@
 import os
+import random
 import socket
 import time
 import typing
@@ -8,41 +9,72 @@ from PyQt5.QtWidgets import QWidget
 from ncclient import manager
 from ncclient.operations import RPC, RaiseMode
 from ncclient.operations.errors import MissingCapabilityError, OperationError
-from ncclient.devices.default import DefaultDeviceHandler
+from ncclient.devices.undefined import UndefinedDeviceHandler
 from ncclient.transport.notify import NotificationM
+from ncclient.transport import SessionReactor, NotificationPolicy, AuthenticationError
 from ncclient.xml_ import *
+from ncclient import tracing
 from device_manage import *
 from xmleditor import XmlEdit, FindDialg
-from threading import Thread, Event
+from threading import Thread, Event, Condition
 from utils import pretty_xml, millsecondToStr
 import logging
 from session_history import SessionHistoryWidget, SessionOperType
 
 log = logging.getLogger('netconftool.session')
 
-class UndefinedDeviceHandler(DefaultDeviceHandler):
-    """
-    Undefined handler for device specific information.
-
-    In the device_params dictionary, which is passed to __init__, you can specify
-    the parameter "ssh_subsystem_name". That allows you to configure the preferred
-    SSH subsystem name that should be tried on your Undefined switch. If connecting with
-    that name fails, or you didn't specify that name, the other known subsystem names
-    will be tried. However, if you specify it then this name will be tried first.
-
-    """
-    _EXEMPT_ERRORS = []
+# all the open sessions are served by one thread instead of a thread each
+session_reactor = SessionReactor('netconftool-sessions')
+
+# 每个会话缓存的未处理通告上限，超出后丢弃最早的通告；
+# 会话共用session_reactor线程，不能使用NotificationPolicy.BLOCK
+NOTIFICATION_CAPACITY = 10000
+# 通告合并后投递给GUI线程，两批之间的最小间隔(ms)及每批的最大数量
+NOTIFICATION_INTERVAL = 100
+NOTIFICATION_BATCH_MAX = 2000
+# 同时建立连接的会话数上限，以及批量连接时连接失败后的重试次数；
+# 第一次重试前等待CONNECT_RETRY_DELAY秒，之后每次加倍，不超过CONNECT_RETRY_MAX秒
+CONNECT_PARALLEL = 8
+CONNECT_RETRIES = 3
+CONNECT_RETRY_DELAY = 2
+CONNECT_RETRY_MAX = 60
+
+class ConnectLimiter(object):
+    """限制同时建立的连接数，各会话的NccProxy线程共用，
+    避免大量会话同时重连时压垮设备和AAA服务器。retries为批量连接时的重试次数"""
+    def __init__(self, limit: int, retries: int):
+        self._cond = Condition()
+        self._limit = limit
+        self._active = 0
+        self.retries = retries
+
+    def configure(self, limit: int, retries: int):
+        with self._cond:
+            self._limit = max(1, limit)
+            self.retries = max(0, retries)
+            self._cond.notify_all()
+
+    def acquire(self, running: Event) -> bool:
+        "等待空闲的名额，等待期间running被清除(会话已关闭)时返回False"
+        with self._cond:
+            while self._active >= self._limit:
+                if not running.is_set():
+                    return False
+                self._cond.wait(0.5)
+            self._active += 1
+            return True
 
-    def __init__(self, device_params):
-        super(UndefinedDeviceHandler, self).__init__(device_params)
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
 
-    def get_xml_base_namespace_dict(self):
-        return {None: BASE_NS_1_0}
+    @staticmethod
+    def retryDelay(attempt: int) -> float:
+        "第attempt次重试前等待的秒数，在0.5~1.5倍之间随机浮动，使同时断开的会话错开重连"
+        return min(CONNECT_RETRY_DELAY * 2 ** attempt, CONNECT_RETRY_MAX) * random.uniform(0.5, 1.5)
 
-    def get_xml_extra_prefix_kwargs(self):
-        d = {}
-        d.update(self.get_xml_base_namespace_dict())
-        return {"nsmap": d}
+connect_limiter = ConnectLimiter(CONNECT_PARALLEL, CONNECT_RETRIES)
 
 def datastore_or_url(wha, loc, capcheck=None):
     node = etree.Element(wha)
@@ -56,9 +88,12 @@ def datastore_or_url(wha, loc, capcheck=None):
 
 class _NccProxSignal(QObject):
     connectInfoChanged = pyqtSignal(str)
-    notificationRecvied = pyqtSignal(str)
+    notificationsRecvied = pyqtSignal(list)
     connectionStatusChanged = pyqtSignal(bool)
     errorNoitfy = pyqtSignal(str)
+    connectProgress = pyqtSignal(str)
+    connectFailed = pyqtSignal(str)
+    rpcDone = pyqtSignal(object)
 
 class NccProxy(Thread, QObject):
 
@@ -70,12 +105,21 @@ class NccProxy(Thread, QObject):
         self.setDaemon(True)
         self.__runing = Event()
         self.__connect = Event()
+        # 打断连接失败后重试前的等待
+        self.__wakeup = Event()
+        self._retries = 0
+        # 与之共用SSH连接的Manager，只用于下一次连接
+        self._share = None
         self._is_connected = False
         self.__connect.clear()
         self.signals = _NccProxSignal()
+        # 会话线程中完成的RPC总是排队交给GUI线程处理
+        self.signals.rpcDone.connect(self._onRpcDone, Qt.QueuedConnection)
+        self._waiting = {}  # RPC -> (callback, 超时定时器, 开始等待的时间)
         self.__runing.set()
-        self.__abort_wait = Event()
-        self.__abort_wait.clear()
+        self.__delivered = Event()
+        self.__delivered.set()
+        self._nextDelivery = 0
         self._manager = None
         self.start()
 
@@ -107,27 +151,23 @@ class NccProxy(Thread, QObject):
                     log.info("NccProxy start connect: %s!", self.connect_info)
                     try:
                         cfg = self._cfg
-                        self._manager = manager.connect_ssh(host=cfg["host"], port=cfg["port"],
-                                                            username=cfg["user"], password=cfg["passwd"],
-                                                            hostkey_verify=False, timeout=60, keepalive=60,
-                                                            device_params={'handler':UndefinedDeviceHandler})
+                        self._manager = self._connectManager()
                         self._manager.timeout = cfg.get('timeout', 60)
                         self._manager.raise_mode = RaiseMode.NONE
                         self._manager.async_mode = True
                         self._manager.huge_tree = True
+                        self._setupManager(self._manager)
                     except Exception as e:
                         log.info("NccProxy connect[%s] failed: %s",  self.connect_info, str(e))
                         self.__connect.clear()
                         self._setConnectState(False)
-                        self.signals.errorNoitfy.emit("Connect failed: " + str(e))
+                        self.signals.connectFailed.emit("Connect failed: " + str(e))
                     else:
                         log.info("NccProxy connect succ: %s", self.connect_info)
                         self._setConnectState(True)
                 else:
                     if self._manager.connected:
-                        ntf = self._manager.take_notification(block=True, timeout=1)
-                        if ntf != None:
-                            self.signals.notificationRecvied.emit(ntf.notification_xml)
+                        self._takeNotifications()
                     else:
                         log.info("NccProxy connect is lost: %s!", self.connect_info)
                         self._setConnectState(False)
@@ -148,10 +188,95 @@ class NccProxy(Thread, QObject):
             self.signals.errorNoitfy.emit(str(e))
             self.close()
 
+    def _connectManager(self):
+        """建立连接，同时建立的连接数受connect_limiter限制。
+        失败后重试self._retries次(认证失败不重试)，等待时间见ConnectLimiter.retryDelay。
+        指定了共用的会话时先在它的SSH连接上打开新的通道，省去TCP连接、密钥交换和认证，失败时再单独连接"""
+        cfg = self._cfg
+        share, self._share = self._share, None
+        if share is not None and share.connected:
+            try:
+                return manager.connect_ssh(share_transport=share, timeout=60,
+                                           device_params={'handler':UndefinedDeviceHandler},
+                                           reactor=session_reactor)
+            except Exception as e:
+                log.info("NccProxy open channel on shared connection[%s] failed: %s", self.connect_info, e)
+        attempt = 0
+        while True:
+            if not connect_limiter.acquire(self.__runing):
+                raise UserWarning("Session was closed")
+            try:
+                return manager.connect_ssh(host=cfg["host"], port=cfg["port"],
+                                           username=cfg["user"], password=cfg["passwd"],
+                                           hostkey_verify=False, timeout=60, keepalive=60,
+                                           device_params={'handler':UndefinedDeviceHandler},
+                                           reactor=session_reactor)
+            except AuthenticationError:
+                raise
+            except Exception as e:
+                if attempt >= self._retries or not self.__runing.is_set():
+                    raise
+                error = e
+            finally:
+                connect_limiter.release()
+            delay = connect_limiter.retryDelay(attempt)
+            attempt += 1
+            log.info("NccProxy connect[%s] failed: %s, retry %d in %.1fs", self.connect_info, error, attempt, delay)
+            self.signals.connectProgress.emit(f"Connect failed: {error}. Retrying in {delay:.1f} seconds ({attempt}/{self._retries})...")
+            self.__wakeup.clear()
+            self.__wakeup.wait(delay)
+
+    def _takeNotifications(self):
+        """从会话取出通告，合并成一批后交给GUI线程。两批之间至少间隔notification_interval毫秒，
+        上一批处理完之前不投递下一批，GUI处理不过来时通告留在会话的有界队列中，按其策略丢弃"""
+        interval = self._cfg.get('notification_interval', NOTIFICATION_INTERVAL) / 1000
+        batch = []
+        while self.__runing.is_set() and self._manager.connected:
+            wait = self._nextDelivery - time.monotonic()
+            if batch and wait <= 0 and self.__delivered.is_set():
+                break
+            if len(batch) >= NOTIFICATION_BATCH_MAX:
+                if self.__delivered.is_set():
+                    time.sleep(wait)
+                else:
+                    self.__delivered.wait(0.1)
+                continue
+            ntf = self._manager.take_notification(block=True, timeout=max(wait, 0.01) if batch else 1)
+            if ntf is not None:
+                # 在本线程中生成通知摘要，GUI线程无需再解析报文
+                batch.append(NotificationM(ntf))
+            elif not batch:
+                return
+        if batch:
+            self.__delivered.clear()
+            self._nextDelivery = time.monotonic() + interval
+            self.signals.notificationsRecvied.emit(batch)
+
+    def notificationsDelivered(self):
+        "GUI线程处理完一批通告后调用"
+        self.__delivered.set()
+
     def setManager(self, mgr):
         if mgr.connected:
+            self._setupManager(mgr)
             self._manager = mgr
 
+    def _setupManager(self, mgr):
+        mgr.notification_capacity = self._cfg.get('notification_capacity', NOTIFICATION_CAPACITY)
+        mgr.notification_policy = self._cfg.get('notification_policy', NotificationPolicy.DROP_OLDEST)
+        # 导出统计数据时用于区分会话
+        mgr.metrics_labels['name'] = self.connect_info
+
+    def notificationStats(self):
+        "通告队列的统计数据，未连接时返回None"
+        mgr = getattr(self, '_manager', None)  # 断开时会被临时删除
+        return mgr.notification_stats if mgr else None
+
+    def metrics(self):
+        "会话的统计数据(Manager.metrics())，未连接时返回None"
+        mgr = getattr(self, '_manager', None)
+        return mgr.metrics() if mgr else None
+
     @property
     def connect_info(self) -> str:
         return str('%s@%s:%d'%(self._cfg.get('user', '-'), self._cfg.get('host', '-'), self._cfg.get('port', '-')))
@@ -164,8 +289,13 @@ class NccProxy(Thread, QObject):
     def is_connected(self):
         return self._is_connected
 
-    def connect(self):
+    def connect(self, retries=0, share=None):
+        "在会话线程中建立连接，失败后重试retries次；share为已连接的Manager时与其共用SSH连接"
+        self._retries = retries
+        self._share = share
         self.__connect.set()
+        # 正在等待重试时立即重试
+        self.__wakeup.set()
 
     def disconnect(self):
         log.info("NccProxy close session!")
@@ -173,30 +303,41 @@ class NccProxy(Thread, QObject):
 
     def close(self):
         self.__runing.clear()
+        self.__wakeup.set()
 
     def reqAbort(self):
-        self.__abort_wait.set()
-
-    def _waitAsyncRPCReply(self, rpc: RPC):
-        loop = QEventLoop(self)
-        start_time = time.time()
-        end_time = start_time + self._cfg.get('timeout', 60)
-        self.__abort_wait.clear()
-        while not self.__abort_wait.is_set() and not rpc.event.isSet() and end_time > time.time():
-            if not loop.processEvents():
-                rpc.event.wait(0.01)
-
-        if self.__abort_wait.is_set():
-            raise UserWarning("User canceled the operation")
-
-        if rpc.event.isSet():
-            log.info("NccProxy rpc.event is set.")
-            if rpc.error:
-                raise rpc.error
-            else:
-                return rpc.reply
-        else:
-            raise TimeoutError('Waiting for RPC reply timeout')
+        "取消所有正在等待的应答"
+        for rpc in list(self._waiting):
+            self._finishWait(rpc, UserWarning("User canceled the operation"))
+
+    def waitReply(self, rpc: RPC, callback):
+        """等待rpc的应答，立即返回，不占用GUI线程。
+        应答到达、出错、超时或被取消后，在GUI线程中调用callback(reply, error)：
+        收到应答时error为None，否则reply为None，error为对应的异常"""
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        timer.timeout.connect(lambda: self._finishWait(rpc, TimeoutError('Waiting for RPC reply timeout')))
+        timer.start(int(self._cfg.get('timeout', 60) * 1000))
+        self._waiting[rpc] = (callback, timer, tracing.now())
+        # 在会话线程中调用，通过信号转到GUI线程
+        rpc.add_done_callback(self.signals.rpcDone.emit)
+
+    def _onRpcDone(self, rpc: RPC):
+        log.info("NccProxy rpc.event is set.")
+        self._finishWait(rpc, rpc.error)
+
+    def _finishWait(self, rpc: RPC, error):
+        entry = self._waiting.pop(rpc, None)
+        if entry is None:
+            # 已超时或被取消，之后到达的应答不再处理
+            return
+        callback, timer, trace_start = entry
+        timer.stop()
+        timer.deleteLater()
+        if tracing.tracer is not None:
+            tracing.tracer.span('wait_reply', trace_start, tracing.now(), message_id=rpc.id,
+                                replied=error is None)
+        callback(rpc.reply if error is None else None, error)
 
     # def rpc(self, rpc_command, source=None, filter=None, config=None, target=None, format=None):
     #     rpc, req = self._manager.rpc(rpc_command, source, filter, config, target, format)
@@ -204,22 +345,16 @@ class NccProxy(Thread, QObject):
 
     def dispatch(self, rpc_command, source=None, filter=None):
         rpc, req = self._manager.dispatch(rpc_command, source, filter)
-        # return self._waitAsyncRPCReply(rpc), req
         return rpc, req
 
     def get_schema(self, identifier, version=None, format=None):
         rpc, req = self._manager.get_schema(identifier, version, format)
-        # return self._waitAsyncRPCReply(rpc), req
         return rpc, req
 
     def get(self, filter=None, with_defaults=None):
         rpc, req = self._manager.get(filter, with_defaults)
-        # return self._waitAsyncRPCReply(rpc), req
         return rpc, req
 
-    def wait_asnync_reply(self, rpc):
-        return self._waitAsyncRPCReply(rpc)
-
 class QCallHome(QObject):
     info = pyqtSignal(str)
     done = pyqtSignal(bool)
@@ -280,7 +415,7 @@ class QCallHome(QObject):
                     self.info.emit('Callhome connection initiated from remote host {0}'.format(remote_host))
                     kwds['sock'] = sock
                     try:
-                        self.mgr = manager.connect_ssh(*args, **kwds)
+                        self.mgr = manager.connect_ssh(*args, reactor=session_reactor, **kwds)
                         self.mgr.timeout = kwds.get('timeout', 60)
                         self.mgr.raise_mode = RaiseMode.NONE
                         self.mgr.async_mode = True
@@ -441,17 +576,34 @@ class NetconfSession(QWidget):
         self._schemashow = None
         self._schemas = []
         self.initUI()
-        self._proxy.signals.notificationRecvied.connect(self._onRecveNotification)
+        self._proxy.signals.notificationsRecvied.connect(self._onRecveNotifications)
         self._proxy.signals.errorNoitfy.connect(self._msgBox)
+        self._proxy.signals.connectProgress.connect(self._onConnectProgress)
+        self._proxy.signals.connectFailed.connect(self._onConnectFailed)
         self._proxy.signals.connectionStatusChanged.connect(self._onDeviceConnectStatusChanged)
         self._widgetCgroupCtrl(False)
         self.raddr = None  #保存Call home的远端链接信息
+        self._quietConnect = False
         self.reconnectTimer = QTimer(self)
         self.reconnectTimer.setSingleShot(True)
         self.reconnectTimer.timeout.connect(self._reconnect)
+        self.statsTimer = QTimer(self)
+        self.statsTimer.setInterval(1000)
+        self.statsTimer.timeout.connect(self._updateStats)
+        self.statsTimer.start()
         self.sessionOperable = False
         self._displayName = ""
         self._datastoreLock = {}
+        # 请求发出300ms后仍未结束时才切换UI状态
+        self._busyTimer = QTimer(self)
+        self._busyTimer.setSingleShot(True)
+        self._busyTimer.timeout.connect(self.cgroupCtrlDelay)
+
+    def _updateStats(self):
+        "定时刷新通告队列及会话的统计数据"
+        self._notification.setQueueStats(self._proxy.notificationStats())
+        if self._statistics.isVisible():
+            self._statistics.setMetrics(self._proxy.metrics())
 
     def __del__(self):
         log.debug("NetconfSession __del__")
@@ -549,6 +701,8 @@ class NetconfSession(QWidget):
 
         self._sessionHistory = SessionHistoryWidget(self)
 
+        self._statistics = StatisticsWidget(self)
+
         other_group = QFrame(self)
         l_other = QVBoxLayout(other_group)
         l_other.setContentsMargins(0, 0, 0, 0)
@@ -557,6 +711,8 @@ class NetconfSession(QWidget):
         other.insertTab(0, self._log, "Log")
         other.insertTab(1, self._notification, "Notifications")
         other.insertTab(2, self._sessionHistory, "Session History")
+        other.insertTab(3, self._statistics, "Statistics")
+        other.currentChanged.connect(lambda index: self._updateStats())
 
         self._other = other
         l_other.addSpacing(5)
@@ -619,17 +775,23 @@ class NetconfSession(QWidget):
                 self._appendLog(f"  Error message: {err.message}", datetime=logtime,
                                 fcolor=Qt.GlobalColor.darkRed, newline=False)
 
-    def _sendXml(self):
+    def _sendXml(self, done=None):
+        """发送命令框中的请求，不等待应答即返回。
+        应答到达(或出错、超时、被取消)后在GUI线程中调用done(resp)，
+        resp为RPCReply，请求没有发出或没有收到应答时为None"""
+        if done is None:
+            done = lambda resp: None
         if not self.sessionOperable:
             log.info('Session is not operable now.')
-            return None
+            return done(None)
 
         try:
             rpc = to_ele(self._command.toPlainText())
         except Exception as ex:
             self._msgBox("XML parse error: %s" % (str(ex)))
-            return;
+            return done(None)
 
+        oper = msg_id = lockOpTarget = None
         try:
             log.info("etree.Qname(rpc).localname: %s", etree.QName(rpc).localname)
             # 清理只包含空格和换行内容的xml节点，RF4741规定节点必须包含非空白字符
@@ -655,10 +817,7 @@ class NetconfSession(QWidget):
 
             # 阻止发送新的请求，这里不立即控制UI状态，而是在300ms后启动UI状态切换, 避免UI闪动
             self.sessionOperable = False
-            timer = QTimer()
-            timer.setSingleShot(True)
-            timer.timeout.connect(self.cgroupCtrlDelay)
-            timer.start(300)
+            self._busyTimer.start(300)
             # 请求发送RPC
             rpc_obj, req = self._proxy.dispatch(rpc)
 
@@ -670,73 +829,90 @@ class NetconfSession(QWidget):
             send_time = QDateTime.currentDateTime()
             self._appendLog(f"RPC <{oper}> request to send, {msg_id}.", send_time)
             self._sessionHistory.appendHistory(send_time, SessionOperType.Out, req)
-            # 等待应答
             self._rawReply.clear()
-            resp = self._proxy.wait_asnync_reply(rpc_obj)
+        except Exception as e:
+            self._sendXmlFailed(oper, msg_id, e)
+            return done(None)
+
+        def onReply(resp, error):
             # 记录当前时间，用于日志显示
             cur_time = QDateTime.currentDateTime()
+            try:
+                if error is not None:
+                    raise error
+                # 获取该RPC的真实时间戳，计算真实耗时
+                timediff = self._tookTime(rpc_obj, send_time, cur_time)
+                # 转换成 xx hr xx min xx sec yy ms的形式
+                took_str = millsecondToStr(timediff)
+
+                self.update_response(resp.xml)
+
+                if resp.error:
+                    self._appendLog(f"Command <{oper}> was unsuccessful, {msg_id}. RPC error was reported:",
+                                    cur_time, fcolor=Qt.GlobalColor.darkRed, newline=False)
+                    self._appendLog_RPCErrorDetail(resp.errors, cur_time)
+                else:
+                    self._appendLog(f"Command <{oper}> was successful, {msg_id} (took {took_str}).",
+                                    cur_time, fcolor=Qt.GlobalColor.darkGreen, newline=False)
+                self._sessionHistory.appendHistory(cur_time, SessionOperType.In, resp.xml, extra=f'(took {took_str})')
+                # 释放UI控制
+                self._releaseUI()
+
+                # 锁状态特殊处理
+                if oper in ['lock','unlock']:
+                    opstate = True if resp.ok else False
+                    if opstate :
+                        lockstate = True if oper == 'lock' else False
+                        log.info("set %s lockstate %s", lockOpTarget, lockstate)
+                        self._datastoreLock[lockOpTarget] = lockstate
+
+                # 做一个UTF-8字符检查
+                if resp.non_utf8_tags:
+                    self._appendLog("Warning: The reply contains non UTF-8 characters!", cur_time,
+                                    fcolor=Qt.GlobalColor.darkMagenta)
+                    for tag in resp.non_utf8_tags:
+                        for line in str(pretty_xml(tag)).split('\n'):
+                            self._appendLog(f"  {line}", cur_time, fcolor=Qt.GlobalColor.darkMagenta, newline=False)
+            except Exception as e:
+                self._sendXmlFailed(oper, msg_id, e)
+                resp = None
+            try:
+                done(resp)
+            except Exception:
+                # 调用方回调中的错误只记录日志，不影响其他应答的处理
+                log.exception("RPC <%s> %s reply callback failed", oper, msg_id)
 
-            # 获取真实时间戳，计算真实耗时
-            timediff = self._proxy._manager.get_tooktime(msgid)
-            if timediff == 0:
-                log.info(f"Get real timestamp fail!")
-                timediff = send_time.msecsTo(cur_time)
-            # 转换成 xx hr xx min xx sec yy ms的形式
-            took_str = millsecondToStr(timediff)
-
-            self.update_response(resp.xml)
+        # 等待应答期间GUI线程保持空闲
+        self._proxy.waitReply(rpc_obj, onReply)
 
-            if resp.error:
-                self._appendLog(f"Command <{oper}> was unsuccessful, {msg_id}. RPC error was reported:",
-                                cur_time, fcolor=Qt.GlobalColor.darkRed, newline=False)
-                self._appendLog_RPCErrorDetail(resp.errors, cur_time)
-            else:
-                self._appendLog(f"Command <{oper}> was successful, {msg_id} (took {took_str}).",
-                                cur_time, fcolor=Qt.GlobalColor.darkGreen, newline=False)
-            self._sessionHistory.appendHistory(cur_time, SessionOperType.In, resp.xml, extra=f'(took {took_str})')
-            # 释放UI控制
-            self._bt_abort.setEnabled(False)
-            self._widgetCgroupCtrl(True)
+    def _sendXmlFailed(self, oper, msg_id, e):
+        cur_time = QDateTime.currentDateTime()
+        self._appendLog(f"Command <{oper}> was unsuccessful, {msg_id}. ({str(e)})",
+                        cur_time, fcolor=Qt.GlobalColor.darkRed, newline=False)
+        self._releaseUI()
 
-            # 锁状态特殊处理
-            if oper in ['lock','unlock']:
-                opstate = True if resp.ok else False
-                if opstate :
-                    lockstate = True if oper == 'lock' else False
-                    log.info("set %s lockstate %s", lockOpTarget, lockstate)
-                    self._datastoreLock[lockOpTarget] = lockstate
-
-            # 做一个UTF-8字符检查
-            if resp.non_utf8_tags:
-                self._appendLog("Warning: The reply contains non UTF-8 characters!", cur_time,
-                                fcolor=Qt.GlobalColor.darkMagenta)
-                for tag in resp.non_utf8_tags:
-                    for line in str(pretty_xml(tag)).split('\n'):
-                        self._appendLog(f"  {line}", cur_time, fcolor=Qt.GlobalColor.darkMagenta, newline=False)
-
-            return resp
-        except Exception as e:
-            cur_time = QDateTime.currentDateTime()
-            self._appendLog(f"Command <{oper}> was unsuccessful, {msg_id}. ({str(e)})",
-                            cur_time, fcolor=Qt.GlobalColor.darkRed, newline=False)
-            self._bt_abort.setEnabled(False)
-            self._widgetCgroupCtrl(True)
+    def _releaseUI(self):
+        "请求结束，恢复UI状态"
+        self._busyTimer.stop()
+        self._bt_abort.setEnabled(False)
+        self._widgetCgroupCtrl(self.connected)
 
     def cgroupCtrlDelay(self):
         self._widgetCgroupCtrl(False)
         self._bt_abort.setEnabled(True)
 
-    def setCommandXML(self, cxml, execute=False):
-        if not len(cxml):
-            return
-
-        if not self.sessionOperable:
-            log.info('Session is not operable now.')
+    def setCommandXML(self, cxml, execute=False, done=None):
+        "execute为True时发送请求，应答后调用done(resp)，见_sendXml"
+        if not len(cxml) or not self.sessionOperable:
+            if len(cxml):
+                log.info('Session is not operable now.')
+            if execute and done:
+                done(None)
             return
 
         self._command.setXml(cxml)
         if execute:
-            return self._sendXml()
+            self._sendXml(done)
 
     def _appendLog(self, logstr, datetime = None, fcolor=Qt.GlobalColor.black, newline=True):
         if datetime:
@@ -766,12 +942,27 @@ class NetconfSession(QWidget):
 
         cursor.endEditBlock()
 
-    def _onRecveNotification(self, ntf):
-        dt = QDateTime.currentDateTime()
-        ntf = NotificationM(ntf)
-        self._appendLog(f"Received a notification <{ntf.notifcaiton_name}>.", dt, fcolor=Qt.GlobalColor.darkYellow)
-        self._notification.appendNotification(dt, ntf)
-        self._sessionHistory.appendHistory(dt, SessionOperType.In, ntf.notification_xml)
+    def _onRecveNotifications(self, ntfs: list):
+        try:
+            dt = QDateTime.currentDateTime()
+            if len(ntfs) == 1:
+                self._appendLog(f"Received a notification <{ntfs[0].notifcaiton_name}>.", dt,
+                                fcolor=Qt.GlobalColor.darkYellow)
+            else:
+                names = {}
+                for ntf in ntfs:
+                    names[ntf.notifcaiton_name] = names.get(ntf.notifcaiton_name, 0) + 1
+                brief = ', '.join(f'<{name}> x{count}' for name, count in list(names.items())[:5])
+                if len(names) > 5:
+                    brief += ', ...'
+                self._appendLog(f"Received {len(ntfs)} notifications: {brief}.", dt, fcolor=Qt.GlobalColor.darkYellow)
+            items = [(QDateTime.fromMSecsSinceEpoch(int(ntf.received_time * 1000)), ntf) for ntf in ntfs]
+            self._notification.appendNotifications(items)
+            self._sessionHistory.appendHistories(
+                [(rt, SessionOperType.In, ntf.notification_xml, f'<notification><eventTime><{ntf.notifcaiton_name}>', None)
+                 for rt, ntf in items])
+        finally:
+            self._proxy.notificationsDelivered()
 
     def _onNotificationCountChagned(self, count: int):
         if count == 0 :
@@ -807,8 +998,10 @@ class NetconfSession(QWidget):
             self._clearConnectionsSensitiveData()
             if self._userDisconnet == False:
                 if self._conf_data.get('auto-reconnect', False):
-                    msg = "Session was terminated unexpectedly and will be reconnected in 60 seconds."
-                    self.reconnectTimer.start(60*1000)
+                    # 随机浮动，同时断开的会话错开重连
+                    delay = random.uniform(45, 75)
+                    msg = f"Session was terminated unexpectedly and will be reconnected in {delay:.0f} seconds."
+                    self.reconnectTimer.start(int(delay * 1000))
                 else:
                     msg = "Session was terminated unexpectedly."
                 self._appendLog(msg, cur_datetime, Qt.GlobalColor.red)
@@ -838,16 +1031,29 @@ class NetconfSession(QWidget):
     def closeEvent(self, ev: QCloseEvent):
         self._proxy.close()
 
-    def connect(self, is_reconnect = False):
+    def connect(self, is_reconnect = False, retries = 0, quiet = False, share = None):
+        """连接失败后重试retries次；quiet为True时失败原因只记录在日志中，不弹出对话框，
+        用于同时连接多个会话，见MainWindow.connectSessions。
+        share为已连接的另一个NetconfSession时在它的SSH连接上打开新的NETCONF通道，见MainWindow.onCloneSession"""
         if not self._proxy.is_connected:
             msg = "Reconnecting" if is_reconnect else "Connecting"
             self._appendLog(f"{msg} to {self.connectInfoStr}...")
         self.reconnectTimer.stop()
         self._userDisconnet = False
-        self._proxy.connect()
+        self._quietConnect = quiet
+        self._proxy.connect(retries, share._proxy.manager if share is not None and share.connected else None)
 
     def _reconnect(self):
-        self.connect(is_reconnect = True)
+        self.connect(is_reconnect = True, retries = connect_limiter.retries, quiet = True)
+
+    def _onConnectProgress(self, msg):
+        self._appendLog(msg, fcolor=Qt.GlobalColor.darkMagenta)
+
+    def _onConnectFailed(self, msg):
+        if self._quietConnect:
+            self._appendLog(msg, fcolor=Qt.red)
+        else:
+            self._msgBox(msg)
 
     def disconnect(self):
         self._appendLog(f"Disconnecting {self.connectInfoStr}...")
@@ -994,28 +1200,46 @@ class NetconfSession(QWidget):
 
         if not self._schemas or not len(self._schemas):
             self._widgetCgroupCtrl(False)
-            self._schemas = self._loadSchema()
-            self._widgetCgroupCtrl(True)
-            if not self._schemas or len(self._schemas) == 0:
-                return
+            self._loadSchema(self._onSchemaLoaded)
+            return
+        self._showSchema()
+
+    def _onSchemaLoaded(self, schemas: list):
+        self._widgetCgroupCtrl(self.connected)
+        self._schemas = schemas
+        if self._schemas and len(self._schemas):
+            self._showSchema()
 
+    def _showSchema(self):
         if not self._schemashow:
             self._schemashow = SchemaWidgets(self._schemas)
             self._schemashow.setWindowTitle("Schema - %s" % self.sessionName)
         self._schemashow.show()
         self._schemashow.activateWindow()
 
-    def _getSchemaData(self, schema: dict):
+    def _tookTime(self, rpc: RPC, send_time: QDateTime, cur_time: QDateTime):
+        "RPC的真实耗时(ms)，取不到时间戳时用界面记录的时间估算"
+        timediff = self._proxy._manager.get_tooktime(rpc) if self._proxy._manager else 0
+        return timediff if timediff else send_time.msecsTo(cur_time)
+
+    def _getSchemaData(self, schema: dict, done):
+        "获取schema的内容，结束后调用done(data, error)"
         send_time = QDateTime.currentDateTime()
         rpc, req = self._proxy.get_schema(schema.get('identifier'), schema.get('version'))
         self._sessionHistory.appendHistory(send_time, SessionOperType.Out, req)
-        rpc_reply = self._proxy.wait_asnync_reply(rpc)
-        cur_time = QDateTime.currentDateTime()
-        timediff = send_time.msecsTo(cur_time)
-        self._sessionHistory.appendHistory(cur_time, SessionOperType.In, rpc_reply.xml, extra=f'(took {timediff} ms)')
-        return rpc_reply.data
 
-    def _loadSchema(self):
+        def onReply(rpc_reply, error):
+            if error is not None:
+                return done(None, error)
+            cur_time = QDateTime.currentDateTime()
+            timediff = self._tookTime(rpc, send_time, cur_time)
+            self._sessionHistory.appendHistory(cur_time, SessionOperType.In, rpc_reply.xml, extra=f'(took {timediff} ms)')
+            done(rpc_reply.data, None)
+
+        self._proxy.waitReply(rpc, onReply)
+
+    def _loadSchema(self, done):
+        "逐个获取设备的schema，结束后调用done(schema_list)，失败或取消时schema_list为空"
         self._appendLog("Start loading schema.")
         process_dlg = QProgressDialog(self, Qt.WindowCloseButtonHint)
         process_dlg.setWindowIcon(QIcon(':/res/yinyang.png'))
@@ -1025,27 +1249,27 @@ class NetconfSession(QWidget):
         process_dlg.setModal(True)
         process_dlg.open(self._onBtAbort)
         # process_dlg.open()
-        filter=('subtree', '<netconf-state xmlns="urn:ietf:params:xml:ns:yang:ietf-netconf-monitoring"><schemas/></netconf-state>')
-        try:
-            send_time = QDateTime.currentDateTime()
-            rpc, req = self._proxy.get(filter)
-            self._sessionHistory.appendHistory(send_time, SessionOperType.Out, req)
-            schema_rpy = self._proxy.wait_asnync_reply(rpc)
+        schema_list = []
+
+        def finish(schemas):
+            process_dlg.close()
+            done(schemas)
+
+        def fail(e):
+            self._appendLog(f'{str(e)}.', fcolor=Qt.GlobalColor.red)
+            log.info(str(e))
+            finish([])
+
+        def onSchemaList(schema_rpy, error):
+            if error is not None:
+                return fail(error)
             cur_time = QDateTime.currentDateTime()
-            timediff = '{:,}'.format(send_time.msecsTo(cur_time))
+            timediff = '{:,}'.format(self._tookTime(rpc, send_time, cur_time))
             self._sessionHistory.appendHistory(cur_time, SessionOperType.In, schema_rpy.xml, extra=f'(took {timediff} ms)')
-        except Exception as e:
-            self._appendLog(f'{str(e)}.', fcolor=Qt.red)
-            log.info(str(e))
-            process_dlg.close()
-            return []
-        else:
             netconf_sate = schema_rpy.data
             if netconf_sate == None :
                 self._appendLog(f"Get schema list error: {schema_rpy.xml}.")
-                process_dlg.close()
-                return []
-            schema_list = []
+                return finish([])
             for elm in netconf_sate.iter():
                 schemas = elm.findall(qualify('schema', NETCONF_MONITORING_NS))
                 for scm in schemas:
@@ -1060,30 +1284,45 @@ class NetconfSession(QWidget):
             schema_count = len(schema_list)
             self._appendLog(f"Get schema count: {schema_count}.")
             if schema_count == 0:
-                process_dlg.close()
-                return []
-
+                return finish([])
             process_dlg.setRange(0, schema_count)
-            for index, schema in enumerate(schema_list):
-                process_dlg.setValue(index)
-                process_dlg.setLabelText("Load %s@%s.%s" % (schema.get('identifier', '?'),
-                                        schema.get('version', '?'), schema.get('format', '?')))
-                process_dlg.setWindowTitle("Schema loading... [%d/%d]" % (index, schema_count))
-                try:
-                    schema['data'] = self._getSchemaData(schema)
-                except Exception as e:
-                    self._appendLog(f'{str(e)}.', fcolor=Qt.GlobalColor.red)
-                    log.info(str(e))
-                    process_dlg.close()
-                    return []
-                if process_dlg.wasCanceled() is True:
-                    self._appendLog('User canceled the operation.')
-                    process_dlg.close()
-                    return [];
-            process_dlg.setValue(schema_count)
-            self._appendLog("Schema loading done.")
-            process_dlg.close()
-            return schema_list
+            loadSchemaData(0)
+
+        def loadSchemaData(index):
+            # 上一个schema收到应答后再请求下一个
+            schema_count = len(schema_list)
+            if process_dlg.wasCanceled() is True:
+                self._appendLog('User canceled the operation.')
+                return finish([])
+            if index == schema_count:
+                process_dlg.setValue(schema_count)
+                self._appendLog("Schema loading done.")
+                return finish(schema_list)
+            schema = schema_list[index]
+            process_dlg.setValue(index)
+            process_dlg.setLabelText("Load %s@%s.%s" % (schema.get('identifier', '?'),
+                                    schema.get('version', '?'), schema.get('format', '?')))
+            process_dlg.setWindowTitle("Schema loading... [%d/%d]" % (index, schema_count))
+
+            def onSchemaData(data, error):
+                if error is not None:
+                    return fail(error)
+                schema['data'] = data
+                loadSchemaData(index + 1)
+
+            try:
+                self._getSchemaData(schema, onSchemaData)
+            except Exception as e:
+                fail(e)
+
+        filter=('subtree', '<netconf-state xmlns="urn:ietf:params:xml:ns:yang:ietf-netconf-monitoring"><schemas/></netconf-state>')
+        try:
+            send_time = QDateTime.currentDateTime()
+            rpc, req = self._proxy.get(filter)
+            self._sessionHistory.appendHistory(send_time, SessionOperType.Out, req)
+        except Exception as e:
+            return fail(e)
+        self._proxy.waitReply(rpc, onSchemaList)
 
     @property
     def connected(self):
@@ -1199,6 +1438,14 @@ class NotificationModel(QAbstractItemModel):
         self._notifications.append(ntf)
         self.endInsertRows()
 
+    def appendRows(self, rows: list):
+        "rows中的每一项与appendRow的参数相同，一次插入"
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), self.rowCount(), self.rowCount() + len(rows) - 1)
+        self._notifications.extend(rows)
+        self.endInsertRows()
+
     def clear(self):
         self.beginResetModel()
         self._notifications.clear()
@@ -1273,6 +1520,10 @@ class NotificationWidget(QWidget):
         hlayout.addWidget(bt_filter)
         hlayout.addWidget(filter_edit)
 
+        queue_stats = QLabel(self)
+        queue_stats.setToolTip("Notifications queued / capacity, the most ever queued, and dropped since connecting")
+        hlayout.addWidget(queue_stats)
+
         left_frame = QFrame(self)
         llayout = QVBoxLayout(left_frame)
         llayout.setContentsMargins(0, 0, 0, 0)
@@ -1305,11 +1556,25 @@ class NotificationWidget(QWidget):
         self._preview = preview
         self._bt_filter = bt_filter
         self._filter_edit = filter_edit
+        self._queueStats = queue_stats
         self._proxy_model = proxy_model
         self.datamodel = datamodel
         self.ntflist = ntflist
         self._actCopy = act_copy
 
+    def setQueueStats(self, stats: dict):
+        "显示通告队列的统计数据，stats为None时清空"
+        if not stats:
+            self._queueStats.clear()
+            return
+        capacity = stats['capacity'] if stats['capacity'] is not None else '-'
+        text = f"Queued: {stats['size']}/{capacity}  Peak: {stats['high_water']}  Dropped: {stats['dropped']}"
+        self._queueStats.setText(text)
+        if stats['dropped']:
+            self._queueStats.setStyleSheet("color: darkred")
+        else:
+            self._queueStats.setStyleSheet("")
+
     def _onCustomMenuRequest(self, pos: QPoint):
         menu = QMenu(self)
         act_delete = QAction("Remove", menu)
@@ -1399,24 +1664,20 @@ class NotificationWidget(QWidget):
     #         self.setFlowUpMode(True)
 
     def appendNotification(self, receiveTime: QDateTime, ntf: NotificationM):
-        eventTime =QDateTime.fromString(ntf.event_time, Qt.ISODate)
-        event_time = eventTime.toString("yyyy-MM-dd hh:mm:ss")
-
-        # ntf = to_ele(xml)
-        # for elm in etree.ElementChildIterator(ntf):
-        #     localname = etree.QName(elm).localname
-        #     if localname == 'eventTime':
-        #         eventTime =QDateTime.fromString(elm.text, Qt.ISODate)
-        #         event_time = eventTime.toString("yyyy-MM-dd hh:mm:ss")
-        #     else:
-        #         ntfname = localname
-        # if not ntfname :
-        #     return log.error("No nitification name find")
-        recevied_time = receiveTime.toString("yyyy-MM-dd hh:mm:ss.zzz")
-        self.datamodel.appendRow(event_time, recevied_time, ntf.notifcaiton_name, ntf.notification_xml)
+        self.appendNotifications([(receiveTime, ntf)])
+
+    def appendNotifications(self, ntfs: list):
+        "一次插入多条通告，ntfs为(接收时间, NotificationM)的列表"
+        rows = []
+        for receiveTime, ntf in ntfs:
+            eventTime =QDateTime.fromString(ntf.event_time, Qt.ISODate)
+            event_time = eventTime.toString("yyyy-MM-dd hh:mm:ss")
+            recevied_time = receiveTime.toString("yyyy-MM-dd hh:mm:ss.zzz")
+            rows.append([event_time, recevied_time, ntf.notifcaiton_name, ntf.notification_xml])
+        self.datamodel.appendRows(rows)
 
         rowcount = self._proxy_model.rowCount();
-        if self._flowUpMode or rowcount == 1:
+        if self._flowUpMode or rowcount == len(rows):
             row = rowcount - 1
             urow = 0 if row < 0 else row
             colum = self.ntflist.currentIndex().column()
@@ -1425,7 +1686,7 @@ class NotificationWidget(QWidget):
             self.ntflist.setCurrentIndex(self._proxy_model.index(urow, ucolum))
 
         # 第一次收到数据，做一次宽度调整
-        if rowcount <= 1:
+        if rowcount <= len(rows):
             self.ntflist.resizeColumnToContents(0)
             self.ntflist.resizeColumnToContents(1)
 
@@ -1465,6 +1726,121 @@ class NotificationWidget(QWidget):
 
         return super().showEvent(a0)
 
+class StatisticsModel(QAbstractItemModel):
+    "按操作名统计的RPC数据，时延以ms为单位"
+    def __init__(self, parent: QObject = None ) -> None:
+        super().__init__(parent)
+        self._rows = []
+        self.horizontalHeader = ['operation', 'count', 'p50(ms)', 'p90(ms)', 'p99(ms)', 'max(ms)',
+                                 'rpc-errors', 'failures', 'timeouts']
+        self._keys = [None, 'count', 'p50', 'p90', 'p99', 'max', 'errors', 'failures', 'timeouts']
+
+    def rowCount(self, parent: QModelIndex = ...) -> int:
+        return len(self._rows)
+
+    def columnCount(self, parent: QModelIndex = ...) -> int:
+        return len(self.horizontalHeader)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = ...):
+        if role == Qt.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.horizontalHeader[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index: QModelIndex, role: int = ...):
+        if not index.isValid():
+            return QVariant()
+        value = self._rows[index.row()][index.column()]
+        if role == Qt.DisplayRole or role == Qt.ToolTipRole:
+            if value is None:
+                return '-'
+            if isinstance(value, float):
+                return '%.1f' % value
+            return str(value)
+        if role == Qt.UserRole:
+            # 排序使用原始数值
+            return value if value is not None else -1
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return QVariant()
+
+    def index(self, row: int, column: int, parent: QModelIndex = ...) -> QModelIndex:
+        if (row < 0 or row >= len(self._rows)) or (column < 0 or column >= len(self.horizontalHeader)):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, child: QModelIndex) -> QModelIndex:
+        return QModelIndex()
+
+    def clear(self, rpcs: dict = None):
+        "rpcs为Manager.metrics()中的'rpcs'"
+        self.beginResetModel()
+        self._rows.clear()
+        for name, stats in sorted((rpcs or {}).items()):
+            row = [name]
+            for key in self._keys[1:]:
+                value = stats[key]
+                if key in ('p50', 'p90', 'p99', 'max') and value is not None:
+                    value = value * 1000
+                row.append(value)
+            self._rows.append(row)
+        self.endResetModel()
+
+class StatisticsWidget(QWidget):
+    "会话统计数据：各操作的RPC时延分布与结果，收发字节数和消息数，解析耗时及队列深度"
+    def __init__(self, parent=None, flags=Qt.Widget) -> None:
+        super().__init__(parent, flags)
+        self._initUI()
+
+    def _initUI(self):
+        view = QTableView(self)
+        view.setStyleSheet("QTableView::item{padding-left:10px;padding-right:10px;}")
+        view.horizontalHeader().setDefaultAlignment(Qt.AlignmentFlag.AlignCenter)
+        view.setAlternatingRowColors(True)
+        view.horizontalHeader().setStretchLastSection(True)
+        view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        view.verticalHeader().setDefaultSectionSize(8)
+        view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+
+        datamodel = StatisticsModel(self)
+        proxy_model = QSortFilterProxyModel(self)
+        proxy_model.setSourceModel(datamodel)
+        proxy_model.setSortRole(Qt.UserRole)
+        view.setModel(proxy_model)
+        view.setSortingEnabled(True)
+        view.sortByColumn(0, Qt.SortOrder.AscendingOrder)
+
+        summary = QLabel(self)
+        summary.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        summary.setToolTip("Counted since connecting")
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addSpacing(5)
+        layout.addWidget(summary)
+        layout.addWidget(view, 1)
+
+        self._summary = summary
+        self.datamodel = datamodel
+        self.view = view
+
+    def setMetrics(self, metrics: dict):
+        "显示Manager.metrics()的数据，metrics为None时清空"
+        if not metrics:
+            self._summary.clear()
+            self.datamodel.clear()
+            return
+        parse_ms = metrics['parse_seconds'] * 1000
+        parses = metrics['parses']
+        self._summary.setText(
+            f"Sent: {metrics['bytes_out']} bytes, {metrics['messages_out']} messages  "
+            f"Received: {metrics['bytes_in']} bytes, {metrics['frames_in']} frames, {metrics['messages_in']} messages  "
+            f"Parsing: {parse_ms:.1f} ms ({parse_ms / parses if parses else 0:.2f} ms avg)  "
+            f"Send queue: {metrics['send_queue']} (peak {metrics['send_queue_max']})  "
+            f"Pending RPCs: {metrics['pending_rpcs']}  "
+            f"Notifications queued: {metrics['notifications']['size']}")
+        self.datamodel.clear(metrics['rpcs'])
+
 class SchemaWidgets(QWidget):
     def __init__(self, schemas={}, parent=None, flags=Qt.Window) -> None:
         super().__init__(parent, flags)
@@ -2177,9 +2553,10 @@ class LockUnlockDatastore(QDialog):
         # log.debug('button %s toggled, state: %s', button.text(), checked)
         xml = self._buildLockUnlockXml('lock' if checked else 'unlock', button.text())
         if self.session:
-            rsp = self.session.setCommandXML(xml, True)
-            if not rsp or not rsp.ok and checked:
-                button.setChecked(False if checked else True) # 恢复勾选状态
+            def done(rsp):
+                if not rsp or not rsp.ok and checked:
+                    button.setChecked(False if checked else True) # 恢复勾选状态
+            self.session.setCommandXML(xml, True, done)
 
 class SessionInfoModel(QAbstractItemModel):
     def __init__(self, parent: QObject = None ) -> None:
@@ -2335,14 +2712,11 @@ class SessionManager(QDialog):
         layout.addWidget(view, 1)
         layout.addLayout(bottom_layout)
 
-        session_list = self.getSessionInfo()
-        datamodel.clear(session_list)
-        view.resizeColumnsToContents()
-
         if self.session:
             datamodel.setCurrentSessionId(int(self.session.sesson_id))
         self.view = view
         self.datamodel = datamodel
+        self._onRefreshInfo()
 
     def _onCustomMenuRequest(self, pos: QPoint):
         menu = QMenu(self)
@@ -2359,8 +2733,11 @@ class SessionManager(QDialog):
         menu.exec(QCursor.pos())
 
     def _onRefreshInfo(self):
-        sessions = self.getSessionInfo()
+        self.getSessionInfo(self._updateSessionInfo)
+
+    def _updateSessionInfo(self, sessions: list):
         self.datamodel.clear(sessions)
+        self.view.resizeColumnsToContents()
 
     def _onKillSession(self):
         cindex = self.view.currentIndex()
@@ -2373,42 +2750,52 @@ class SessionManager(QDialog):
             return
         node = etree.Element("kill-session")
         etree.SubElement(node, "session-id").text = str(session_id)
-        rply = self.session.setCommandXML(to_xml(node), True)
-        if rply.error:
-            QMessageBox.warning(self, "Warning", "%s"%rply.error.message)
-
-        self._onRefreshInfo()
-
-    def getSessionInfo(self):
-        "获取会话信息"
+        def done(rply):
+            if rply and rply.error:
+                QMessageBox.warning(self, "Warning", "%s"%rply.error.message)
+            self._onRefreshInfo()
+        self.session.setCommandXML(to_xml(node), True, done)
+
+    def getSessionInfo(self, done):
+        "获取会话信息，结束后调用done(session_list)，失败时session_list为空"
+        if not self.session:
+            return done([])
         filter=('subtree', '<netconf-state xmlns="urn:ietf:params:xml:ns:yang:ietf-netconf-monitoring"><sessions/></netconf-state>')
         try:
             send_time = QDateTime.currentDateTime()
             rpc, req = self.session._proxy.get(filter)
             self.session._sessionHistory.appendHistory(send_time, SessionOperType.Out, req)
-            session_rpy = self.session._proxy.wait_asnync_reply(rpc)
-            cur_time = QDateTime.currentDateTime()
-            timediff = '{:,}'.format(send_time.msecsTo(cur_time))
-            self.session._sessionHistory.appendHistory(cur_time, SessionOperType.In, session_rpy.xml, extra=f'(took {timediff} ms)')
         except Exception as ex:
             log.error("GetSession err: %s"%str(ex))
+            return done([])
+
+        def onReply(session_rpy, error):
+            if error is not None:
+                log.error("GetSession err: %s"%str(error))
+                return done([])
+            cur_time = QDateTime.currentDateTime()
+            timediff = '{:,}'.format(self.session._tookTime(rpc, send_time, cur_time))
+            self.session._sessionHistory.appendHistory(cur_time, SessionOperType.In, session_rpy.xml, extra=f'(took {timediff} ms)')
+            done(self._parseSessionInfo(session_rpy))
+
+        self.session._proxy.waitReply(rpc, onReply)
+
+    def _parseSessionInfo(self, session_rpy):
+        data = session_rpy.data
+        if data == None :
+            log.error("get sesson list error: %s", session_rpy.xml)
             return []
-        else:
-            data = session_rpy.data
-            if data == None :
-                log.error("get sesson list error: %s", session_rpy.xml)
-                return []
-            session_list=[]
-            for netconf_state in etree.ElementChildIterator(data):
-                for sessions in etree.ElementChildIterator(netconf_state):
-                    for session in etree.ElementChildIterator(sessions):
-                        info = {}
-                        for leaf in etree.ElementChildIterator(session):
-                            tag = etree.QName(leaf).localname
-                            info[tag] = leaf.text
-                        session_list.append(info)
-            log.debug("sesion_list:%s", session_list)
-            return session_list
+        session_list=[]
+        for netconf_state in etree.ElementChildIterator(data):
+            for sessions in etree.ElementChildIterator(netconf_state):
+                for session in etree.ElementChildIterator(sessions):
+                    info = {}
+                    for leaf in etree.ElementChildIterator(session):
+                        tag = etree.QName(leaf).localname
+                        info[tag] = leaf.text
+                    session_list.append(info)
+        log.debug("sesion_list:%s", session_list)
+        return session_list
 
     def killSession(self, session_id: int):
         "kill 会话"
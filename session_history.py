@@ -101,6 +101,14 @@ class SessionHistoryModel(QAbstractItemModel):
         self._historys.append(ntf)
         self.endInsertRows()
 
+    def appendRows(self, rows: list):
+        "rows中的每一项与appendRow的参数相同，一次插入"
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), self.rowCount(), self.rowCount() + len(rows) - 1)
+        self._historys.extend(rows)
+        self.endInsertRows()
+
     def clear(self):
         self.beginResetModel()
         self._historys.clear()
@@ -289,33 +297,47 @@ class SessionHistoryWidget(QWidget):
         self._flowUpMode = mode
 
     def appendHistory(self, time:QDateTime, Direction: str, xml: str, Brief = None, extra = None):
-        if self.datamodel.rowCount() > 9999:
-            log.info(f"The session history is reached 10000, no new records were added")
+        self.appendHistories([(time, Direction, xml, Brief, extra)])
+
+    def appendHistories(self, records: list):
+        "一次插入多条记录，records中的每一项为appendHistory的参数(time, Direction, xml, Brief, extra)"
+        room = 10000 - self.datamodel.rowCount()
+        if len(records) > room:
+            log.info(f"The session history is reached 10000, {len(records) - max(room, 0)} new records were not added")
+            records = records[:max(room, 0)]
+        if not records:
             return
 
-        recevied_time = time.toString("yyyy-MM-dd hh:mm:ss.zzz")
-        if Brief is None:
-            ntf = to_ele(xml)
-            msg_id = ntf.get("message-id")
-            msg_id = f'[{msg_id}] ' if msg_id is not None else ""
-            pname = msg_id + '<' + etree.QName(ntf).localname + '>'
-            for child in ntf:
-                pname = f'{pname}<{etree.QName(child).localname}>'
-            brief = pname
-        else:
-            brief = Brief
+        rows = []
+        for time, Direction, xml, Brief, extra in records:
+            recevied_time = time.toString("yyyy-MM-dd hh:mm:ss.zzz")
+            if Brief is None:
+                # 会话收到的报文是ParsedMessage，复用其解析结果
+                ntf = xml.root if isinstance(xml, ParsedMessage) else to_ele(xml)
+                msg_id = ntf.get("message-id")
+                msg_id = f'[{msg_id}] ' if msg_id is not None else ""
+                pname = msg_id + '<' + etree.QName(ntf).localname + '>'
+                for child in ntf:
+                    pname = f'{pname}<{etree.QName(child).localname}>'
+                brief = pname
+            else:
+                brief = Brief
 
-        if extra:
-            brief = f"{brief} {extra}"
+            if extra:
+                brief = f"{brief} {extra}"
 
-        xml_size = int(len(xml)/1024)
-        if xml_size > 50:
-            size_str = '{:,}'.format(xml_size)
-            xml = f'The size of this reply is {size_str} KB, No specific content is saved.'
-        self.datamodel.appendRow(recevied_time, Direction, brief, xml)
+            xml_size = int(len(xml)/1024)
+            if xml_size > 50:
+                size_str = '{:,}'.format(xml_size)
+                xml = f'The size of this reply is {size_str} KB, No specific content is saved.'
+            else:
+                # 只保存文本，不让历史记录持有解析后的元素树
+                xml = str(xml)
+            rows.append([recevied_time, Direction, brief, xml])
+        self.datamodel.appendRows(rows)
 
         rowcount = self._proxy_model.rowCount();
-        if self._flowUpMode or rowcount == 1:
+        if self._flowUpMode or rowcount == len(rows):
             row = rowcount - 1
             urow = 0 if row < 0 else row
             colum = self.sessionHistoryList.currentIndex().column()
@@ -324,7 +346,7 @@ class SessionHistoryWidget(QWidget):
             self.sessionHistoryList.setCurrentIndex(self._proxy_model.index(urow, ucolum))
 
         # 第一次收到数据，做一次宽度调整
-        if rowcount <= 1:
+        if rowcount <= len(rows):
             self.sessionHistoryList.resizeColumnToContents(0)
             # self.sessionHistoryList.resizeColumnToContents(1)
 
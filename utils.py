@@ -12,8 +12,11 @@ def pretty_xml(xml, pretty_print=True):
     """Reformats a given string containing an XML document (for human readable output)"""
     pretty = ""
     try:
+        # 会话收到的报文(ParsedMessage)已编码过，直接复用；
+        # 其元素树与RPCReply共享且保留了空白，不能就地修改，故仍需重新解析
+        data = xml.data if isinstance(xml, ParsedMessage) else xml.encode('utf-8')
         parser = etree.XMLParser(encoding='utf-8', remove_blank_text=True)
-        tree = etree.fromstring(xml.encode('utf-8'), parser)
+        tree = etree.fromstring(data, parser)
         # 清理只包含空格和换行内容的xml节点，RF4741规定节点必须包含非空白字符
         for elem in tree.iter():
             if elem.text and all(char.isspace() for char in elem.text) is True: